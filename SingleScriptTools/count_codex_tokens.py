@@ -4,11 +4,14 @@ Script to count codex token usage & display per year/month for current user.
 I don't use codex nor use llm for code generation,
 but this is something I wanted to calculate for fun in workplace.
 
+Per-day sums & read offset of each session file are cached in `count_codex_tokens.sqlite` next to this script,
+so only bytes appended since last run get parsed. Delete it to recount from scratch.
+
 example output:
 ```
-Reading sessions/rollout-yyyy-mm-ddThh-mm-ss-some-hashes.jsonl
-...
-Reading archived_sessions/rollout-yyyy-mm-ddThh-mm-ss-some-hashes.jsonl
+Reading sessions/yyyy/mm/dd/rollout-yyyy-mm-ddThh-mm-ss-some-hashes.jsonl
+Reading sessions/yyyy/mm/dd/rollout-yyyy-mm-ddThh-mm-ss-some-hashes.jsonl from byte 1,204,380
+Parsed 2 files, skipped 311 unchanged in 0.08s
 
 Yearly Sum:
 2026-02: 10,705,490 tokens (32,256 reasoning)
@@ -27,6 +30,8 @@ Today total   : 14,764,858 tokens (12,671 reasoning)
 import pathlib
 import itertools
 import json
+import time
+import sqlite3
 import datetime as dt
 from collections.abc import Iterator
 from collections import defaultdict
@@ -39,6 +44,11 @@ ROOT = pathlib.Path.home() / ".codex"
 SESSIONS_PATH = ROOT / "sessions"
 ARCHIVED_SESSIONS_PATH = ROOT / "archived_sessions"
 
+CACHE_PATH = pathlib.Path(__file__).parent / "count_codex_tokens.sqlite"
+
+# Only lines containing this can be token count event, checked before decoding json
+TOKEN_COUNT_MARKER = b'"token_count"'
+
 
 # --- Util ---
 
@@ -56,74 +66,198 @@ class _TokenInfo(TypedDict):
     model_context_window: int
 
 
+# noinspection SqlNoDataSourceInspection,SqlResolve
+class _Query:
+    """Namespace for queries, so it's easier to edit"""
+
+    create_files = """
+    CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,
+        offset INTEGER, last_total INTEGER, last_reason_total INTEGER
+    )
+    """
+
+    create_days = """
+    CREATE TABLE IF NOT EXISTS days (
+        path TEXT, day TEXT, tokens INTEGER, reasoning INTEGER, PRIMARY KEY(path, day)
+    ) WITHOUT ROWID
+    """
+
+    fetch_files = "SELECT path, size, mtime_ns, offset, last_total, last_reason_total FROM files"
+
+    upsert_file = "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)"
+
+    delete_file = "DELETE FROM files WHERE path=?"
+
+    delete_days = "DELETE FROM days WHERE path=?"
+
+    rename_file = "UPDATE files SET path=? WHERE path=?"
+
+    rename_days = "UPDATE days SET path=? WHERE path=?"
+
+    add_day = """
+    INSERT INTO days VALUES (?, ?, ?, ?)
+    ON CONFLICT(path, day) DO UPDATE SET tokens=tokens+excluded.tokens, reasoning=reasoning+excluded.reasoning
+    """
+
+    per_day = "SELECT day, SUM(tokens), SUM(reasoning) FROM days GROUP BY day"
+
+
 # --- Logic ---
 
-def token_delta_gen(
-    session_file: pathlib.Path
-) -> Iterator[tuple[dt.datetime, int, int]]:
-    """Generates (time, token count, reasoning token count) pairs
-    for given session file
+def parse_session(
+    session_file: pathlib.Path, offset: int = 0, last_total: int = 0, last_reason_total: int = 0
+) -> tuple[int, int, int, dict[dt.date, list[int]]]:
+    """Sums token deltas per day for given session file, starting from byte offset.
+    Totals of the last event before offset are needed to keep calculating deltas.
+
+    Returns:
+        (offset after last parsed line, last total, last reasoning total,
+        {date: [token count, reasoning token count]}) tuple
     """
-    
+
     # due to unreliable `last_token_usage` we need to calc delta
     # and due to `total_tokens` not including reasoning tokens,
     # that need to be supplied separately
 
-    last_total = 0
-    last_reason_total = 0
-    
-    with session_file.open("rt", encoding="utf8") as fp:
-        while line := fp.readline():
-            data = json.loads(line)
-            
-            if (
-                "type" not in data
-                or data["type"] != "event_msg"
-                or data["payload"]["type"] != "token_count"
-                or not data["payload"]["info"]
-            ):
-                continue
-
-            info: _TokenInfo = data["payload"]["info"]
-            
-            total = info["total_token_usage"]["total_tokens"]
-            reason_total = info["total_token_usage"]["reasoning_output_tokens"]
-            
-            yield (
-                dt.datetime.fromisoformat(data["timestamp"]),
-                total - last_total,
-                reason_total - last_reason_total,
-            )
-            
-            last_total = total
-            last_reason_total = reason_total
+    per_day: dict[dt.date, list[int]] = defaultdict(lambda: [0, 0])
 
+    with session_file.open("rb") as fp:
+        fp.seek(offset)
 
-def total_token_delta_gen() -> Iterator[tuple[dt.datetime, int, int]]:
-    """Yields (datetime, token count, reasoning token count) pairs
-    for all current user's session files in home directory.
-    
-    Basically just wrapper for maximum lazy iteration
+        for line in fp:
+            # codex might be still writing the last line, leave it for next run
+            if not line.endswith(b"\n"):
+                try:
+                    json.loads(line)
+                except ValueError:
+                    break
+
+            if TOKEN_COUNT_MARKER in line:
+                data = json.loads(line)
+
+                if (
+                    data.get("type") == "event_msg"
+                    and data["payload"]["type"] == "token_count"
+                    and data["payload"]["info"]
+                ):
+                    info: _TokenInfo = data["payload"]["info"]
+
+                    total = info["total_token_usage"]["total_tokens"]
+                    reason_total = info["total_token_usage"]["reasoning_output_tokens"]
+
+                    day = per_day[dt.datetime.fromisoformat(data["timestamp"]).date()]
+                    day[0] += total - last_total
+                    day[1] += reason_total - last_reason_total
+
+                    last_total = total
+                    last_reason_total = reason_total
+
+            offset += len(line)
+
+    return offset, last_total, last_reason_total, per_day
+
+
+def update_cache(conn: sqlite3.Connection) -> tuple[int, int]:
+    """Parses only appended bytes of new or changed session files into cache.
+    Unchanged files (size & mtime), which archived sessions always are, aren't even opened.
+
+    Returns:
+        (parsed file count, skipped file count) tuple
     """
 
+    known = {row[0]: row[1:] for row in conn.execute(_Query.fetch_files)}
+    current: dict[str, tuple[pathlib.Path, int, int]] = {}
+
     sessions_iter: Iterator[pathlib.Path] = itertools.chain(
         SESSIONS_PATH.glob("**/*.jsonl"),
         ARCHIVED_SESSIONS_PATH.glob("**/*.jsonl")
     )
     for session in sessions_iter:
-        print("Reading", session.relative_to(ROOT))
-        yield from token_delta_gen(session)
+        stat = session.stat()
+        current[str(session)] = session, stat.st_size, stat.st_mtime_ns
+
+    # archiving moves session file, keep its record instead of parsing it again
+    vanished = {
+        (pathlib.Path(path).name, record[0], record[1]): path
+        for path, record in known.items() if path not in current
+    }
+
+    for path, (session, size, mtime_ns) in current.items():
+        if path in known:
+            continue
+
+        old_path = vanished.pop((session.name, size, mtime_ns), None)
+
+        if old_path is not None:
+            conn.execute(_Query.rename_file, (path, old_path))
+            conn.execute(_Query.rename_days, (path, old_path))
+            known[path] = known.pop(old_path)
+
+    # whatever's left is deleted, forget their tokens too like before
+    for path in vanished.values():
+        conn.execute(_Query.delete_file, (path,))
+        conn.execute(_Query.delete_days, (path,))
+
+    parsed = 0
+
+    for path, (session, size, mtime_ns) in current.items():
+        record = known.get(path)
+
+        if record is not None and record[:2] == (size, mtime_ns):
+            continue
+
+        offset, last_total, last_reason_total = 0, 0, 0
+
+        if record is not None:
+            if size >= record[2]:
+                offset, last_total, last_reason_total = record[2:]
+            else:
+                # shrunk, can't be an append - start over
+                conn.execute(_Query.delete_days, (path,))
+
+        print("Reading", session.relative_to(ROOT), *([f"from byte {offset:,}"] if offset else []))
+        parsed += 1
+
+        offset, last_total, last_reason_total, per_day = parse_session(
+            session, offset, last_total, last_reason_total
+        )
+
+        conn.executemany(
+            _Query.add_day,
+            ((path, day.isoformat(), count, reason_count) for day, (count, reason_count) in per_day.items())
+        )
+        conn.execute(_Query.upsert_file, (path, size, mtime_ns, offset, last_total, last_reason_total))
+
+    conn.commit()
+    return parsed, len(current) - parsed
 
 
 def main():
     # {year: (monthly_token, monthly_reasoning_token)}
     per_years: dict[int, tuple[dict[int, dict[int, int]], dict[int, dict[int, int]]]] = {}
     
+    started = time.perf_counter()
+    conn = sqlite3.connect(CACHE_PATH)
+
+    try:
+        conn.execute(_Query.create_files)
+        conn.execute(_Query.create_days)
+
+        parsed, skipped = update_cache(conn)
+        per_day = conn.execute(_Query.per_day).fetchall()
+
+    finally:
+        conn.close()
+
+    print(f"Parsed {parsed} files, skipped {skipped} unchanged in {time.perf_counter() - started:.2f}s")
+
     # accumulation pass
-    for dt_time, count, reason_count in total_token_delta_gen():
-        year = dt_time.year
-        month = dt_time.month
-        day = dt_time.day
+    for date_str, count, reason_count in per_day:
+        date = dt.date.fromisoformat(date_str)
+        year = date.year
+        month = date.month
+        day = date.day
         
         # sanity check...
         # if count < 0 or reason_count < 0:
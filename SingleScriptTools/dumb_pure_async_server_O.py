@@ -7,17 +7,29 @@ Rewrite of [stackoverflow answer](https://stackoverflow.com/a/70649803) I wrote.
 
 For slightly better structure, refer `dumb_pure_async_api_server_m.py`.
 
+Pass `-w N` to fork N worker processes sharing the port via SO_REUSEPORT (posix only).
+
 ![](readme_res/dumb_async_server.png)
 
 :Author: jupiterbjy@gmail.com
 """
 
+import os
+import sys
+import time
+import signal
+import socket
 import asyncio
 import pathlib
+import threading
+import multiprocessing
+import multiprocessing.connection
 from argparse import ArgumentParser
 from pprint import pprint
 from urllib.parse import quote
 from functools import partial
+from collections.abc import Callable
+from typing import Any
 
 # ROOT = pathlib.Path(__file__).parent
 
@@ -223,6 +235,136 @@ async def read_all(reader: asyncio.StreamReader, chunk_size: int = 1024) -> str:
     return output
 
 
+class _QueueWriter:
+    """stdout replacement for worker processes, forwarding complete lines to supervisor.
+    Keeps output from multiple workers from interleaving mid-line, and workers never block on terminal.
+    """
+
+    def __init__(self, queue: multiprocessing.Queue, prefix: str):
+        self.queue = queue
+        self.prefix = prefix
+        self._pending = ""
+
+    def write(self, text: str) -> int:
+        *lines, self._pending = (self._pending + text).split("\n")
+
+        if lines:
+            self.queue.put("".join(f"{self.prefix}{line}\n" for line in lines))
+
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+async def serve_until_terminated(server: asyncio.Server, grace_period: float):
+    """Serves until SIGTERM, then stops accepting and gives open connections grace period to finish.
+
+    Args:
+        server: Server from asyncio.start_server()
+        grace_period: Seconds to wait for open connections before giving up on them
+    """
+
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+
+    async with server:
+        await server.start_serving()
+        await stop.wait()
+
+        server.close()
+        try:
+            await asyncio.wait_for(server.wait_closed(), grace_period)
+        except TimeoutError:
+            pass
+
+
+def _worker_entry(idx: int, target: Callable[[], Any], log_queue: multiprocessing.Queue):
+    """Worker process entrypoint. Ctrl+C is left for supervisor, which stops workers via SIGTERM."""
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    sys.stdout = _QueueWriter(log_queue, f"[W{idx} {os.getpid()}] ")
+
+    target()
+
+
+def _drain_log(log_queue: multiprocessing.Queue):
+    """Prints lines sent by workers until None is received"""
+
+    while (lines := log_queue.get()) is not None:
+        sys.stdout.write(lines)
+        sys.stdout.flush()
+
+
+def run_workers(
+        target: Callable[[], Any], workers: int, grace_period: float = 10.0, respawn_delay: float = 1.0
+):
+    """Forks `workers` processes running `target`, each expected to bind its own SO_REUSEPORT socket.
+    Dead workers are respawned, Ctrl+C or SIGTERM stops all of them gracefully.
+    Workers' stdout is aggregated here so access log stays readable.
+
+    Args:
+        target: Callable that serves forever in worker, stopping on SIGTERM
+        workers: Number of worker processes
+        grace_period: Seconds to wait for workers to stop before killing them
+        respawn_delay: Seconds to wait before respawning dead worker, so crash loop doesn't spin
+    """
+
+    # closures can't be pickled, hence fork. Which is fine as SO_REUSEPORT is posix-only anyway.
+    ctx = multiprocessing.get_context("fork")
+    log_queue = ctx.Queue()
+
+    drain_thread = threading.Thread(target=_drain_log, args=(log_queue,), daemon=True)
+    drain_thread.start()
+
+    def spawn(idx: int) -> multiprocessing.Process:
+        proc = ctx.Process(target=_worker_entry, args=(idx, target, log_queue), daemon=True)
+        proc.start()
+        return proc
+
+    # make SIGTERM behave like Ctrl+C so both go through same cleanup
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    procs = {idx: spawn(idx) for idx in range(workers)}
+    print(f"Started {workers} workers: {', '.join(str(p.pid) for p in procs.values())}")
+
+    try:
+        while True:
+            sentinels = {proc.sentinel: idx for idx, proc in procs.items()}
+
+            for sentinel in multiprocessing.connection.wait(list(sentinels)):
+                idx = sentinels[sentinel]
+                procs[idx].join()
+                print(f"Worker {idx} (pid {procs[idx].pid}) died with code {procs[idx].exitcode}, respawning")
+
+                time.sleep(respawn_delay)
+                procs[idx] = spawn(idx)
+
+    except KeyboardInterrupt:
+        print("Stopping workers")
+
+    finally:
+        # don't let impatient 2nd Ctrl+C skip cleanup & leave orphans behind
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+        for proc in procs.values():
+            proc.terminate()
+
+        deadline = time.monotonic() + grace_period
+        for proc in procs.values():
+            proc.join(max(0.0, deadline - time.monotonic()))
+
+            if proc.is_alive():
+                proc.kill()
+
+        log_queue.put(None)
+        drain_thread.join()
+
+    print("Workers stopped")
+
+
 # --- Logics ---
 
 
@@ -400,6 +542,7 @@ async def serve_files(
     address: str = "localhost",
     port: int = 8000,
     verbose: bool = False,
+    reuse_port: bool = False,
 ):
     """Start serving files from given root directory.
 
@@ -408,6 +551,7 @@ async def serve_files(
         address: yup
         port: yup
         verbose: Switches to verbose handler
+        reuse_port: Binds with SO_REUSEPORT & stops gracefully on SIGTERM. Used by worker processes.
     """
 
     # make sure root is absolute
@@ -421,7 +565,14 @@ async def serve_files(
     )
 
     handler = tcp_handler_verbose if verbose else tcp_handler
-    server = await asyncio.start_server(partial(handler, root=root), address, port)
+    server = await asyncio.start_server(
+        partial(handler, root=root), address, port, reuse_port=reuse_port or None
+    )
+
+    if reuse_port:
+        await serve_until_terminated(server, 10.0)
+        print("Server Stopped")
+        return
 
     async with server:
         try:
@@ -460,4 +611,22 @@ if __name__ == "__main__":
 
     _parser.add_argument("-p", "--port", type=int, default=8000, help="Port to bind to")
 
-    asyncio.run(serve_files(**_parser.parse_args().__dict__))
+    _parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes sharing the port via SO_REUSEPORT",
+    )
+
+    _args = _parser.parse_args().__dict__
+    _workers = _args.pop("workers")
+
+    if _workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        print("SO_REUSEPORT isn't supported on this platform, running single worker")
+        _workers = 1
+
+    if _workers == 1:
+        asyncio.run(serve_files(**_args))
+    else:
+        run_workers(lambda: asyncio.run(serve_files(**_args, reuse_port=True)), _workers)
@@ -0,0 +1,485 @@
+"""
+Asyncio load generator for comparing dumb servers against each other, purely made of included batteries.
+
+Drives N concurrent connections over weighted request mix for fixed duration,
+then prints throughput & p50/p95/p99 latency as JSON - both total and per path.
+
+Either point it to running server(s), or let it spawn the server scripts one by one:
+
+```text
+python dumb_server_benchmark.py http://127.0.0.1:8080 -c 64 -d 10
+python dumb_server_benchmark.py --spawn dumb_pure_async_server_O.py dumb_trio_server_O.py -o result.json
+```
+
+Pass `-r` to instead check `DumbAPIServer` dispatch cost against route table size -
+it's served with 10, 1k & 5k synthetic `/bench/r{n}/item/{id:int}` routes in turn (or given counts),
+requesting routes spread across the table. Request rate should stay flat:
+
+```text
+python dumb_server_benchmark.py -r
+python dumb_server_benchmark.py -r 100 10000 -c 64 -d 5
+```
+
+Default mix assumes server is serving this script's directory, like the test servers of `_m` modules do:
+small text file, directory listing, large image & `/delay_test` (404 on `_O` servers, still shows in result).
+
+```text
+[
+  {
+    "target": "dumb_pure_async_api_server_m.py",
+    "connections": 64,
+    "keep_alive": true,
+    "duration_s": 10.0,
+    "requests": 41235,
+    "rps": 4123.5,
+    "mib_per_s": 468.2,
+    "latency_ms": {"mean": 15.49, "p50": 9.81, "p95": 51.1, "p99": 63.42, "max": 103.9},
+    "errors": 0,
+    "status": {"200": 41235},
+    "per_path": {...}
+  }
+]
+```
+
+:Author: jupiterbjy@gmail.com
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import pathlib
+import logging
+import subprocess
+import multiprocessing
+from argparse import ArgumentParser
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+
+# --- Config ---
+
+ROOT = pathlib.Path(__file__).parent
+
+# path: weight
+DEFAULT_MIX = {
+    "/generate_script_list_markdown.py": 4,
+    "/readme_res/": 2,
+    "/readme_res/llama_in_one.png": 1,
+    "/delay_test?delay=0.05": 1,
+}
+
+# port each spawned script listens on. `_m` modules' test servers have it hardcoded.
+SPAWN_PORT_O = 8000
+SPAWN_PORT_M = 8080
+
+SPAWN_TIMEOUT = 10.0
+
+# route table sizes for `-r`, and how many of registered routes each run requests
+ROUTE_COUNTS = [10, 1000, 5000]
+ROUTE_SAMPLE = 64
+SPAWN_PORT_ROUTES = 8090
+
+
+# --- Utilities ---
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+
+    if not sorted_values:
+        return 0.0
+
+    idx = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[idx]
+
+
+def summarize(latencies: list[float], total_bytes: int, duration: float) -> dict:
+    """Creates summary dict from latencies in seconds"""
+
+    latencies = sorted(latencies)
+    ms = [v * 1000 for v in latencies]
+
+    return {
+        "requests": len(ms),
+        "rps": round(len(ms) / duration, 1),
+        "mib_per_s": round(total_bytes / duration / 1024 / 1024, 1),
+        "latency_ms": {
+            "mean": round(sum(ms) / len(ms), 2) if ms else 0.0,
+            "p50": round(percentile(ms, 50), 2),
+            "p95": round(percentile(ms, 95), 2),
+            "p99": round(percentile(ms, 99), 2),
+            "max": round(ms[-1], 2) if ms else 0.0,
+        },
+    }
+
+
+class _Stats:
+    """Collected results shared by all connections"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.bytes: dict[str, int] = defaultdict(int)
+        self.status: Counter[str] = Counter()
+        self.errors = 0
+
+
+# --- Logics ---
+
+
+async def _read_resp(r: asyncio.StreamReader) -> tuple[int, int, bool]:
+    """Reads single response.
+
+    Returns:
+        (status, body size, server keeps connection) tuple
+    """
+
+    header = await r.readuntil(b"\r\n\r\n")
+
+    # split on any whitespace, as `_O` servers put status on its own line
+    _, status, *_ = header.split(None, 2)
+
+    headers = {}
+    for line in header.split(b"\r\n")[1:]:
+        name, sep, val = line.partition(b":")
+        if sep:
+            headers[name.strip().lower()] = val.strip().lower()
+
+    keep_alive = headers.get(b"connection") == b"keep-alive"
+
+    if headers.get(b"transfer-encoding") == b"chunked":
+        size = 0
+        while chunk_size := int((await r.readuntil(b"\r\n")).split(b";", 1)[0], 16):
+            size += len(await r.readexactly(chunk_size + 2)) - 2
+
+        # trailers
+        while await r.readuntil(b"\r\n") != b"\r\n":
+            pass
+
+        return int(status), size, keep_alive
+
+    if b"content-length" in headers:
+        length = int(headers[b"content-length"])
+        await r.readexactly(length)
+        return int(status), length, keep_alive
+
+    # no framing, body ends with connection
+    return int(status), len(await r.read()), False
+
+
+async def _connection_loop(
+    host: str,
+    port: int,
+    paths: list[str],
+    weights: list[int],
+    deadline: float,
+    keep_alive: bool,
+    stats: _Stats,
+    seed: int,
+):
+    """Single client connection sending requests back to back until deadline"""
+
+    rng = random.Random(seed)
+    conn: tuple[asyncio.StreamReader, asyncio.StreamWriter] | None = None
+
+    while time.perf_counter() < deadline:
+        path = rng.choices(paths, weights)[0]
+        req = (
+            f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode("utf8")
+
+        started = time.perf_counter()
+
+        try:
+            if conn is None:
+                conn = await asyncio.open_connection(host, port)
+
+            r, w = conn
+            w.write(req)
+            await w.drain()
+
+            status, size, server_keeps = await _read_resp(r)
+
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            stats.errors += 1
+            if conn is not None:
+                conn[1].close()
+                conn = None
+            continue
+
+        stats.latencies[path].append(time.perf_counter() - started)
+        stats.bytes[path] += size
+        stats.status[str(status)] += 1
+
+        if not (keep_alive and server_keeps):
+            conn[1].close()
+            conn = None
+
+    if conn is not None:
+        conn[1].close()
+
+
+async def run_benchmark(
+    url: str, mix: dict[str, int], connections: int, duration: float, keep_alive: bool
+) -> dict:
+    """Runs benchmark against given server.
+
+    Args:
+        url: Base URL of server - e.g. http://127.0.0.1:8080
+        mix: path to weight dict
+        connections: Number of concurrent connections
+        duration: Seconds to run
+        keep_alive: Whether to reuse connections when server allows
+
+    Returns:
+        Summary dict
+    """
+
+    split = urlsplit(url)
+    host, port = split.hostname or "127.0.0.1", split.port or 80
+
+    stats = _Stats()
+    paths, weights = list(mix), list(mix.values())
+
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async with asyncio.TaskGroup() as tg:
+        for idx in range(connections):
+            tg.create_task(
+                _connection_loop(host, port, paths, weights, deadline, keep_alive, stats, idx)
+            )
+
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [v for values in stats.latencies.values() for v in values]
+
+    return {
+        "target": url,
+        "connections": connections,
+        "keep_alive": keep_alive,
+        "duration_s": round(elapsed, 2),
+        **summarize(all_latencies, sum(stats.bytes.values()), elapsed),
+        "errors": stats.errors,
+        "status": dict(stats.status),
+        "per_path": {
+            path: summarize(stats.latencies[path], stats.bytes[path], elapsed) for path in paths
+        },
+    }
+
+
+def _wait_port(port: int, timeout: float) -> bool:
+    """Polls until something listens on localhost port"""
+
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), 0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+
+    return False
+
+
+def spawn_and_run(script: pathlib.Path, **kwargs) -> dict:
+    """Starts server script in subprocess, benchmarks it then stops it.
+
+    Args:
+        script: Server script path
+        **kwargs: Passed to `run_benchmark()`
+
+    Returns:
+        Summary dict, or dict with error if server didn't come up
+    """
+
+    if script.stem.endswith("_O"):
+        port = SPAWN_PORT_O
+        cmd = [sys.executable, str(script), "-r", str(ROOT), "-a", "127.0.0.1", "-p", str(port)]
+    else:
+        port = SPAWN_PORT_M
+        cmd = [sys.executable, str(script)]
+
+    print(f"Spawning {script.name} on port {port}", file=sys.stderr)
+
+    # server prints A LOT on `_m` test servers, don't let terminal be the bottleneck
+    proc = subprocess.Popen(cmd, cwd=script.parent, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        if not _wait_port(port, SPAWN_TIMEOUT):
+            return {"target": script.name, "error": f"Server didn't start in {SPAWN_TIMEOUT}s"}
+
+        result = asyncio.run(run_benchmark(f"http://127.0.0.1:{port}", **kwargs))
+        result["target"] = script.name
+        return result
+
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def _serve_routes(count: int, port: int):
+    """Process entrypoint serving DumbAPIServer with `count` synthetic routes"""
+
+    # registration & startup prints, not benchmarked
+    sys.stdout = open(os.devnull, "w")
+
+    from dumb_pure_async_api_server_m import DumbAPIServer, HTTPResponse
+
+    app = DumbAPIServer(log_level=logging.WARNING)
+
+    async def handler(subdir: str, id: int, **_kwargs) -> HTTPResponse:
+        return HTTPResponse.text(str(id))
+
+    for idx in range(count):
+        app.get_deco(f"/bench/r{idx}/item/{{id:int}}")(handler)
+
+    asyncio.run(app.serve("127.0.0.1", port))
+
+
+def run_routes(counts: list[int], **kwargs) -> list[dict]:
+    """Benchmarks DumbAPIServer once per route table size.
+
+    Args:
+        counts: Number of routes to register for each run
+        **kwargs: Passed to `run_benchmark()`, except mix
+
+    Returns:
+        Summary dicts with `routes` added
+    """
+
+    results = []
+
+    for count in counts:
+        print(f"Spawning DumbAPIServer with {count} routes on port {SPAWN_PORT_ROUTES}", file=sys.stderr)
+
+        # spread over whole table, including last registered one
+        sampled = sorted({*range(0, count, max(1, count // ROUTE_SAMPLE)), count - 1})
+        mix = {f"/bench/r{idx}/item/{idx}": 1 for idx in sampled}
+
+        proc = multiprocessing.Process(target=_serve_routes, args=(count, SPAWN_PORT_ROUTES), daemon=True)
+        proc.start()
+
+        try:
+            if not _wait_port(SPAWN_PORT_ROUTES, SPAWN_TIMEOUT):
+                results.append({"routes": count, "error": f"Server didn't start in {SPAWN_TIMEOUT}s"})
+                continue
+
+            result = asyncio.run(run_benchmark(f"http://127.0.0.1:{SPAWN_PORT_ROUTES}", mix, **kwargs))
+
+            # per path of synthetic routes tells nothing
+            del result["per_path"]
+            result["target"] = f"DumbAPIServer {count} routes"
+            results.append({"routes": count, **result})
+
+        finally:
+            proc.terminate()
+            proc.join(5)
+
+            if proc.is_alive():
+                proc.kill()
+
+    return results
+
+
+def main(
+    targets: list[str],
+    spawn: bool,
+    connections: int,
+    duration: float,
+    no_keep_alive: bool,
+    mix: list[str] | None,
+    output: pathlib.Path | None,
+    routes: list[int] | None = None,
+):
+
+    if mix:
+        parsed_mix = {}
+        for entry in mix:
+            path, sep, weight = entry.rpartition(":")
+            if not (sep and weight.isdigit()):
+                path, weight = entry, "1"
+
+            parsed_mix[path] = int(weight)
+    else:
+        parsed_mix = DEFAULT_MIX
+
+    kwargs = dict(mix=parsed_mix, connections=connections, duration=duration, keep_alive=not no_keep_alive)
+    results = []
+
+    if routes is not None:
+        del kwargs["mix"]
+        results.extend(run_routes(routes or ROUTE_COUNTS, **kwargs))
+
+    for target in targets:
+        if spawn:
+            results.append(spawn_and_run((ROOT / target).resolve(), **kwargs))
+        else:
+            print(f"Benchmarking {target}", file=sys.stderr)
+            results.append(asyncio.run(run_benchmark(target, **kwargs)))
+
+    dumped = json.dumps(results, indent=2)
+    print(dumped)
+
+    if output:
+        output.write_text(dumped, "utf8")
+
+
+if __name__ == "__main__":
+    _parser = ArgumentParser()
+
+    _parser.add_argument(
+        "targets",
+        nargs="*",
+        help="Base URLs of running servers, or server scripts with --spawn",
+    )
+
+    _parser.add_argument(
+        "-s",
+        "--spawn",
+        action="store_true",
+        help="Treat targets as server scripts to start & stop one by one",
+    )
+
+    _parser.add_argument("-c", "--connections", type=int, default=32, help="Concurrent connections")
+
+    _parser.add_argument("-d", "--duration", type=float, default=10.0, help="Seconds to run per target")
+
+    _parser.add_argument(
+        "-n",
+        "--no-keep-alive",
+        action="store_true",
+        help="Open new connection for every request",
+    )
+
+    _parser.add_argument(
+        "-m",
+        "--mix",
+        action="append",
+        help="Request path with optional weight as PATH:WEIGHT, repeatable. Replaces default mix.",
+    )
+
+    _parser.add_argument("-o", "--output", type=pathlib.Path, help="Also write JSON result to this file")
+
+    _parser.add_argument(
+        "-r",
+        "--routes",
+        type=int,
+        nargs="*",
+        help=f"Benchmark DumbAPIServer with given numbers of synthetic routes. Defaults to {ROUTE_COUNTS}.",
+    )
+
+    _args = _parser.parse_args()
+
+    if not (_args.targets or _args.routes is not None):
+        _parser.error("either targets or --routes is required")
+
+    main(**vars(_args))
@@ -3,6 +3,12 @@ Dumb probably unsafe async API server, purely made of included batteries BUT for
 
 Run this module directly to start a test server. (run module directly to run this test yourself)
 
+Handlers can stream body by returning `HTTPResponse.stream(async_iterable)`, or by being
+async generators themselves - sent with chunked transfer encoding as it's produced.
+
+Logs go through `LOGGER` on a background thread - pass `log_level=logging.DEBUG` to
+`DumbAPIServer()` to also log full request & response headers.
+
 Example Usage:
 ```python
 import pathlib
@@ -71,42 +77,85 @@ http://127.0.0.1:8080/delay_test
 http://127.0.0.1:8080/hello/nested
 http://127.0.0.1:8080/
 
--> Receiving ---
-{...
- 'Directory': '/',
- 'HTTP': 'HTTP/1.1',
- 'Host': '127.0.0.1:8080',
- 'Method': 'GET',
- ...
- 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:146.0) '
-               'Gecko/20100101 Firefox/146.0'}
---- Received
-
-<- Responding ---
-HTTP/1.1 200 OK
-Content-Type: text/html
-Content-Length: 159
-Connection: close
-
---- Response sent
+2026-01-04 21:13:02,114 [INFO] 127.0.0.1:51234 "GET / HTTP/1.1" 200 159B parse=0.03ms handler=0.41ms write=0.05ms
+2026-01-04 21:13:02,172 [INFO] 127.0.0.1:51234 "GET /favicon.ico HTTP/1.1" 404 0B parse=0.02ms handler=0.03ms write=0.02ms
 ```
 
 :Author: jupiterbjy@gmail.com
 """
 
+import os
+import re
+import sys
+import time
+import gzip
+import queue
 import pathlib
 import inspect
-import traceback
+import mimetypes
+import threading
+import logging
+import logging.handlers
+from email.utils import formatdate, parsedate_to_datetime
 from urllib.parse import unquote, quote
-from pprint import pprint
-from collections.abc import Callable, Awaitable
+from pprint import pformat
+from collections import OrderedDict
+from collections.abc import Callable, Awaitable, AsyncIterable
+from typing import Any
 
 import trio
 
-__all__ = ["DumbAPIServer", "HTTPError", "HTTPResponse", "serve_path"]
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+__all__ = ["DumbAPIServer", "HTTPError", "HTTPResponse", "ResponseCache", "serve_path"]
+
+MAX_HEADER_SIZE = 16 * 1024
+# Max size of request line + headers. Also used as _StreamReader's search limit.
+
+MAX_BODY_SIZE = 16 * 1024 * 1024
+# Max size of request body, either Content-Length or chunked.
+
+CHUNK_SIZE_RE = re.compile(rb"[0-9A-Fa-f]+")
+# Valid chunk size field of chunked body.
+
+LOGGER = logging.getLogger("DUMB_API_SERVER")
+# INFO logs one-line access log, DEBUG adds full request & response header.
+# Attach own handlers to this before serving to replace default stdout one.
 
 # --- Utilities ---
 
+def setup_logging(level: int | str = logging.INFO) -> logging.handlers.QueueListener:
+    """Routes LOGGER through a queue to background thread, so event loop never blocks on terminal.
+    If LOGGER has no handlers yet, default stdout handler is used.
+
+    Args:
+        level: LOGGER's level
+
+    Returns:
+        Started QueueListener. Stop it on shutdown to flush remaining records.
+    """
+
+    handlers = LOGGER.handlers[:] or [logging.StreamHandler(sys.stdout)]
+
+    for handler in handlers:
+        LOGGER.removeHandler(handler)
+        if handler.formatter is None:
+            handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    LOGGER.addHandler(logging.handlers.QueueHandler(log_queue))
+    LOGGER.setLevel(level)
+    LOGGER.propagate = False
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
 class HTTPError(Exception):
     """Used internally to trigger HTTP error from handlers"""
 
@@ -125,6 +174,27 @@ class HTTPResponse:
         if headers:
             self.headers.update(headers)
 
+        # when set, body is streamed from this file's [offset, offset + length) instead of content.
+        # If content is also set it's cached copy of the file, and sent from memory instead.
+        self.file_path: pathlib.Path | None = None
+        self.offset = 0
+        self.length = 0
+
+        # stat result known in advance, saves a syscall when file is cached
+        self.stat: os.stat_result | None = None
+
+        # precompressed variants of content, keyed by content coding - e.g. {"gzip": b"..."}
+        self.encoded: dict[str, bytes] = {}
+
+        # when set, body is sent from this as it's produced, in place of content.
+        self.body_iter: AsyncIterable[bytes] | None = None
+
+    @property
+    def content_length(self) -> int:
+        """Length of the body that will be sent"""
+
+        return self.length if self.file_path else len(self.content)
+
     @classmethod
     def text(cls, body: str) -> "HTTPResponse":
         """Creates HTTP response instance with text body"""
@@ -143,12 +213,156 @@ class HTTPResponse:
 
         return cls(200, "application/octet-stream", body)
 
+    @classmethod
+    def file(cls, path: pathlib.Path, content_type="") -> "HTTPResponse":
+        """Creates HTTP response instance streaming file from disk, without loading it to memory.
+        Range & conditional requests are handled by server. Content type is guessed if not given.
+        """
+
+        if not content_type:
+            content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+        resp = cls(200, content_type)
+        resp.file_path = path
+        return resp
+
+    @classmethod
+    def stream(cls, body: AsyncIterable[bytes], content_type="application/octet-stream") -> "HTTPResponse":
+        """Creates HTTP response instance sending body as it's produced, with chunked transfer encoding.
+        Next chunk is only pulled once previous one is handed to the socket, so slow clients throttle the producer.
+        """
+
+        resp = cls(200, content_type)
+        resp.body_iter = body
+        return resp
+
     @classmethod
     def redirect(cls, url: str) -> "HTTPResponse":
         return cls(301, headers={"Location": url})
 
 
-_AsyncHandler = Callable[..., Awaitable[HTTPResponse]]
+_AsyncHandler = Callable[..., Awaitable[HTTPResponse] | AsyncIterable[bytes]]
+
+
+class _RouteNode:
+    """Single path segment of route trie"""
+
+    __slots__ = ("static", "params", "handler")
+
+    def __init__(self):
+        self.static: dict[str, _RouteNode] = {}
+        self.params: list[tuple[str, Callable[[str], Any], _RouteNode]] = []
+        self.handler: _AsyncHandler | None = None
+
+
+class RouteTrie:
+    """Segment trie mapping routes to handlers, compiled once at registration.
+
+    Routes can contain typed parameters such as `/user/{id:int}`, which are passed to handler as kwargs.
+    Lookup picks the longest matching prefix, leftover segments become `subdir`.
+    Static segments are preferred over parameters when both match.
+    """
+
+    _CONVERTERS: dict[str, Callable[[str], Any]] = {
+        "str": str,
+        "int": int,
+        "float": float,
+    }
+
+    def __init__(self):
+        self.root = _RouteNode()
+
+    @staticmethod
+    def split(path: str) -> list[str]:
+        """Splits path into segments, dropping empty & `.` segments like PurePosixPath would."""
+
+        return [seg for seg in path.split("/") if seg and seg != "."]
+
+    def add(self, route: str, handler: _AsyncHandler):
+        """Adds route to the trie.
+
+        Raises:
+            ValueError: On unknown parameter type
+        """
+
+        node = self.root
+
+        for seg in self.split(route):
+            if not (seg.startswith("{") and seg.endswith("}")):
+                node = node.static.setdefault(seg, _RouteNode())
+                continue
+
+            name, _, type_name = seg[1:-1].partition(":")
+            try:
+                converter = self._CONVERTERS[type_name or "str"]
+            except KeyError:
+                raise ValueError(f"Unknown parameter type '{type_name}' in route '{route}'")
+
+            # reuse node if same param was registered already, so siblings share the branch
+            for p_name, p_conv, p_node in node.params:
+                if p_name == name and p_conv is converter:
+                    node = p_node
+                    break
+            else:
+                new_node = _RouteNode()
+                node.params.append((name, converter, new_node))
+                node = new_node
+
+        node.handler = handler
+
+    def match(self, path: str) -> tuple[_AsyncHandler, dict[str, Any], str] | None:
+        """Finds handler with the longest matching prefix.
+
+        Args:
+            path: Unquoted request path without query string
+
+        Returns:
+            (handler, path params, subdir) tuple, or None when nothing matches
+        """
+
+        segments = self.split(path)
+        found = self._match(self.root, segments, 0, {})
+
+        if found is None:
+            return None
+
+        handler, depth, params = found
+        return handler, params, "/".join(segments[depth:])
+
+    def _match(
+            self, node: _RouteNode, segments: list[str], depth: int, params: dict[str, Any]
+    ) -> tuple[_AsyncHandler, int, dict[str, Any]] | None:
+        """Depth-first walk, returns (handler, matched depth, params) of the deepest match."""
+
+        best = None
+
+        if depth < len(segments):
+            seg = segments[depth]
+            candidates: list[tuple[_RouteNode, dict[str, Any]]] = []
+
+            if seg in node.static:
+                candidates.append((node.static[seg], params))
+
+            for name, converter, child in node.params:
+                try:
+                    candidates.append((child, {**params, name: converter(seg)}))
+                except ValueError:
+                    continue
+
+            for child, child_params in candidates:
+                found = self._match(child, segments, depth + 1, child_params)
+
+                if found is not None and (best is None or found[1] > best[1]):
+                    best = found
+
+                    # can't get any longer than full match
+                    if best[1] == len(segments):
+                        return best
+
+        if best is None and node.handler is not None:
+            return node.handler, depth, params
+
+        return best
 
 
 def sanitize_path(root: pathlib.Path, rel_path: str) -> pathlib.Path | None:
@@ -182,26 +396,34 @@ class HTTPUtils:
 
     _RESP_HEADER = {
         200: " 200 OK",
+        206: " 206 Partial Content",
         301: " 301 Moved Permanently",
+        304: " 304 Not Modified",
         400: " 400 Bad Request",
         403: " 403 Forbidden",
         404: " 404 Not Found",
         405: " 405 Method Not Allowed",
+        411: " 411 Length Required",
+        413: " 413 Content Too Large",
+        416: " 416 Range Not Satisfiable",
         418: " 418 I'm a teapot",
+        431: " 431 Request Header Fields Too Large",
         500: " 500 Internal Server Error",
+        501: " 501 Not Implemented",
     }
 
     _HEADER_TEMPLATE = "{http_ver} {status}\r\n{headers}"
 
     @classmethod
     def create_resp_header(
-            cls, http_ver: str, response: HTTPResponse
+            cls, http_ver: str, response: HTTPResponse, keep_alive: str = ""
     ) -> str:
         """Create HTTP response header
 
         Args:
             http_ver: HTTP version string - e.g. "HTTP/1.1" or "HTTP/2"
             response: HTTPResponse instance
+            keep_alive: `Keep-Alive` header value - e.g. "timeout=5, max=100". Closes connection if empty.
 
         Returns:
             HTTP response header string
@@ -211,12 +433,25 @@ class HTTPUtils:
 
         if response.content_type:
             headers["Content-Type"] = response.content_type
-            headers["Content-Length"] = str(len(response.content))
+
+        # always send length, otherwise client can't tell where body ends on persistent connection.
+        # 304 is the exception, it never has a body & length there would describe the cached one.
+        # Streamed body doesn't know its length - it's chunked on 1.1, and ends with connection on 1.0.
+        if response.body_iter is not None:
+            if http_ver == "HTTP/1.1":
+                headers["Transfer-Encoding"] = "chunked"
+
+        elif response.status != 304:
+            headers["Content-Length"] = str(response.content_length)
 
         # found that it's not standard on HTTP2,
         # not sure will anyone ever use this for HTTP2 though
         if http_ver.startswith("HTTP/1"):
-            headers["Connection"] = "close"
+            if keep_alive:
+                headers["Connection"] = "keep-alive"
+                headers["Keep-Alive"] = keep_alive
+            else:
+                headers["Connection"] = "close"
 
         return cls._HEADER_TEMPLATE.format(
             http_ver=http_ver,
@@ -249,22 +484,46 @@ class HTTPUtils:
         return path, kwargs
 
     @staticmethod
-    def parse_req(raw_req: str) -> dict[str, str]:
-        """Chops request into more manageable dictionary
+    def wants_keep_alive(req_dict: dict[str, str]) -> bool:
+        """Checks if client wants persistent connection.
+        HTTP/1.1 defaults to keep-alive, HTTP/1.0 defaults to close.
 
         Args:
-            raw_req: Raw request string
+            req_dict: Parsed request dict
 
         Returns:
-            Dictionary-fied request string
+            True if connection should be kept alive
         """
 
-        header, *_ = raw_req.split("\r\n\r\n", maxsplit=1)
+        connection = HTTPUtils.get_header(req_dict, "Connection").lower()
+
+        if req_dict["HTTP"] == "HTTP/1.1":
+            return connection != "close"
 
-        line_iter = iter(header.rstrip().splitlines())
+        return connection == "keep-alive"
+
+    @staticmethod
+    def parse_req(raw_header: bytes) -> dict[str, str]:
+        """Chops request header into more manageable dictionary
+
+        Args:
+            raw_header: Raw request line + headers, up to and including empty line
+
+        Returns:
+            Dictionary-fied request header
+
+        Raises:
+            HTTPError: 400 when request line or header line is malformed
+        """
+
+        # headers are latin-1 by spec, which also can't fail decoding unlike utf8
+        line_iter = iter(raw_header.decode("latin-1").rstrip().split("\r\n"))
 
         # assume 1st line is head cause wtf, makes putting all others much easier
-        method, dir_, http_ver = next(line_iter).split()
+        try:
+            method, dir_, http_ver = next(line_iter).split()
+        except ValueError:
+            raise HTTPError(400)
 
         req_dict = {
             "Method": method,
@@ -273,31 +532,387 @@ class HTTPUtils:
         }
 
         for line in line_iter:
-            req_dict.__setitem__(*line.split(": "))
+            name, sep, val = line.partition(":")
+            if not sep or not name or name != name.strip():
+                raise HTTPError(400)
+
+            req_dict[name] = val.strip()
 
         return req_dict
 
+    @staticmethod
+    def prepare_file_resp(req_dict: dict[str, str], response: HTTPResponse) -> HTTPResponse:
+        """Fills in validators & length for file response, then applies conditional & range headers.
+        Only single range is supported, multiple ranges gets whole file which is allowed by spec.
+
+        Args:
+            req_dict: Parsed request dict
+            response: HTTPResponse instance with `file` set
+
+        Returns:
+            HTTPResponse instance - either given one modified, 304, 404 or 416.
+        """
+
+        try:
+            stat = response.stat or response.file_path.stat()
+        except OSError:
+            return HTTPResponse(404)
+
+        size = stat.st_size
+        etag, last_modified = HTTPUtils.file_validators(stat)
+
+        response.headers.update({
+            "ETag": etag,
+            "Last-Modified": last_modified,
+            "Accept-Ranges": "bytes",
+        })
+        response.offset, response.length = 0, size
+
+        # conditional GET, If-None-Match takes precedence over If-Modified-Since
+        if_none_match = HTTPUtils.get_header(req_dict, "If-None-Match")
+        if_modified_since = HTTPUtils.get_header(req_dict, "If-Modified-Since")
+
+        if if_none_match:
+            if if_none_match.strip() == "*" or etag in (
+                    HTTPUtils.strip_etag_coding(tag) for tag in if_none_match.split(",")
+            ):
+                return HTTPResponse(304, headers={"ETag": etag, "Last-Modified": last_modified})
+
+        elif if_modified_since:
+            try:
+                if int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp():
+                    return HTTPResponse(304, headers={"ETag": etag, "Last-Modified": last_modified})
+            except (TypeError, ValueError):
+                pass
+
+        # range request, ignored if If-Range validator doesn't match anymore
+        range_ = HTTPUtils.get_header(req_dict, "Range")
+        if_range = HTTPUtils.get_header(req_dict, "If-Range")
+
+        if not range_.startswith("bytes=") or "," in range_ or if_range not in ("", etag, last_modified):
+            return response
+
+        start, sep, end = range_.removeprefix("bytes=").strip().partition("-")
+
+        try:
+            if not sep:
+                raise ValueError
+
+            if start:
+                # `bytes=start-end` or `bytes=start-`
+                first, last = int(start), (int(end) if end else size - 1)
+            else:
+                # `bytes=-suffix_len`
+                first, last = max(0, size - int(end)), size - 1
+
+        except ValueError:
+            return response
+
+        last = min(last, size - 1)
+
+        if first > last:
+            return HTTPResponse(416, headers={"Content-Range": f"bytes */{size}"})
+
+        response.status = 206
+        response.offset, response.length = first, last - first + 1
+        response.headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+
+        return response
+
+    @staticmethod
+    def file_validators(stat: os.stat_result) -> tuple[str, str]:
+        """Creates (ETag, Last-Modified) header values from stat result"""
+
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', formatdate(stat.st_mtime, usegmt=True)
+
+    @staticmethod
+    def strip_etag_coding(etag: str) -> str:
+        """Removes content coding suffix `apply_encoding` adds, so precompressed variants validate too."""
+
+        etag = etag.strip()
+
+        for coding in ("br", "gzip"):
+            if etag.endswith(f'-{coding}"'):
+                return etag.removesuffix(f'-{coding}"') + '"'
+
+        return etag
+
+    @staticmethod
+    def apply_encoding(req_dict: dict[str, str], response: HTTPResponse) -> HTTPResponse:
+        """Swaps body to precompressed variant client accepts, if there's any.
+        Partial responses are left as-is, as ranges refer to uncompressed representation.
+
+        Args:
+            req_dict: Parsed request dict
+            response: HTTPResponse instance
+
+        Returns:
+            Given HTTPResponse instance
+        """
+
+        if not response.encoded or response.status != 200:
+            return response
+
+        response.headers["Vary"] = "Accept-Encoding"
+
+        # drop codings explicitly refused with q=0, ignore other weights - we only have 2 codings anyway
+        accepted = set()
+        for token in HTTPUtils.get_header(req_dict, "Accept-Encoding").split(","):
+            coding, _, params = token.strip().partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                accepted.add(coding.strip().lower())
+
+        for coding in ("br", "gzip"):
+            if coding not in accepted or coding not in response.encoded:
+                continue
+
+            response.content = response.encoded[coding]
+            response.offset, response.length = 0, len(response.content)
+            response.headers["Content-Encoding"] = coding
+
+            if "ETag" in response.headers:
+                response.headers["ETag"] = response.headers["ETag"][:-1] + f'-{coding}"'
+
+            break
+
+        return response
+
+    @staticmethod
+    def get_header(req_dict: dict[str, str], name: str, default: str = "") -> str:
+        """Case-insensitive header lookup, as clients aren't obliged to send them title-cased."""
+
+        if name in req_dict:
+            return req_dict[name]
+
+        name = name.lower()
+        for key, val in req_dict.items():
+            if key.lower() == name:
+                return val
+
+        return default
+
+
+class _StreamReader:
+    """Minimal buffered reader over trio SocketStream, mimicking asyncio.StreamReader's API.
+    Unconsumed bytes stay in buffer, so pipelined requests aren't lost between reads.
+    """
+
+    def __init__(self, stream: trio.SocketStream, limit: int = MAX_HEADER_SIZE, chunk_size: int = 65536):
+        self.stream = stream
+        self.limit = limit
+        self.chunk_size = chunk_size
+        self._buffer = bytearray()
+
+    async def _fill(self) -> bool:
+        """Receives more data into buffer. Returns False on EOF."""
+
+        recv = await self.stream.receive_some(self.chunk_size)
+        self._buffer += recv
+        return bool(recv)
+
+    async def readuntil(self, separator: bytes) -> bytes:
+        """Reads until separator, separator included.
+
+        Raises:
+            EOFError: When connection closed before separator. Partial data is in `args[0]`.
+            OverflowError: When separator isn't found within `limit` bytes
+        """
+
+        # only rescan newly received part, with some overlap for separator split across chunks
+        scan_from = 0
+
+        while (idx := self._buffer.find(separator, scan_from)) == -1:
+            if len(self._buffer) > self.limit:
+                raise OverflowError(f"Separator not found in {self.limit} bytes")
+
+            scan_from = max(0, len(self._buffer) - len(separator) + 1)
+
+            if not await self._fill():
+                raise EOFError(bytes(self._buffer))
 
-async def _read_all(reader: trio.SocketStream, chunk_size: int = 1024) -> str:
-    """Reads all data from an trio SocketStream
+        # could've received way past limit in one go
+        if idx > self.limit:
+            raise OverflowError(f"Separator not found in {self.limit} bytes")
+
+        data = bytes(self._buffer[:idx + len(separator)])
+        del self._buffer[:idx + len(separator)]
+        return data
+
+    async def readexactly(self, n: int) -> bytes:
+        """Reads exactly n bytes.
+
+        Raises:
+            EOFError: When connection closed before n bytes
+        """
+
+        while len(self._buffer) < n:
+            if not await self._fill():
+                raise EOFError(bytes(self._buffer))
+
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+
+async def _read_chunked_body(reader: _StreamReader) -> bytearray:
+    """Reads `Transfer-Encoding: chunked` body, trailers are discarded.
 
     Args:
-        reader: Stream reader
-        chunk_size: Reading unit size
+        reader: Stream reader, positioned right after request header
 
     Returns:
-        UTF8 decoded string
+        De-chunked body
+
+    Raises:
+        HTTPError: 400 on malformed chunk, 413 when body exceeds MAX_BODY_SIZE
     """
 
-    output = b""
+    body = bytearray()
 
-    while recv := await reader.receive_some(chunk_size):
-        output += recv
+    while True:
+        try:
+            size_line = await reader.readuntil(b"\r\n")
+            size_field = size_line[:-2].split(b";", 1)[0].strip(b" \t")
+        except (OverflowError, ValueError):
+            raise HTTPError(400)
+
+        # int(x, 16) alone would take signs & underscores too
+        if not CHUNK_SIZE_RE.fullmatch(size_field):
+            raise HTTPError(400)
+
+        size = int(size_field, 16)
 
-        if len(recv) < chunk_size:
+        if size == 0:
             break
 
-    return output.decode("utf8")
+        if len(body) + size > MAX_BODY_SIZE:
+            raise HTTPError(413)
+
+        body += await reader.readexactly(size)
+
+        if await reader.readexactly(2) != b"\r\n":
+            raise HTTPError(400)
+
+    # skip trailers until empty line
+    try:
+        while await reader.readuntil(b"\r\n") != b"\r\n":
+            pass
+    except OverflowError:
+        raise HTTPError(400)
+
+    return body
+
+
+async def _read_req(reader: _StreamReader) -> tuple[dict[str, str], bytearray, float] | None:
+    """Reads single request from a trio SocketStream, leaving pipelined requests in the buffer.
+    Reads header until empty line, then exactly as much body as header says - no more, no less.
+
+    Args:
+        reader: Buffered stream reader. Its limit should be MAX_HEADER_SIZE.
+
+    Returns:
+        (Parsed request dict, body, perf_counter when header arrived) tuple.
+        None if connection was closed before new request.
+
+    Raises:
+        EOFError: When connection closed mid-request
+        HTTPError: When request is malformed or too large
+    """
+
+    try:
+        header = await reader.readuntil(b"\r\n\r\n")
+    except EOFError as err:
+        if err.args[0].strip():
+            raise
+        return None
+    except OverflowError:
+        raise HTTPError(431)
+
+    received_at = time.perf_counter()
+    req_dict = HTTPUtils.parse_req(header)
+
+    # figure out body framing. Chunked takes precedence over length per RFC 9112
+    transfer_encoding = HTTPUtils.get_header(req_dict, "Transfer-Encoding").lower()
+    content_length = HTTPUtils.get_header(req_dict, "Content-Length")
+
+    if transfer_encoding:
+        if transfer_encoding != "chunked":
+            raise HTTPError(501)
+
+        return req_dict, await _read_chunked_body(reader), received_at
+
+    if not content_length:
+        return req_dict, bytearray(), received_at
+
+    # isdigit() alone takes non-ascii digits such as '²', which int() rejects
+    if not (content_length.isascii() and content_length.isdigit()):
+        raise HTTPError(400)
+
+    if int(content_length) > MAX_BODY_SIZE:
+        raise HTTPError(413)
+
+    return req_dict, bytearray(await reader.readexactly(int(content_length))), received_at
+
+
+async def _send_file(
+        stream: trio.SocketStream, path: pathlib.Path, offset: int, length: int, chunk_size: int = 256 * 1024
+):
+    """Streams file's [offset, offset + length) range in chunks.
+    trio has no sendfile, so this is the fallback - memory use is still bounded to single chunk.
+
+    Args:
+        stream: Stream to send to
+        path: File to send
+        offset: Starting offset
+        length: Number of bytes to send
+        chunk_size: Reading unit size
+    """
+
+    async with await trio.open_file(path, "rb") as fp:
+        await fp.seek(offset)
+
+        while length > 0:
+            chunk = await fp.read(min(chunk_size, length))
+            if not chunk:
+                raise EOFError(f"{path} got truncated while sending")
+
+            await stream.send_all(chunk)
+            length -= len(chunk)
+
+
+async def _send_body_iter(stream: trio.SocketStream, body: AsyncIterable[bytes], chunked: bool) -> int:
+    """Sends async iterable body as it's produced. `send_all()` only returns once chunk is handed to kernel,
+    so slow client throttles the producer instead of chunks piling up in memory.
+
+    Args:
+        stream: Stream to send to
+        body: Async iterable yielding bytes
+        chunked: Whether to use chunked transfer encoding, otherwise body ends by closing connection.
+
+    Returns:
+        Number of body bytes sent, excluding chunk framing
+    """
+
+    sent = 0
+
+    try:
+        async for chunk in body:
+            # empty chunk would mark the end of body
+            if not chunk:
+                continue
+
+            await stream.send_all(b"".join((b"%X\r\n" % len(chunk), chunk, b"\r\n")) if chunked else chunk)
+            sent += len(chunk)
+
+        if chunked:
+            await stream.send_all(b"0\r\n\r\n")
+
+    finally:
+        # stop producer right away if client left midway, rather than leaving it to gc
+        if hasattr(body, "aclose"):
+            await body.aclose()
+
+    return sent
 
 
 def generate_dir_listing_html(root: pathlib.Path, sanitized_abs_sub_path: pathlib.Path) -> str:
@@ -332,31 +947,247 @@ def generate_dir_listing_html(root: pathlib.Path, sanitized_abs_sub_path: pathli
         f'<a href="/{quote(parent_str)}">Go Up</a><br>'
     ]
 
-    # sort stuff by name for each, so we can put dir first then file
-    listing = [*sanitized_abs_sub_path.iterdir()]
-    dirs = sorted([p for p in listing if p.is_dir()], key=lambda p: p.name)
-    files = sorted([p for p in listing if p.is_file()], key=lambda p: p.name)
+    # sort stuff by name for each, so we can put dir first then file.
+    # scandir gives type from dirent for free, so no extra stat per entry unlike Path.is_dir()
+    with os.scandir(sanitized_abs_sub_path) as it:
+        listing = [(entry.name, entry.is_dir()) for entry in it if entry.is_dir() or entry.is_file()]
+
+    # dirs first, then by name
+    listing.sort(key=lambda pair: (not pair[1], pair[0]))
 
-    for sub_p in dirs + files:
+    for name, is_dir in listing:
 
         # make sure it's escaped
-        path_name = quote(sub_p.name)
+        path_name = quote(name)
 
         # if dir or html, then set href to it
-        if sub_p.is_dir():
-            lines.append(f'D <a href="{relative}{path_name}">{sub_p.name}</a>')
+        if is_dir:
+            lines.append(f'D <a href="{relative}{path_name}">{name}</a>')
 
-        elif sub_p.suffix.lower() == ".html":
-            lines.append(f'H <a href="{relative}{path_name}">{sub_p.name}</a>')
+        elif name.lower().endswith(".html"):
+            lines.append(f'H <a href="{relative}{path_name}">{name}</a>')
 
         else:
-            lines.append(f'F <a href="{relative}{path_name}" download="{path_name}">{sub_p.name}</a>')
+            lines.append(f'F <a href="{relative}{path_name}" download="{path_name}">{name}</a>')
 
     return "<br>\n".join(lines)
 
 
-def serve_path(root: pathlib.Path, subdir="", serve_listing=False) -> HTTPResponse:
-    """Creates a response for Serving files for GET request."""
+class _CacheEntry:
+    """Cached response body along with what's needed to validate & serve it"""
+
+    __slots__ = ("path", "stat", "content_type", "body", "encoded", "is_listing")
+
+    def __init__(
+            self,
+            path: pathlib.Path,
+            stat: os.stat_result,
+            content_type: str,
+            body: bytes | None,
+            encoded: dict[str, bytes],
+            is_listing: bool,
+    ):
+        self.path = path
+        self.stat = stat
+        self.content_type = content_type
+        self.body = body
+        self.encoded = encoded
+        self.is_listing = is_listing
+
+    @property
+    def size(self) -> int:
+        """Approximate memory used by this entry, with some overhead for bookkeeping"""
+
+        return 256 + len(self.body or b"") + sum(len(v) for v in self.encoded.values())
+
+
+class ResponseCache:
+    """Bounded LRU cache for `serve_path`, sized by bytes.
+
+    Keeps small files & directory listings in memory along with precompressed variants,
+    so hot pages are served without reading disk. Files too large to keep still get their
+    resolved path & stat cached, so they skip path resolution and go straight to streaming.
+
+    By default each hit costs single `stat()` to check mtime. Pass `check_mtime=False` and hook
+    `on_fs_event` to watchdog instead to skip even that:
+
+    ```python
+    from watchdog_file_events_m import start_watchdog
+
+    cache = ResponseCache(check_mtime=False)
+
+    with start_watchdog([str(root)], True) as handler:
+        handler.register_global(cache.on_fs_event)
+        asyncio.run(APP.serve())
+    ```
+    """
+
+    _COMPRESSIBLE = ("text/", "application/json", "application/javascript", "image/svg+xml", "application/xml")
+
+    def __init__(
+            self,
+            max_bytes: int = 64 * 1024 * 1024,
+            max_entry_bytes: int = 1024 * 1024,
+            check_mtime: bool = True,
+            compress: bool = True,
+    ):
+        """
+        Args:
+            max_bytes: Total size of cached bodies before evicting least recently used ones
+            max_entry_bytes: Files larger than this only get metadata cached
+            check_mtime: Whether to stat on every hit. Disable when invalidating via `on_fs_event`.
+            compress: Whether to precompress text-ish content with gzip, and brotli if installed
+        """
+
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.check_mtime = check_mtime
+        self.compress = compress
+
+        self._entries: OrderedDict[tuple[pathlib.Path, str], _CacheEntry] = OrderedDict()
+        self._size = 0
+
+        # watchdog calls back from its own thread
+        self._lock = threading.Lock()
+
+    def get(self, root: pathlib.Path, subdir: str) -> _CacheEntry | None:
+        """Gets entry for requested path, dropping it if file changed since cached."""
+
+        key = (root, subdir)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            self._entries.move_to_end(key)
+
+        if not self.check_mtime:
+            return entry
+
+        try:
+            stat = entry.path.stat()
+        except OSError:
+            stat = None
+
+        if stat is None or (stat.st_mtime_ns, stat.st_size) != (entry.stat.st_mtime_ns, entry.stat.st_size):
+            self._pop(key)
+            return None
+
+        return entry
+
+    def put(
+            self,
+            root: pathlib.Path,
+            subdir: str,
+            path: pathlib.Path,
+            content_type: str,
+            body: bytes | None = None,
+            is_listing: bool = False,
+            stat: os.stat_result | None = None,
+    ) -> _CacheEntry:
+        """Caches response for requested path, evicting old ones when over the limit.
+
+        Args:
+            root: Root directory currently being served
+            subdir: Requested subdir relative to root, as given to `serve_path`
+            path: Sanitized absolute path that's actually served
+            content_type: Content type of the response
+            body: Response body. Read from file if None & file is small enough.
+            is_listing: Whether body is generated listing of `path` directory
+            stat: Stat result of `path` taken *before* body was made, so racing changes invalidate it
+
+        Returns:
+            Cache entry
+        """
+
+        stat = stat or path.stat()
+
+        if body is None and stat.st_size <= self.max_entry_bytes:
+            body = path.read_bytes()
+
+        encoded: dict[str, bytes] = {}
+        if body and self.compress and len(body) >= 1024 and content_type.startswith(self._COMPRESSIBLE):
+            encoded["gzip"] = gzip.compress(body, 6)
+
+            if brotli is not None:
+                encoded["br"] = brotli.compress(body)
+
+            # keep only variants that are actually worth it
+            encoded = {k: v for k, v in encoded.items() if len(v) < len(body) * 0.9}
+
+        entry = _CacheEntry(path, stat, content_type, body, encoded, is_listing)
+        key = (root, subdir)
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key).size
+
+            if entry.size > self.max_bytes:
+                return entry
+
+            self._entries[key] = entry
+            self._size += entry.size
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+        return entry
+
+    def invalidate(self, path: pathlib.Path | str):
+        """Drops entries serving given path, and listings of its parent directory."""
+
+        path = pathlib.Path(path)
+
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry.path == path or (entry.is_listing and entry.path == path.parent)
+                or path in entry.path.parents
+            ]
+
+        for key in stale:
+            self._pop(key)
+
+    def on_fs_event(self, event):
+        """Watchdog callback, invalidates paths touched by the event."""
+
+        self.invalidate(os.path.realpath(event.src_path))
+
+        if dest_path := getattr(event, "dest_path", ""):
+            self.invalidate(os.path.realpath(dest_path))
+
+    def _pop(self, key: tuple[pathlib.Path, str]):
+        with self._lock:
+            if (entry := self._entries.pop(key, None)) is not None:
+                self._size -= entry.size
+
+
+def _resp_from_cache(entry: _CacheEntry) -> HTTPResponse:
+    """Creates response from cache entry"""
+
+    if entry.is_listing:
+        resp = HTTPResponse(200, entry.content_type, entry.body)
+    else:
+        resp = HTTPResponse.file(entry.path, entry.content_type)
+        resp.content = entry.body or b""
+        resp.stat = entry.stat
+
+    resp.encoded = entry.encoded
+    return resp
+
+
+def serve_path(
+        root: pathlib.Path, subdir="", serve_listing=False, cache: ResponseCache | None = None
+) -> HTTPResponse:
+    """Creates a response for Serving files for GET request.
+    Files are streamed from disk rather than read, so serving size doesn't affect memory usage.
+    If cache is given, small files & listings are served from memory instead.
+    """
+
+    if cache is not None and (entry := cache.get(root, subdir)) is not None:
+        return _resp_from_cache(entry)
 
     sub_p = sanitize_path(root, subdir)
 
@@ -368,18 +1199,31 @@ def serve_path(root: pathlib.Path, subdir="", serve_listing=False) -> HTTPRespon
         index_html = sub_p / "index.html"
 
         if index_html.exists():
-            return HTTPResponse.html(index_html.read_text("utf8"))
+            if cache is not None:
+                return _resp_from_cache(cache.put(root, subdir, index_html, "text/html"))
+
+            return HTTPResponse.file(index_html, "text/html")
 
         if not serve_listing:
             return HTTPResponse(404)
 
         # serve dir
+        if cache is not None:
+            stat = sub_p.stat()
+            html = generate_dir_listing_html(root, sub_p).encode("utf8")
+            return _resp_from_cache(cache.put(root, subdir, sub_p, "text/html", html, True, stat))
+
         return HTTPResponse.html(generate_dir_listing_html(root, sub_p))
 
     if sub_p.suffix.lower() == ".html":
-        return HTTPResponse.html(sub_p.read_text("utf8"))
+        resp = HTTPResponse.file(sub_p, "text/html")
+    else:
+        resp = HTTPResponse.file(sub_p)
+
+    if cache is not None:
+        return _resp_from_cache(cache.put(root, subdir, sub_p, resp.content_type))
 
-    return HTTPResponse.octet_stream(sub_p.read_bytes())
+    return resp
 
 
 # --- Logics ---
@@ -387,20 +1231,42 @@ def serve_path(root: pathlib.Path, subdir="", serve_listing=False) -> HTTPRespon
 class DumbAPIServer:
     """Dumb probably unsafe async HTTP server"""
 
-    def __init__(self):
+    def __init__(
+            self,
+            keep_alive_timeout: float = 5.0,
+            max_keep_alive_requests: int = 100,
+            log_level: int | str = logging.INFO,
+    ):
+        """
+        Args:
+            keep_alive_timeout: Seconds to wait for next request on persistent connection
+            max_keep_alive_requests: Max requests served per connection before closing it
+            log_level: LOGGER level while serving. INFO for access log, DEBUG for full headers, WARNING to mute.
+        """
+
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_keep_alive_requests = max_keep_alive_requests
+        self.log_level = log_level
+
         self.mapped_dirs: dict[str, dict[str, _AsyncHandler]] = {
             "GET": {},
             "POST": {},
         }
 
+        # what's actually used for dispatching, mapped_dirs is kept for listing
+        self.routes: dict[str, RouteTrie] = {method: RouteTrie() for method in self.mapped_dirs}
+
     def get_deco(self, map_dir: str) -> Callable[[_AsyncHandler], _AsyncHandler]:
-        """Decorator to map a directory to async function"""
+        """Decorator to map a directory to async function.
+        Directory can contain typed parameters like `/user/{id:int}`, passed as kwargs.
+        """
 
         # @functools.wraps
         def decorator(async_func: _AsyncHandler) -> _AsyncHandler:
-            if not inspect.iscoroutinefunction(async_func):
-                raise TypeError("Decorated function must be an async function")
+            if not (inspect.iscoroutinefunction(async_func) or inspect.isasyncgenfunction(async_func)):
+                raise TypeError("Decorated function must be an async function or async generator function")
 
+            self.routes["GET"].add(map_dir, async_func)
             self.mapped_dirs["GET"][map_dir] = async_func
             print(f"Registered GET '{map_dir}' -> '{async_func.__qualname__}'")
 
@@ -410,14 +1276,15 @@ class DumbAPIServer:
 
     def post_deco(self, map_dir: str) -> Callable[[_AsyncHandler], _AsyncHandler]:
         """Decorator to map a directory to async function.
-        Function must return (header: str, body: bytes) tuple.
+        Request body is passed as `body: bytes` kwarg alongside `subdir` and query params.
         """
 
         # @functools.wraps
         def decorator(async_func: _AsyncHandler) -> _AsyncHandler:
-            if not inspect.iscoroutinefunction(async_func):
-                raise TypeError("Decorated function must be an async function")
+            if not (inspect.iscoroutinefunction(async_func) or inspect.isasyncgenfunction(async_func)):
+                raise TypeError("Decorated function must be an async function or async generator function")
 
+            self.routes["POST"].add(map_dir, async_func)
             self.mapped_dirs["POST"][map_dir] = async_func
             print(f"Registered POST {map_dir} -> {async_func.__name__}")
 
@@ -425,93 +1292,186 @@ class DumbAPIServer:
 
         return decorator
 
-    async def create_resp(self, req_dict: dict[str, str]) -> tuple[str, bytes]:
+    async def create_resp(self, req_dict: dict[str, str], body: bytes = b"") -> HTTPResponse:
         """Create response for given request.
-        To make logging more readable, returns response as `(header, body)` pair.
 
         Args:
             req_dict: Parsed request dict
+            body: Request body, passed to POST handlers as `body` kwarg
 
         Returns:
-            (Header str, Body bytes) tuple
+            HTTPResponse instance
         """
 
-        http_ver = req_dict["HTTP"]
-
         # reject user when non-GET/POST are used, we don't support it
         if req_dict["Method"] not in self.mapped_dirs:
-            return HTTPUtils.create_resp_header(http_ver, HTTPResponse(405)), b""
+            return HTTPResponse(405)
 
         # parse path + param
         try:
             str_path, kwargs = HTTPUtils.parse_raw_dir(req_dict["Directory"])
-            path = pathlib.PurePosixPath(str_path)
 
         except ValueError:
-            return HTTPUtils.create_resp_header(http_ver, HTTPResponse(400)), b""
-
-        # attempt to get handler by finding match for self & parent dir
-        async_func: _AsyncHandler
-        subdir: str
+            return HTTPResponse(400)
 
-        for candidate in [path, *path.parents]:
-            p = candidate.as_posix()
+        # attempt to get handler with the longest matching route
+        matched = self.routes[req_dict["Method"]].match(str_path)
 
-            if p not in self.mapped_dirs[req_dict["Method"]]:
-                continue
+        if matched is None:
+            return HTTPResponse(404)
 
-            async_func = self.mapped_dirs[req_dict["Method"]][p]
-            subdir = path.relative_to(candidate).as_posix()
+        async_func, path_params, subdir = matched
+        kwargs.update(path_params)
 
-            if subdir == ".":
-                subdir = ""
-            break
-        else:
-            return HTTPUtils.create_resp_header(http_ver, HTTPResponse(404)), b""
+        if req_dict["Method"] == "POST":
+            kwargs["body"] = body
 
         # got valid hit, run it
         try:
-            # noinspection PyUnboundLocalVariable
-            resp = await async_func(**kwargs, subdir=subdir)
-            return HTTPUtils.create_resp_header(http_ver, resp), resp.content
+            # async generator handlers stream whatever they yield
+            result = async_func(**kwargs, subdir=subdir)
+            if inspect.isasyncgen(result):
+                return HTTPResponse.stream(result)
 
-        except Exception as err:
-            print(f"Exception in {async_func.__name__}: {err}")
-            return HTTPUtils.create_resp_header(http_ver, HTTPResponse(500)), b""
+            resp = await result
 
-    async def _tcp_handler(self, stream: trio.SocketStream):
-        """Handles incoming TCP connection. Yeah, that's it
+            if resp.file_path is not None:
+                resp = HTTPUtils.prepare_file_resp(req_dict, resp)
 
-        Args:
-            stream: `SocketStream` from `trio.serve_tcp()`
-        """
+            return HTTPUtils.apply_encoding(req_dict, resp)
+
+        except HTTPError as err:
+            return HTTPResponse(err.status)
 
-        # TODO: Add keepalive
+        except Exception as _err:
+            LOGGER.exception(f"Exception in {async_func.__name__}")
+            return HTTPResponse(500)
 
-        # Receive
-        print("\nReceiving ---")
+    @staticmethod
+    def _stop_logging(listener: logging.handlers.QueueListener):
+        """Flushes queued records & puts original handlers back, so serving again works the same"""
 
-        parsed = HTTPUtils.parse_req(await _read_all(stream))
-        pprint(parsed)
+        listener.stop()
 
-        print("--- Received")
+        for handler in LOGGER.handlers[:]:
+            LOGGER.removeHandler(handler)
 
-        # Prep response
-        # noinspection PyBroadException
-        try:
-            header, body = await self.create_resp(parsed)
-        except Exception as _err:
-            traceback.print_exc()
-            header = HTTPUtils.create_resp_header(parsed["HTTP"], HTTPResponse(500))
-            body = b""
+        for handler in listener.handlers:
+            LOGGER.addHandler(handler)
 
-        # Respond
-        print("\nResponding ---")
+    async def _tcp_handler(self, stream: trio.SocketStream):
+        """Handles incoming TCP connection.
+        Serves requests one after another until client closes, idles out or hits request limit.
+        Pipelined requests are simply left in reader's buffer, and so are served in order.
 
-        print(header)
-        await stream.send_all(f"{header}\r\n".encode("utf8") + body)
+        Args:
+            stream: `SocketStream` from `trio.serve_tcp()`
+        """
 
-        print("--- Response sent")
+        reader = _StreamReader(stream)
+        peer = "{}:{}".format(*stream.socket.getpeername()[:2])
+        served = 0
+
+        try:
+            while True:
+                # Receive - first request is waited indefinitely like before, rest idles out
+                try:
+                    with trio.move_on_after(self.keep_alive_timeout if served else float("inf")) as scope:
+                        req = await _read_req(reader)
+
+                except HTTPError as err:
+                    # can't trust framing anymore, reply & drop connection
+                    LOGGER.warning(f"{peer} Malformed request, responding {err.status}")
+                    header = HTTPUtils.create_resp_header("HTTP/1.1", HTTPResponse(err.status))
+                    await stream.send_all(f"{header}\r\n".encode("utf8"))
+                    break
+
+                if scope.cancelled_caught or req is None:
+                    break
+
+                parsed, body, received_at = req
+                parsed_at = time.perf_counter()
+
+                if LOGGER.isEnabledFor(logging.DEBUG):
+                    LOGGER.debug(f"{peer} Received ---\n{pformat(parsed)}")
+
+                served += 1
+                keep_alive = (
+                    HTTPUtils.wants_keep_alive(parsed)
+                    and served < self.max_keep_alive_requests
+                )
+                keep_alive_header = (
+                    f"timeout={int(self.keep_alive_timeout)}, "
+                    f"max={self.max_keep_alive_requests - served}"
+                    if keep_alive else ""
+                )
+
+                # Prep response
+                # noinspection PyBroadException
+                try:
+                    resp = await self.create_resp(parsed, bytes(body))
+                except Exception as _err:
+                    LOGGER.exception(f"{peer} Failed creating response")
+                    resp = HTTPResponse(500)
+
+                handled_at = time.perf_counter()
+                sent = resp.content_length
+
+                if resp.body_iter is not None and parsed["HTTP"] != "HTTP/1.1":
+                    # no chunked encoding before 1.1, streamed body can only end by closing connection
+                    keep_alive, keep_alive_header = False, ""
+
+                header = HTTPUtils.create_resp_header(parsed["HTTP"], resp, keep_alive_header)
+
+                # Respond
+                if LOGGER.isEnabledFor(logging.DEBUG):
+                    LOGGER.debug(f"{peer} Responding ---\n{header}")
+
+                if resp.body_iter is not None:
+                    await stream.send_all(f"{header}\r\n".encode("utf8"))
+
+                    try:
+                        sent = await _send_body_iter(stream, resp.body_iter, parsed["HTTP"] == "HTTP/1.1")
+
+                    except trio.BrokenResourceError:
+                        raise
+
+                    except Exception as _err:
+                        # header is already out, all that's left is cutting body short
+                        LOGGER.exception(f"{peer} Streamed body failed midway, dropping connection")
+                        break
+
+                elif resp.file_path is None:
+                    await stream.send_all(f"{header}\r\n".encode("utf8") + resp.content)
+
+                elif resp.content:
+                    # cached file, serve range from memory
+                    await stream.send_all(
+                        f"{header}\r\n".encode("utf8") + resp.content[resp.offset:resp.offset + resp.length]
+                    )
+
+                else:
+                    await stream.send_all(f"{header}\r\n".encode("utf8"))
+                    await _send_file(stream, resp.file_path, resp.offset, resp.length)
+
+                if LOGGER.isEnabledFor(logging.INFO):
+                    sent_at = time.perf_counter()
+                    LOGGER.info(
+                        f'{peer} "{parsed["Method"]} {parsed["Directory"]} {parsed["HTTP"]}" '
+                        f"{resp.status} {sent}B "
+                        f"parse={(parsed_at - received_at) * 1000:.2f}ms "
+                        f"handler={(handled_at - parsed_at) * 1000:.2f}ms "
+                        f"write={(sent_at - handled_at) * 1000:.2f}ms"
+                    )
+
+                if not keep_alive:
+                    break
+
+        except (EOFError, trio.BrokenResourceError) as err:
+            LOGGER.debug(f"{peer} Connection dropped: {err!r}")
+
+        finally:
+            await stream.aclose()
 
     async def serve(self, address: str = "127.0.0.1", port: int = 8080):
         """Name
@@ -528,7 +1488,12 @@ class DumbAPIServer:
         for path in self.mapped_dirs["GET"]:
             print(url + path)
 
-        await trio.serve_tcp(self._tcp_handler, port, host=address)
+        listener = setup_logging(self.log_level)
+
+        try:
+            await trio.serve_tcp(self._tcp_handler, port, host=address)
+        finally:
+            self._stop_logging(listener)
 
 
 # --- Drivers ---
@@ -539,6 +1504,7 @@ def __test_serve():
     app = DumbAPIServer()
     root = pathlib.Path(__file__).parent
     dir_listing = True
+    cache = ResponseCache()
 
     placeholder_html = """
     <!DOCTYPE html>
@@ -578,6 +1544,23 @@ def __test_serve():
 
         return HTTPResponse.text(f"{delay}s wait done")
 
+    @app.get_deco("/stream_test")
+    async def stream_test(subdir: str, count: str = "10", delay: str = "0.5", **_kwargs) -> HTTPResponse:
+        if subdir:
+            return HTTPResponse(404)
+
+        try:
+            count, delay = int(count), float(delay)
+        except ValueError:
+            return HTTPResponse(400)
+
+        async def ticks():
+            for idx in range(count):
+                yield f"{idx + 1}/{count} - {time.strftime('%X')}\n".encode("utf8")
+                await trio.sleep(delay)
+
+        return HTTPResponse.stream(ticks(), "text/plain")
+
     @app.get_deco("/hello")
     async def hello(subdir: str, **kwargs) -> HTTPResponse:
         return HTTPResponse.text(f"Hello, world!\nsubdir: {subdir}\nparams:{kwargs}")
@@ -590,13 +1573,13 @@ def __test_serve():
     async def index(subdir: str, **_kwargs) -> HTTPResponse:
 
         if subdir:
-            return serve_path(root, subdir, serve_listing=dir_listing)
+            return serve_path(root, subdir, serve_listing=dir_listing, cache=cache)
 
         if (root / "index.html").exists():
-            return serve_path(root, serve_listing=dir_listing)
+            return serve_path(root, serve_listing=dir_listing, cache=cache)
 
         if dir_listing:
-            return serve_path(root, serve_listing=True)
+            return serve_path(root, serve_listing=True, cache=cache)
 
         return HTTPResponse.html(placeholder_html)
 
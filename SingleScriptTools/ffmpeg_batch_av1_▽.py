@@ -9,56 +9,161 @@ share common parent directory.
 Will create new directory named "av1" under the CWD,
 since this script is designed to be for batch processing.
 
-Also outputs `results.sqlite` that contains file size & compression ratio.
+Runs multiple ffmpeg jobs concurrently, each limited to `THREADS_PER_JOB` SVT-AV1 threads,
+so big many-core machines stay busy - set with `-j` & `-t`.
+
+Also outputs `results.sqlite` that contains status, timing, file size & compression ratio per file.
+It's kept between runs, so rerunning same batch after crash or Ctrl+C only encodes files that
+aren't done yet - or failed, or changed since. Outputs are written as `*.part.mp4` until finished.
+
+Progress of running jobs (fps, speed & ETA) is read from ffmpeg's `-progress` output and printed
+periodically. Per file fps, speed (x realtime) & bitrate go into db too, and summary lists
+the slowest files & hourly throughput - handy for tuning presets.
 
 Requires FFMPEG
 
 :Author: jupiterbjy@gmail.com
 """
 
+import os
+import time
+import shlex
+import datetime
+import threading
 import pathlib
 import argparse
 import subprocess
 import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 from typing import Sequence, Iterable
 
 # --- Config ---
 
+# Template is split into arguments before substitution, so paths need no quoting.
 FFMPEG_CMD = """
-ffmpeg -i "{}" -c:v libsvtav1 -crf 25 -preset 4 -svtav1-params tune=0:enable-tf=0:enable-qm=1:qm-min=0 -c:a libopus -b:a 192k -vbr:a on -y "{}"
+ffmpeg -hide_banner -nostdin -loglevel error -nostats -progress pipe:1 -threads {threads} -i {src}
+-c:v libsvtav1 -crf 25 -preset 4 -svtav1-params tune=0:enable-tf=0:enable-qm=1:qm-min=0:lp={threads}
+-c:a libopus -b:a 192k -vbr:a on -y {dest}
+""".strip()
+
+FFPROBE_CMD = """
+ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 {src}
 """.strip()
 
+# SVT-AV1 & decoder threads per ffmpeg job
+THREADS_PER_JOB = 8
+
+# Concurrent ffmpeg jobs
+JOBS = max(1, (os.cpu_count() or 1) // THREADS_PER_JOB)
+
 # Expecting all lowercase
 SUPPORTED_EXTS = {".mp4", ".mkv", ".avi"}
 
 OUT_EXT = ".mp4"
 
+# Inserted before OUT_EXT while encoding
+PART_SUFFIX = ".part"
+
 OUT_DIR_NAME = "av1"
 
 OUT_SIZE_DB = "results.sqlite"
 
 TABLE_NAME = "enc_result"
 
+# Number of last ffmpeg error lines to keep per file
+ERROR_LINES = 20
+
+# Seconds between progress prints of running jobs
+PROGRESS_INTERVAL = 30
+
+# Number of slowest files to list in summary
+SLOWEST_COUNT = 5
+
 DB_SCHEMA = f"""
 CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
-    idx INTEGER PRIMARY KEY,
-    file_name TEXT,
+    file_name TEXT PRIMARY KEY,
     src_bytes INTEGER,
+    src_mtime_ns INTEGER,
     enc_bytes INTEGER,
-    ratio REAL
+    ratio REAL,
+    status TEXT,
+    return_code INTEGER,
+    started REAL,
+    elapsed REAL,
+    error TEXT,
+    duration REAL,
+    fps REAL,
+    speed REAL,
+    bitrate_kbps REAL
 )
 """
 
-INSERT_ROW = f"""
-INSERT INTO {TABLE_NAME} VALUES (?, ?, ?, ?, ?)
+# Columns added after first version of db, with types
+ADDED_COLUMNS = {
+    "duration": "REAL",
+    "fps": "REAL",
+    "speed": "REAL",
+    "bitrate_kbps": "REAL",
+}
+
+ADD_COLUMN = f"""
+ALTER TABLE {TABLE_NAME} ADD COLUMN {{}} {{}}
+"""
+
+TABLE_COLUMNS = f"""
+SELECT name FROM pragma_table_info('{TABLE_NAME}')
+"""
+
+DROP_TABLE = f"""
+DROP TABLE IF EXISTS {TABLE_NAME}
+"""
+
+FETCH_ROW = f"""
+SELECT src_bytes, src_mtime_ns, status FROM {TABLE_NAME} WHERE file_name = ?
+"""
+
+MARK_QUEUED = f"""
+INSERT INTO {TABLE_NAME} (file_name, src_bytes, src_mtime_ns, enc_bytes, ratio, status)
+VALUES (?, ?, ?, 0, 0.0, 'queued')
+ON CONFLICT(file_name) DO UPDATE SET
+    src_bytes=excluded.src_bytes, src_mtime_ns=excluded.src_mtime_ns, enc_bytes=0, ratio=0.0,
+    status='queued', return_code=NULL, started=NULL, elapsed=NULL, error=NULL,
+    duration=NULL, fps=NULL, speed=NULL, bitrate_kbps=NULL
+"""
+
+MARK_FINISHED = f"""
+UPDATE {TABLE_NAME} SET
+    enc_bytes=?, ratio=?, status=?, return_code=?, started=?, elapsed=?, error=?,
+    duration=?, fps=?, speed=?, bitrate_kbps=?
+WHERE file_name = ?
+"""
+
+STATUS_COUNTS = f"""
+SELECT status, COUNT(*) FROM {TABLE_NAME} GROUP BY status
 """
 
 TOTAL_SRC_BYTES = f"""
-SELECT SUM(src_bytes) FROM {TABLE_NAME} WHERE enc_bytes > 0
+SELECT SUM(src_bytes) FROM {TABLE_NAME} WHERE status = 'done'
 """
 
 TOTAL_ENC_BYTES = f"""
-SELECT SUM(enc_bytes) FROM {TABLE_NAME} WHERE enc_bytes > 0
+SELECT SUM(enc_bytes) FROM {TABLE_NAME} WHERE status = 'done'
+"""
+
+SLOWEST = f"""
+SELECT file_name, speed, fps, bitrate_kbps FROM {TABLE_NAME}
+WHERE status = 'done' AND speed IS NOT NULL
+ORDER BY speed LIMIT ?
+"""
+
+# per hour of job start - content hours encoded, average per-job speed & fps
+HOURLY_THROUGHPUT = f"""
+SELECT strftime('%Y-%m-%d %H:00', started, 'unixepoch', 'localtime') AS hour,
+    COUNT(*), SUM(duration) / 3600, SUM(duration) / SUM(elapsed), AVG(fps)
+FROM {TABLE_NAME}
+WHERE status = 'done' AND duration IS NOT NULL
+GROUP BY hour ORDER BY hour
 """
 
 
@@ -97,69 +202,313 @@ def bytes_to_human_readable(size: int | float) -> str:
     raise ValueError("Received size beyond human understanding")
 
 
+def format_seconds(seconds: float | None) -> str:
+    """Formats seconds as H:MM:SS"""
+
+    if seconds is None:
+        return "?"
+
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+def probe_duration(src_path: pathlib.Path) -> float | None:
+    """Returns media duration in seconds via ffprobe, None if unknown"""
+
+    args = [arg.format(src=src_path.as_posix()) for arg in shlex.split(FFPROBE_CMD)]
+
+    try:
+        proc = subprocess.run(args, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+        return float(proc.stdout.strip())
+
+    except (OSError, ValueError):
+        return None
+
+
+class Progress:
+    """Latest state of single ffmpeg job, parsed from `-progress` output.
+    Written by job's thread & read by main thread - each field is replaced atomically so it's fine.
+    """
+
+    __slots__ = ("name", "duration", "out_time", "frame", "fps", "speed", "bitrate_kbps")
+
+    def __init__(self, name: str):
+        self.name = name
+
+        # source duration, filled by job once probed
+        self.duration: float | None = None
+
+        self.out_time = 0.0
+        self.frame = 0
+        self.fps = 0.0
+        self.speed = 0.0
+        self.bitrate_kbps = 0.0
+
+    def feed(self, line: str):
+        """Parses single `key=value` line. Values are N/A until ffmpeg knows them."""
+
+        key, _, value = line.strip().partition("=")
+
+        try:
+            match key:
+                case "out_time_us":
+                    self.out_time = int(value) / 1_000_000
+                case "frame":
+                    self.frame = int(value)
+                case "fps":
+                    self.fps = float(value)
+                case "speed":
+                    self.speed = float(value.rstrip("x"))
+                case "bitrate":
+                    self.bitrate_kbps = float(value.removesuffix("kbits/s"))
+
+        except ValueError:
+            pass
+
+    def eta(self) -> float | None:
+        if not (self.duration and self.speed):
+            return None
+
+        return max(self.duration - self.out_time, 0) / self.speed
+
+    def __str__(self):
+        percent = f"{self.out_time * 100 / self.duration:5.1f}%" if self.duration else "  ?  %"
+
+        return (
+            f"{percent} {self.fps:6.1f} fps {self.speed:5.2f}x"
+            f" ETA {format_seconds(self.eta())} - {self.name}"
+        )
+
+
+def open_db(db_path: pathlib.Path) -> sqlite3.Connection:
+    """Opens results db, recreating table if it's from older version of this script"""
+
+    conn = sqlite3.connect(db_path)
+
+    columns = {row[0] for row in conn.execute(TABLE_COLUMNS)}
+    if columns and "status" not in columns:
+        conn.execute(DROP_TABLE)
+        columns = set()
+
+    conn.execute(DB_SCHEMA)
+
+    for column, column_type in ADDED_COLUMNS.items():
+        if columns and column not in columns:
+            conn.execute(ADD_COLUMN.format(column, column_type))
+
+    conn.commit()
+
+    return conn
+
+
 def show_summary(conn: sqlite3.Connection) -> None:
     """Prints summary of all files in db"""
 
     print("=== Summary ===")
 
+    for status, count in conn.execute(STATUS_COUNTS):
+        print(f"{status:9}: {count}")
+
     src_bytes: int = conn.execute(TOTAL_SRC_BYTES).fetchone()[0]
     enc_bytes: int = conn.execute(TOTAL_ENC_BYTES).fetchone()[0]
 
+    if not src_bytes:
+        return
+
     print(f"src bytes: {bytes_to_human_readable(src_bytes)}")
     print(f"enc bytes: {bytes_to_human_readable(enc_bytes)}")
     print(f"ratio    : {enc_bytes * 100 / src_bytes:.2f}%")
 
+    slowest = conn.execute(SLOWEST, (SLOWEST_COUNT,)).fetchall()
 
-def process_batch(cmd, paths: Sequence[pathlib.Path], out_dir: pathlib.Path) -> None:
-    """Processes all files in batch"""
+    if slowest:
+        print("\n=== Slowest files ===")
 
-    out_dir.mkdir(exist_ok=True)
+        for name, speed, fps, bitrate_kbps in slowest:
+            print(f"{speed:6.2f}x {fps:7.1f} fps {bitrate_kbps:8.0f} kbps - {name}")
 
-    # remove existing db if any, since sqlite doesn't have truncate & no need for vacuum
-    db_path = out_dir / OUT_SIZE_DB
-    db_path.unlink(missing_ok=True)
+    hourly = conn.execute(HOURLY_THROUGHPUT).fetchall()
 
-    # open db connection & init
-    conn = sqlite3.connect(db_path)
-    conn.execute(DB_SCHEMA)
+    if hourly:
+        print("\n=== Throughput per hour ===")
+        print("hour             | files | content h | per-job speed | fps")
+
+        for hour, count, content_hours, speed, fps in hourly:
+            print(f"{hour} | {count:5} | {content_hours:9.2f} | {speed:12.2f}x | {fps:.1f}")
+
+
+def run_ffmpeg(args: Sequence[str], progress: Progress) -> tuple[int, str]:
+    """Runs ffmpeg with `-progress pipe:1`, feeding its output to progress as it arrives.
+
+    Returns:
+        (return code, last error lines) tuple
+    """
+
+    proc = subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf8",
+        errors="replace",
+    )
+
+    # drain stderr in background, so neither pipe blocks ffmpeg
+    errors: deque[str] = deque(maxlen=ERROR_LINES)
+    stderr_reader = threading.Thread(target=errors.extend, args=(proc.stderr,), daemon=True)
+    stderr_reader.start()
+
+    for line in proc.stdout:
+        progress.feed(line)
+
+    return_code = proc.wait()
+    stderr_reader.join()
+
+    return return_code, "".join(errors).rstrip()
+
+
+def encode(
+    cmd: Sequence[str], src_path: pathlib.Path, enc_path: pathlib.Path, threads: int, progress: Progress
+) -> tuple[int, str, float, float]:
+    """Encodes single file to `.part` file, then renames to enc_path when succeeded. Runs in worker thread.
+
+    Returns:
+        (return code, last error lines, start unix time, elapsed seconds) tuple
+    """
 
-    for idx, src_path in enumerate(paths, start=1):
-        print(f"=== Encoding {idx} / {len(paths)} ===")
+    part_path = enc_path.with_stem(enc_path.stem + PART_SUFFIX)
 
+    args = [
+        arg.format(src=src_path.as_posix(), dest=part_path.as_posix(), threads=threads)
+        for arg in cmd
+    ]
+
+    started = time.time()
+    progress.duration = probe_duration(src_path)
+
+    return_code, error = run_ffmpeg(args, progress)
+
+    if return_code == 0:
+        part_path.replace(enc_path)
+    else:
+        part_path.unlink(missing_ok=True)
+
+    return return_code, error, started, time.time() - started
+
+
+def process_batch(
+    cmd: Sequence[str],
+    paths: Sequence[pathlib.Path],
+    out_dir: pathlib.Path,
+    overwrite: bool,
+    jobs: int = JOBS,
+    threads: int = THREADS_PER_JOB,
+) -> None:
+    """Processes all files in batch, resuming from results db if any"""
+
+    out_dir.mkdir(exist_ok=True)
+
+    conn = open_db(out_dir / OUT_SIZE_DB)
+
+    # decide what to encode, in main thread as connection is bound to it
+    todo: list[tuple[pathlib.Path, pathlib.Path, os.stat_result]] = []
+
+    for src_path in paths:
+        src_stat = src_path.stat()
         enc_path = (out_dir / src_path.name).with_suffix(OUT_EXT)
 
-        proc = subprocess.run(
-            cmd.format(
-                src_path.as_posix(),
-                enc_path.as_posix(),
-            ),
-            shell=True,
-        )
+        row = conn.execute(FETCH_ROW, (src_path.name,)).fetchone()
 
-        src_size: int = src_path.stat().st_size
-        enc_size: int = 0
-        ratio: float = 0.0
-
-        if proc.returncode == 0:
-            enc_size = enc_path.stat().st_size
-            ratio = enc_size / src_size
-            print(f"=== Done ({ratio * 100.0:.2f}%) ===")
-
-        else:
-            print(f"=== Failed (code: {proc.returncode}) ===")
-
-        conn.execute(
-            INSERT_ROW,
-            (
-                idx,
-                src_path.name,
-                src_size,
-                enc_size,
-                ratio,
-            ),
-        )
+        if row == (src_stat.st_size, src_stat.st_mtime_ns, "done") and enc_path.exists():
+            continue
 
-    conn.commit()
+        # not ours to overwrite, unless told so
+        if row is None and enc_path.exists() and not overwrite:
+            print(f"=== Skipping {src_path.name}, output exists - pass -o to overwrite ===")
+            continue
+
+        todo.append((src_path, enc_path, src_stat))
+
+    print(f"=== {len(paths) - len(todo)} / {len(paths)} already done or skipped, encoding {len(todo)} ===")
+
+    executor = ThreadPoolExecutor(jobs)
+    futures: dict[Future, tuple[pathlib.Path, pathlib.Path, os.stat_result, Progress]] = {}
+
+    try:
+        with conn:
+            for src_path, enc_path, src_stat in todo:
+                conn.execute(MARK_QUEUED, (src_path.name, src_stat.st_size, src_stat.st_mtime_ns))
+
+        for src_path, enc_path, src_stat in todo:
+            progress = Progress(src_path.name)
+            future = executor.submit(encode, cmd, src_path, enc_path, threads, progress)
+            futures[future] = src_path, enc_path, src_stat, progress
+
+        pending = set(futures)
+        done_count = 0
+
+        while pending:
+            finished, pending = wait(pending, PROGRESS_INTERVAL, FIRST_COMPLETED)
+
+            if not finished:
+                print(f"=== Progress {done_count} / {len(todo)} ===")
+                for future in pending:
+                    if future.running():
+                        print(futures[future][-1])
+
+                continue
+
+            for future in finished:
+                done_count += 1
+                src_path, enc_path, src_stat, progress = futures[future]
+
+                return_code, error, started, elapsed = future.result()
+
+                enc_size = 0
+                ratio = 0.0
+                fps = speed = bitrate_kbps = None
+
+                if return_code == 0:
+                    enc_size = enc_path.stat().st_size
+                    ratio = enc_size / src_stat.st_size
+
+                    # whole-file averages rather than ffmpeg's last sample
+                    fps = progress.frame / elapsed
+                    if progress.duration:
+                        speed = progress.duration / elapsed
+                        bitrate_kbps = enc_size * 8 / progress.duration / 1000
+
+                    print(
+                        f"=== Done {done_count} / {len(todo)} - {src_path.name}"
+                        f" ({ratio * 100.0:.2f}%, {format_seconds(elapsed)}, {fps:.1f} fps, {speed or 0:.2f}x) ==="
+                    )
+
+                else:
+                    print(f"=== Failed {done_count} / {len(todo)} - {src_path.name} (code: {return_code}) ===")
+                    print(error)
+
+                with conn:
+                    conn.execute(
+                        MARK_FINISHED,
+                        (
+                            enc_size,
+                            ratio,
+                            "done" if return_code == 0 else "failed",
+                            return_code,
+                            started,
+                            elapsed,
+                            error,
+                            progress.duration,
+                            fps,
+                            speed,
+                            bitrate_kbps,
+                            src_path.name,
+                        ),
+                    )
+
+    finally:
+        # on Ctrl+C, unfinished jobs stay 'queued' in db to be redone next time
+        executor.shutdown(cancel_futures=True)
 
     show_summary(conn)
     conn.close()
@@ -167,18 +516,18 @@ def process_batch(cmd, paths: Sequence[pathlib.Path], out_dir: pathlib.Path) ->
 
 # --- Driver ---
 
-def main(paths: Sequence[pathlib.Path], overwrite: bool):
+def main(paths: Sequence[pathlib.Path], overwrite: bool, jobs: int = JOBS, threads: int = THREADS_PER_JOB):
 
     if not validate_path_type(paths):
         raise ValueError("All paths must be either file or folder")
 
-    cmd = FFMPEG_CMD if overwrite else FFMPEG_CMD.replace(" -y ", " -n ")
+    cmd = shlex.split(FFMPEG_CMD)
 
     if paths[0].is_file():
         print("=== Using batch file mode ===")
 
         process_batch(
-            cmd, filter_supported_ext(paths), (paths[0].parent / OUT_DIR_NAME)
+            cmd, filter_supported_ext(paths), (paths[0].parent / OUT_DIR_NAME), overwrite, jobs, threads
         )
 
     else:
@@ -189,6 +538,9 @@ def main(paths: Sequence[pathlib.Path], overwrite: bool):
                 cmd,
                 filter_supported_ext(p.iterdir()),
                 p.with_name(f"{p.name}_{OUT_DIR_NAME}"),
+                overwrite,
+                jobs,
+                threads,
             )
 
 
@@ -209,9 +561,17 @@ if __name__ == "__main__":
         "-o", "--overwrite", action="store_true", help="Overwrite existing files"
     )
 
+    _parser.add_argument(
+        "-j", "--jobs", type=int, default=JOBS, help="Number of concurrent ffmpeg jobs"
+    )
+
+    _parser.add_argument(
+        "-t", "--threads", type=int, default=THREADS_PER_JOB, help="Number of threads per ffmpeg job"
+    )
+
     try:
         _args = _parser.parse_args()
-        main(_args.video, _args.overwrite)
+        main(_args.video, _args.overwrite, _args.jobs, _args.threads)
         input("Press any key to exit:")
 
     except Exception as _err:
@@ -1,25 +1,86 @@
 """
 Batch validates video files using ffmpeg - which just actually is decoding and looking for errors.
 
+Runs multiple decodes concurrently (`-j`), optionally limiting each to software decoding with
+given threads (`-t`). Progress of running decodes (fps, speed & ETA) is read from ffmpeg's `-progress`
+output and printed periodically.
+
+Results - pass/fail, error count & last error lines - are kept in `ffmpeg_batch_validate.sqlite`
+next to this script. Files that passed before with same size & mtime are skipped,
+so re-validating big archive only decodes new or changed files. Pass `-f` to validate everything again.
+
 Requires FFMPEG
 
 :Author: jupiterbjy@gmail.com
 """
 
+import os
+import time
+import shlex
 import pathlib
 import argparse
+import datetime
+import threading
 import subprocess
 import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 from typing import Sequence, Iterable
 
 
 # --- Config ---
 
-FFMPEG_CMD = 'ffmpeg -v error -i "{}" -f null -'
+# Template is split into arguments before substitution, so paths need no quoting.
+FFMPEG_CMD = "ffmpeg -hide_banner -nostdin -v error -nostats -progress pipe:1 {budget} -i {src} -f null -"
+
+# Inserted as `{budget}` above when thread count is given
+THREAD_BUDGET_ARGS = "-hwaccel none -threads {threads}"
+
+FFPROBE_CMD = """
+ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 {src}
+""".strip()
 
 # Expecting all lowercase
 SUPPORTED_EXTS = {".mp4", ".mkv", ".avi"}
 
+# Number of last ffmpeg error lines to keep per file
+ERROR_LINES = 20
+
+# Concurrent decodes
+JOBS = max(1, (os.cpu_count() or 1) // 4)
+
+# Seconds between progress prints of running decodes
+PROGRESS_INTERVAL = 30
+
+DB_PATH = pathlib.Path(__file__).parent / "ffmpeg_batch_validate.sqlite"
+
+TABLE_NAME = "validation"
+
+DB_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    passed INTEGER,
+    return_code INTEGER,
+    error_count INTEGER,
+    errors TEXT,
+    validated REAL,
+    elapsed REAL,
+    duration REAL,
+    fps REAL,
+    speed REAL
+)
+"""
+
+FETCH_ROW = f"""
+SELECT size, mtime_ns, passed FROM {TABLE_NAME} WHERE path = ?
+"""
+
+UPSERT_ROW = f"""
+INSERT OR REPLACE INTO {TABLE_NAME} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
 
 # --- Logic ---
 
@@ -30,23 +91,267 @@ def filter_supported_ext(paths: Iterable[pathlib.Path]) -> list[pathlib.Path]:
     return [p for p in paths if p.suffix.lower() in SUPPORTED_EXTS]
 
 
-def main(paths: Sequence[pathlib.Path]):
+def format_seconds(seconds: float | None) -> str:
+    """Formats seconds as H:MM:SS"""
+
+    if seconds is None:
+        return "?"
+
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+def probe_duration(src_path: pathlib.Path) -> float | None:
+    """Returns media duration in seconds via ffprobe, None if unknown"""
+
+    args = [arg.format(src=src_path.as_posix()) for arg in shlex.split(FFPROBE_CMD)]
+
+    try:
+        proc = subprocess.run(args, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+        return float(proc.stdout.strip())
+
+    except (OSError, ValueError):
+        return None
+
+
+class Progress:
+    """Latest state of single ffmpeg job, parsed from `-progress` output"""
+
+    __slots__ = ("name", "duration", "out_time", "frame", "fps", "speed")
+
+    def __init__(self, name: str):
+        self.name = name
+
+        # source duration, filled by job once probed
+        self.duration: float | None = None
+
+        self.out_time = 0.0
+        self.frame = 0
+        self.fps = 0.0
+        self.speed = 0.0
+
+    def feed(self, line: str):
+        """Parses single `key=value` line. Values are N/A until ffmpeg knows them."""
+
+        key, _, value = line.strip().partition("=")
+
+        try:
+            match key:
+                case "out_time_us":
+                    self.out_time = int(value) / 1_000_000
+                case "frame":
+                    self.frame = int(value)
+                case "fps":
+                    self.fps = float(value)
+                case "speed":
+                    self.speed = float(value.rstrip("x"))
+
+        except ValueError:
+            pass
+
+    def eta(self) -> float | None:
+        if not (self.duration and self.speed):
+            return None
+
+        return max(self.duration - self.out_time, 0) / self.speed
+
+    def __str__(self):
+        percent = f"{self.out_time * 100 / self.duration:5.1f}%" if self.duration else "  ?  %"
+
+        return (
+            f"{percent} {self.fps:6.1f} fps {self.speed:5.2f}x"
+            f" ETA {format_seconds(self.eta())} - {self.name}"
+        )
+
+
+class _ErrorLines:
+    """Counts all lines while keeping only last few"""
+
+    __slots__ = ("count", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.last: deque[str] = deque(maxlen=ERROR_LINES)
+
+    def consume(self, lines: Iterable[str]):
+        for line in lines:
+            self.count += 1
+            self.last.append(line.rstrip())
+
+
+def run_ffmpeg(args: Sequence[str], progress: Progress) -> tuple[int, _ErrorLines]:
+    """Runs ffmpeg with `-progress pipe:1`, feeding its output to progress as it arrives.
+
+    Returns:
+        (return code, error lines) tuple
+    """
+
+    proc = subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf8",
+        errors="replace",
+    )
+
+    # drain stderr in background, so neither pipe blocks ffmpeg
+    errors = _ErrorLines()
+    stderr_reader = threading.Thread(target=errors.consume, args=(proc.stderr,), daemon=True)
+    stderr_reader.start()
+
+    for line in proc.stdout:
+        progress.feed(line)
+
+    return_code = proc.wait()
+    stderr_reader.join()
+
+    return return_code, errors
+
+
+def validate(file: pathlib.Path, cmd: Sequence[str], progress: Progress) -> tuple[int, _ErrorLines, float]:
+    """Decodes single file. Runs in worker thread.
+
+    Returns:
+        (return code, error lines, elapsed seconds) tuple
+    """
+
+    started = time.perf_counter()
+    progress.duration = probe_duration(file)
+
+    return_code, errors = run_ffmpeg([arg.format(src=file.as_posix()) for arg in cmd], progress)
+
+    return return_code, errors, time.perf_counter() - started
+
+
+def build_cmd(threads: int) -> list[str]:
+    """Splits ffmpeg command template, filling thread budget if any"""
+
+    budget = shlex.split(THREAD_BUDGET_ARGS.format(threads=threads)) if threads > 0 else []
 
-    files: list[pathlib.Path] = []
+    cmd = []
+    for arg in shlex.split(FFMPEG_CMD):
+        if arg == "{budget}":
+            cmd.extend(budget)
+        else:
+            cmd.append(arg)
+
+    return cmd
+
+
+def main(
+    paths: Sequence[pathlib.Path],
+    jobs: int = JOBS,
+    threads: int = 0,
+    force: bool = False,
+    db_path: pathlib.Path = DB_PATH,
+):
+
+    # absolute & deduplicated, as same file may be given both directly & via its folder
+    files: dict[pathlib.Path, None] = {}
     for p in paths:
-        files.extend(filter_supported_ext(p.iterdir()))
+        found = filter_supported_ext(p.iterdir() if p.is_dir() else [p])
+        files.update(dict.fromkeys(f.absolute() for f in found))
+
+    conn = sqlite3.connect(db_path)
+    conn.execute(DB_SCHEMA)
+    conn.commit()
+
+    # skip ones that passed & haven't changed since
+    todo: list[tuple[pathlib.Path, os.stat_result]] = []
+
+    for file in files:
+        stat = file.stat()
+
+        row = conn.execute(FETCH_ROW, (file.as_posix(),)).fetchone()
+        if not force and row == (stat.st_size, stat.st_mtime_ns, 1):
+            continue
+
+        todo.append((file, stat))
+
+    print(f"=== {len(files) - len(todo)} / {len(files)} passed before & unchanged, validating {len(todo)} ===")
+
+    cmd = build_cmd(threads)
+    executor = ThreadPoolExecutor(jobs)
+    futures: dict[Future, tuple[pathlib.Path, os.stat_result, Progress]] = {}
+    failed: list[tuple[pathlib.Path, int, int]] = []
+
+    try:
+        for file, stat in todo:
+            progress = Progress(file.name)
+            futures[executor.submit(validate, file, cmd, progress)] = file, stat, progress
+
+        pending = set(futures)
+        done_count = 0
+
+        while pending:
+            finished, pending = wait(pending, PROGRESS_INTERVAL, FIRST_COMPLETED)
+
+            if not finished:
+                print(f"=== Progress {done_count} / {len(todo)} ===")
+                for future in pending:
+                    if future.running():
+                        print(futures[future][-1])
+
+                continue
+
+            for future in finished:
+                done_count += 1
+                file, stat, progress = futures[future]
+
+                return_code, errors, elapsed = future.result()
+                passed = return_code == 0 and errors.count == 0
+
+                fps = progress.frame / elapsed
+                speed = progress.duration / elapsed if progress.duration else None
+
+                if passed:
+                    print(
+                        f"=== Passed {done_count} / {len(todo)} - {file.name}"
+                        f" ({format_seconds(elapsed)}, {fps:.1f} fps, {speed or 0:.2f}x) ==="
+                    )
+
+                else:
+                    failed.append((file, return_code, errors.count))
+
+                    print(
+                        f"=== Failed {done_count} / {len(todo)} - {file.name}"
+                        f" (code {return_code}, {errors.count} error lines) ==="
+                    )
+                    print("\n".join(errors.last))
+
+                with conn:
+                    conn.execute(
+                        UPSERT_ROW,
+                        (
+                            file.as_posix(),
+                            stat.st_size,
+                            stat.st_mtime_ns,
+                            int(passed),
+                            return_code,
+                            errors.count,
+                            "\n".join(errors.last),
+                            time.time(),
+                            elapsed,
+                            progress.duration,
+                            fps,
+                            speed,
+                        ),
+                    )
 
-    for idx, file in enumerate(files, start=1):
+    finally:
+        executor.shutdown(cancel_futures=True)
+        conn.close()
 
-        print(f"\n\n=== Validating {idx} / {len(files)} ===")
+    print(f"\n=== Summary - {len(todo) - len(failed)} passed, {len(failed)} failed ===")
 
-        print(f"File: '{file.as_posix()}'")
-        subprocess.run(FFMPEG_CMD.format(file.as_posix()), shell=True)
+    for file, return_code, error_count in failed:
+        print(f"code {return_code:3}, {error_count:5} error lines - {file.as_posix()}")
 
 
 if __name__ == "__main__":
     _parser = argparse.ArgumentParser(
-        description="Convert batch files to av1 codec for storage saving."
+        description="Batch validates video files by decoding them."
     )
 
     _parser.add_argument(
@@ -54,12 +359,32 @@ if __name__ == "__main__":
         metavar="VID",
         type=pathlib.Path,
         nargs="+",
-        help="Video files to convert. Must be either all files or all folders.",
+        help="Video files or folders containing them to validate.",
+    )
+
+    _parser.add_argument(
+        "-j", "--jobs", type=int, default=JOBS, help="Number of concurrent decodes"
+    )
+
+    _parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        default=0,
+        help="Threads per decode, also disables hardware decoding. 0 leaves both to ffmpeg.",
+    )
+
+    _parser.add_argument(
+        "-f", "--force", action="store_true", help="Validate files that passed before too"
+    )
+
+    _parser.add_argument(
+        "-d", "--db", type=pathlib.Path, default=DB_PATH, help="Path to results db"
     )
 
     try:
         _args = _parser.parse_args()
-        main(_args.video)
+        main(_args.video, _args.jobs, _args.threads, _args.force, _args.db)
         input("Press any key to exit:")
 
     except Exception as _err:
@@ -1,6 +1,10 @@
 """
 Embeds file inside jpg metadata. Any decent unzipper can open as zip.
 
+Zip is written right after the image into output file straight from source files, so payload isn't copied
+to temp dir or memory - multi-GB payloads are fine, ZIP64 included.
+Optionally reads small files ahead in parallel with `-j`, which helps with many small files on slow storage.
+
 `pip install pillow`
 
 Check usage by executing without parameters.
@@ -12,13 +16,16 @@ Check usage by executing without parameters.
 :Author: jupiterbjy@gmail.com
 """
 
-from collections.abc import MutableSequence, Sequence
+from collections import deque
+from collections.abc import MutableSequence, Sequence, Iterator
+from concurrent.futures import ThreadPoolExecutor, Future
 from io import BytesIO
 import argparse
+import os
 import shutil
-import tempfile
 import pathlib
 import time
+import zipfile
 
 from PIL import Image, ImageDraw, ImageFont
 
@@ -34,6 +41,13 @@ FONT_NAMES = ["not_existing_font_test.ttf", "malgunsl.ttf", "arial.ttf"]
 
 OUTPUT_IMAGE = pathlib.Path(__file__).parent.joinpath(f"output_{time.time_ns()}.png")
 
+# Read size when streaming file into zip
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Only files up to this size are read ahead in parallel, as they're held in memory meanwhile.
+# Larger ones are streamed in main thread.
+PARALLEL_MAX_SIZE = 16 * 1024 * 1024
+
 
 # --- Font Load ---
 
@@ -101,69 +115,114 @@ def generate_placeholder_img_from_paths(paths: Sequence[pathlib.Path]) -> BytesI
     return data
 
 
-def create_zip_archive(paths: Sequence[pathlib.Path]) -> BytesIO:
+def iter_zip_entries(paths: Sequence[pathlib.Path]) -> Iterator[tuple[pathlib.Path, str]]:
+    """Yields files & directories to zip with their archive name, each path placed at archive root.
+
+    Yields:
+        (path, archive name) tuple
     """
-    Zips files at given path using temp directories.
 
-    Args:
-        paths: File paths to compress
+    for path in paths:
+        print(path)
+        yield path, path.name
+
+        if not path.is_dir():
+            continue
+
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names.sort()
+            dir_path = pathlib.Path(dir_path)
+            arc_dir = dir_path.relative_to(path.parent).as_posix()
+
+            for name in dir_names:
+                yield dir_path / name, f"{arc_dir}/{name}"
+
+            for name in sorted(file_names):
+                yield dir_path / name, f"{arc_dir}/{name}"
+
+
+def read_file(params: tuple[pathlib.Path, str]) -> tuple[pathlib.Path, str, bytes | None]:
+    """Thread task reading small file into memory ahead of main thread.
 
     Returns:
-        BytesIO containing compressed zip file
+        (path, archive name, file data) tuple. Data is None if entry should be streamed by `write_file` instead.
     """
 
-    cache = BytesIO()
+    path, arc_name = params
 
-    # create temp dir to copy all requested files into
-    with tempfile.TemporaryDirectory("IMG_ZIP_EMBED") as tmp_copy_str:
-        tmp_copy_dir = pathlib.Path(tmp_copy_str)
+    if not path.is_file() or path.stat().st_size > PARALLEL_MAX_SIZE:
+        return path, arc_name, None
 
-        # copy all files to temp dir
-        for path in paths:
-            print(path)
-            if path.is_dir():
-                shutil.copytree(path, tmp_copy_dir.joinpath(path.name))
-            else:
-                shutil.copyfile(path, tmp_copy_dir.joinpath(path.name))
+    return path, arc_name, path.read_bytes()
 
-        # create another to completely eliminate any possible name overlap
-        with tempfile.TemporaryDirectory("ZIP_EMBED_OUTPUT") as tmp_out_str:
-            tmp_out_dir = pathlib.Path(tmp_out_str)
 
-            # create zip file
-            shutil.make_archive(
-                tmp_out_dir.joinpath("output").as_posix(), "zip", tmp_copy_dir
-            )
+def write_data(archive: zipfile.ZipFile, path: pathlib.Path, arc_name: str, data: bytes):
+    """Deflates file already read by `read_file` into archive."""
+
+    zinfo = zipfile.ZipInfo.from_file(path, arc_name)
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
 
-            # now copy to memory
-            with open(tmp_out_dir.joinpath("output.zip"), "rb") as fp:
-                while data := fp.read(4096):
-                    cache.write(data)
+    with archive.open(zinfo, "w") as dest:
+        dest.write(data)
 
-    # now all temp are clear. Return the data
-    return cache
 
+def write_file(archive: zipfile.ZipFile, path: pathlib.Path, arc_name: str):
+    """Streams single file or directory entry into archive"""
 
-def embed_to_image(image_file: BytesIO, zipped_file: BytesIO):
-    """Embed zipped file to image file.
+    zinfo = zipfile.ZipInfo.from_file(path, arc_name)
+
+    if zinfo.is_dir():
+        zinfo.compress_size = 0
+        zinfo.CRC = 0
+        archive.mkdir(zinfo)
+        return
+
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+
+    # set explicitly, so sizes over 4GiB get zip64 local header from start
+    with (
+        path.open("rb") as src,
+        archive.open(zinfo, "w", force_zip64=zinfo.file_size > zipfile.ZIP64_LIMIT) as dest,
+    ):
+        shutil.copyfileobj(src, dest, COPY_CHUNK_SIZE)
+
+
+def write_zip_archive(fp, paths: Sequence[pathlib.Path], jobs: int):
+    """Writes zip of given paths into file object at current position.
 
     Args:
-        image_file: In-memory image file
-        zipped_file: In-memory zip file
+        fp: Seekable binary file object to write into
+        paths: File & directory paths to compress
+        jobs: Number of threads reading small files ahead. 1 to stream everything in main thread.
     """
-    # reset zip cursor to start
-    zipped_file.seek(0)
 
-    # write zip to image file
-    while data := zipped_file.read(4096):
-        image_file.write(data)
+    with zipfile.ZipFile(fp, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        if jobs <= 1:
+            for path, arc_name in iter_zip_entries(paths):
+                write_file(archive, path, arc_name)
+
+            return
 
-    image_file.seek(0)
+        # keep limited number of read files in memory, written in order
+        pending: deque[Future] = deque()
 
-    # save as image with timestamp as name
-    with OUTPUT_IMAGE.open("wb") as fp:
-        while data := image_file.read(4096):
-            fp.write(data)
+        def write_oldest():
+            path, arc_name, data = pending.popleft().result()
+
+            if data is None:
+                write_file(archive, path, arc_name)
+            else:
+                write_data(archive, path, arc_name, data)
+
+        with ThreadPoolExecutor(jobs) as executor:
+            for path, arc_name in iter_zip_entries(paths):
+                pending.append(executor.submit(read_file, (path, arc_name)))
+
+                if len(pending) >= jobs * 2:
+                    write_oldest()
+
+            while pending:
+                write_oldest()
 
 
 def extract_disguise_image(paths: MutableSequence[pathlib.Path]) -> BytesIO | None:
@@ -187,31 +246,32 @@ def extract_disguise_image(paths: MutableSequence[pathlib.Path]) -> BytesIO | No
     return None
 
 
-def write_embedded_image(paths: Sequence[pathlib.Path]):
+def write_embedded_image(paths: Sequence[pathlib.Path], jobs: int = 1):
     """Write payload embedded image to disk.
 
     Args:
         paths: Files to embed inside image, optionally containing disguise image.
+        jobs: Number of threads reading small files ahead in parallel.
     """
 
+    paths = list(paths)
     OUTPUT_IMAGE.touch()
 
     try:
         # check if we have thumbnail image
-        disguise_img_bytes_io = extract_disguise_image(args.files)
+        disguise_img_bytes_io = extract_disguise_image(paths)
 
         # if not create one
         if disguise_img_bytes_io is None:
             print(
                 f"Disguise image with stem '{DISGUISE_IMG_STEM}' not found. Generating placeholder."
             )
-            disguise_img_bytes_io = generate_placeholder_img_from_paths(args.files)
-
-        # create in-memory zip archive
-        zip_bytes_io = create_zip_archive(args.files)
+            disguise_img_bytes_io = generate_placeholder_img_from_paths(paths)
 
-        # create image from zip archive and thumbnail
-        embed_to_image(disguise_img_bytes_io, zip_bytes_io)
+        # write image then zip right after it, single pass
+        with OUTPUT_IMAGE.open("wb") as fp:
+            fp.write(disguise_img_bytes_io.getvalue())
+            write_zip_archive(fp, paths, jobs)
 
     except Exception:
         # operation failed, remove touched img file
@@ -242,5 +302,13 @@ if __name__ == "__main__":
         f"If not found, will generate placeholder image.",
     )
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help=f"Number of threads reading files up to {PARALLEL_MAX_SIZE // 1024 // 1024}MiB ahead in parallel.",
+    )
+
     args = parser.parse_args()
-    write_embedded_image(args.files)
+    write_embedded_image(args.files, args.jobs)
@@ -36,7 +36,7 @@ Drag dropping on script requires proper handler.
 """.lstrip()
 
 SKIP_LINE_STARTING_WITH = ":"
-DOCS_REGEX = re.compile(r'^"""([\s\S]*?)"""')
+DOCS_REGEX = re.compile(r'^r?"""([\s\S]*?)"""')
 ENCODING = "utf8"
 
 FORMAT = """
@@ -1,7 +1,17 @@
 """
 Remove alpha channel from gif image, replacing it with desired color.
 
-`pip install pillow`
+Files are processed in parallel over process pool, and frames are streamed into output gif one by one -
+so long animated WebPs don't need every frame in memory. Only changed area of each frame is written,
+and identical frames are merged, like Pillow does.
+
+By default all frames are quantized to single global palette built from frames sampled across the image,
+which is faster & smaller. Pass `-l` to give each frame its own palette instead, for images that change
+colors a lot.
+
+`numpy` is optional, but makes compositing faster.
+
+`pip install pillow numpy`
 
 :Author: jupiterbjy@gmail.com
 """
@@ -9,10 +19,16 @@ Remove alpha channel from gif image, replacing it with desired color.
 import argparse
 import pathlib
 from collections.abc import Generator
-from typing import Sequence, Tuple, Any, List
+from multiprocessing.pool import Pool
+from typing import BinaryIO, Sequence, Tuple, Any, List
 from ast import literal_eval
 
-from PIL import Image, ImageSequence
+from PIL import Image, ImageChops, ImageSequence, GifImagePlugin
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # --- Config ---
 
@@ -27,6 +43,12 @@ SUFFIX_WHITELIST = {
 
 OUTPUT_SUFFIX = ".gif"
 
+# Number of frames sampled across image for building global palette
+PALETTE_SAMPLE_FRAMES = 8
+
+# Sampled frames are shrunk to this height at most before building palette
+PALETTE_SAMPLE_HEIGHT = 256
+
 
 # --- Utilities ---
 
@@ -60,66 +82,205 @@ def rgb_to_hex(color: Tuple[int, int, int], prefix: str = "#") -> str:
 # --- Logics ---
 
 
-def remove_bg(img_path: pathlib.Path, bg_color=(0, 0, 0), speed_multiplier=1.0):
-    """
-    Open & convert image to RGB with given background color
+class Compositor:
+    """Composites frames onto single shared background color"""
 
-    Args:
-        img_path: Image path
-        bg_color: Background color to overlay image onto
-        speed_multiplier: Speed multiplier
+    def __init__(self, bg_color: Tuple[int, int, int]):
+        self.bg_color = bg_color
+
+        # allocated once per size for pillow fallback
+        self._bg_img: Image.Image | None = None
+
+        if np is not None:
+            self._bg_arr = np.array(bg_color, dtype=np.uint16)
+
+    def __call__(self, frame: Image.Image) -> Image.Image:
+        rgba = frame.convert("RGBA")
+
+        if np is None:
+            if self._bg_img is None or self._bg_img.size != rgba.size:
+                self._bg_img = Image.new("RGB", rgba.size, self.bg_color)
+
+            composited = self._bg_img.copy()
+            composited.paste(rgba, mask=rgba)
+            return composited
+
+        arr = np.asarray(rgba)
+        alpha = arr[..., 3:].astype(np.uint16)
+
+        # bg * (1 - a) + fg * a, in integer - max 255 * 255 + 127 fits in uint16
+        blended = (arr[..., :3] * alpha + self._bg_arr * (255 - alpha) + 127) // 255
+        return Image.fromarray(blended.astype(np.uint8), "RGB")
+
+
+def build_palette(img_path: pathlib.Path, compositor: Compositor) -> Image.Image:
+    """Builds 256 color palette image from frames sampled evenly across image.
 
     Returns:
-        Background overlaid image
+        P mode image to pass to `Image.quantize(palette=...)`
     """
 
-    print("Processing", img_path)
+    with Image.open(img_path) as img:
+        n_frames = getattr(img, "n_frames", 1)
+        step = max(n_frames // PALETTE_SAMPLE_FRAMES, 1)
+
+        samples: List[Image.Image] = []
+
+        for idx in range(0, n_frames, step)[:PALETTE_SAMPLE_FRAMES]:
+            img.seek(idx)
+            sample = compositor(img)
+            sample.thumbnail((sample.width, PALETTE_SAMPLE_HEIGHT))
+            samples.append(sample)
+
+    # stack vertically & quantize as single image
+    sheet = Image.new("RGB", (max(s.width for s in samples), sum(s.height for s in samples)))
+
+    y = 0
+    for sample in samples:
+        sheet.paste(sample, (0, y))
+        y += sample.height
+
+    return sheet.quantize(256)
+
+
+class GifStreamWriter:
+    """Writes gif frame by frame, keeping only previous frame around.
+
+    Only area changed from previous frame is written, and identical frames are merged into one
+    by adding up duration - so single frame is held back until next frame arrives.
+    """
+
+    def __init__(self, fp: BinaryIO, palette: Image.Image | None):
+        """
+        Args:
+            fp: Binary file to write into
+            palette: Global palette image from `build_palette`. If None, each frame gets own palette.
+        """
+
+        self.fp = fp
+        self.palette = palette
+
+        self._prev: Image.Image | None = None
+
+        # (quantized frame or changed area of it, offset, duration)
+        self._pending: Tuple[Image.Image, Tuple[int, int], int] | None = None
+        self._header_written = False
+
+    def _quantize(self, rgb: Image.Image) -> Image.Image:
+        if self.palette is None:
+            return rgb.convert("P", palette=Image.Palette.ADAPTIVE)
 
-    gif_img = Image.open(img_path)
-    img_iterator = ImageSequence.Iterator(gif_img)
+        return rgb.quantize(palette=self.palette, dither=Image.Dither.NONE)
 
-    durations: List[int] = []
-    converted_frames: List[Image.Image] = []
+    def _flush(self):
+        if self._pending is None:
+            return
 
-    for frame in img_iterator:
+        frame, offset, duration = self._pending
 
-        bg_img = Image.new("RGBA", frame.size, bg_color)
+        if not self._header_written:
+            # first frame is always full size, so it decides canvas size
+            header, _ = GifImagePlugin.getheader(frame, info={"loop": 0, "duration": duration})
+            self.fp.writelines(header)
+            self._header_written = True
 
-        # Overlay the original image onto the black background
-        converted_frames.append(
-            Image.alpha_composite(bg_img, frame.convert("RGBA")).convert("RGB")
+        self.fp.writelines(
+            GifImagePlugin.getdata(
+                frame, offset, duration=duration, include_color_table=self.palette is None
+            )
         )
 
-        # in web. Only after accessing frame data it's loaded 'duration' is exposed.
-        durations.append(max(frame.info["duration"] // speed_multiplier, 1))
+    def add(self, rgb: Image.Image, duration: int):
+        """Adds composited RGB frame"""
+
+        if self._prev is None:
+            bbox = (0, 0, *rgb.size)
+        else:
+            bbox = ImageChops.difference(rgb, self._prev).getbbox()
+
+            if bbox is None:
+                frame, offset, pending_duration = self._pending
+                self._pending = frame, offset, pending_duration + duration
+                return
+
+        self._flush()
+
+        self._pending = self._quantize(rgb.crop(bbox)), bbox[:2], duration
+        self._prev = rgb
+
+    def close(self):
+        self._flush()
+        self.fp.write(b";")
+
+
+def remove_bg(
+    img_path: pathlib.Path, bg_color=(0, 0, 0), speed_multiplier=1.0, local_palette=False
+):
+    """
+    Open & convert image to RGB with given background color, then save as gif in output dir.
+
+    Args:
+        img_path: Image path
+        bg_color: Background color to overlay image onto
+        speed_multiplier: Speed multiplier
+        local_palette: Whether to give each frame own palette instead of global one
+    """
+
+    print("Processing", img_path)
+
+    compositor = Compositor(bg_color)
+    palette = None if local_palette else build_palette(img_path, compositor)
 
     new_name = img_path.with_stem(
         img_path.stem + f"_{rgb_to_hex(bg_color, 'bg')}_x{speed_multiplier}"
     )
+    out_path = OUTPUT_DIR / new_name.with_suffix(OUTPUT_SUFFIX).name
 
-    # combine to gif
-    converted_frames[0].save(
-        str(OUTPUT_DIR / new_name.with_suffix(OUTPUT_SUFFIX).name),
-        save_all=True,
-        loop=0,
-        append_images=converted_frames[1:],
-        duration=durations,
-    )
+    try:
+        with Image.open(img_path) as gif_img, out_path.open("wb") as fp:
+            writer = GifStreamWriter(fp, palette)
+
+            for frame in ImageSequence.Iterator(gif_img):
+                # Overlay the original image onto the background
+                composited = compositor(frame)
+
+                # in web. Only after accessing frame data it's loaded 'duration' is exposed.
+                writer.add(composited, int(max(frame.info["duration"] // speed_multiplier, 1)))
+
+            writer.close()
+
+    except Exception:
+        out_path.unlink(missing_ok=True)
+        raise
+
+
+def _task(params: Tuple[pathlib.Path, Tuple[int, int, int], float, bool]) -> str | None:
+    """Process pool task, returns error message if any."""
+
+    try:
+        remove_bg(*params)
+
+    except Exception as err:
+        return f"{params[0]} - {err}"
+
+    return None
 
 
 def _main(
     img_paths: Sequence[pathlib.Path],
     bg_color: Tuple[int, int, int],
     speed_multiplier: float,
+    local_palette: bool = False,
+    workers: int | None = None,
 ):
     OUTPUT_DIR.mkdir(exist_ok=True)
 
-    for path in img_paths:
-        try:
-            remove_bg(path, bg_color, speed_multiplier)
+    jobs = [(path, bg_color, speed_multiplier, local_palette) for path in img_paths]
 
-        except Exception as err:
-            print(err)
+    with Pool(workers) as pool:
+        for error in pool.imap_unordered(_task, jobs):
+            if error is not None:
+                print(error)
 
 
 if __name__ == "__main__":
@@ -144,6 +305,19 @@ if __name__ == "__main__":
         default=1.0,
         help="gif play speed multiplier",
     )
+    _parser.add_argument(
+        "-l",
+        "--local-palette",
+        action="store_true",
+        help="Give each frame own palette instead of single global one",
+    )
+    _parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes, defaults to number of cores",
+    )
 
     _args = _parser.parse_args()
     try:
@@ -160,4 +334,4 @@ if __name__ == "__main__":
             _p for _p in _extract_path(_path) if _p.suffix.lower() in SUFFIX_WHITELIST
         )
 
-    _main(_paths, _args.color, _args.speed_multiplier)
+    _main(_paths, _args.color, _args.speed_multiplier, _args.local_palette, _args.workers)
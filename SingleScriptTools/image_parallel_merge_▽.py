@@ -1,6 +1,11 @@
 """
 Merges multiple images into one big tiled image with desired height & width ratio.
 
+Images are decoded in parallel a row ahead and pasted one row at a time, so only a row worth of
+images are in memory besides the canvas. For huge merges, canvas itself can be skipped too by writing PNG
+in row strips (`-s`, or automatically past `STREAM_MIN_PIXELS`), keeping peak memory about one row.
+Streamed PNG isn't filtered, so it's somewhat larger than the regular one.
+
 `pillow-avif-plugin` is optional, but recommended for AVIF support.
 
 `pip install pillow, pillow-avif-plugin`
@@ -13,9 +18,13 @@ Merges multiple images into one big tiled image with desired height & width rati
 import pathlib
 import argparse
 import itertools
+import struct
 import time
 import math
-from typing import List, Tuple
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import BinaryIO, Iterator, List, Tuple
 
 from PIL import Image
 
@@ -32,6 +41,17 @@ MAX_XY_RATIO = 1.5
 
 ROOT = pathlib.Path(__file__).parent
 
+# Decoder threads - Pillow releases GIL while decoding
+WORKERS = 8
+
+# Merged images with more pixels than this are written in row strips instead of whole canvas.
+# 100M pixels is about 400MB of RGBA canvas.
+STREAM_MIN_PIXELS = 100_000_000
+
+# zlib level & max IDAT chunk size for streamed PNG
+STREAM_COMPRESS_LEVEL = 6
+STREAM_CHUNK_SIZE = 1024 * 1024
+
 # ---------------------------------------------
 
 
@@ -68,32 +88,143 @@ def calculate_row_col_size(x_size, y_size, image_counts) -> Tuple[int, int]:
     return final_col_size, final_row_size
 
 
-def main():
-    # load images - consider input is all fine.
-    images: List[Image.Image] = [
-        Image.open(path_).convert("RGBA") for path_ in args.images
-    ]
+def read_size(path: pathlib.Path) -> Tuple[int, int]:
+    """Reads image size from header without decoding"""
+
+    with Image.open(path) as image:
+        return image.size
+
+
+def load_rgba(path: pathlib.Path) -> Image.Image:
+    """Decodes image as RGBA"""
+
+    with Image.open(path) as image:
+        return image.convert("RGBA")
+
+
+def row_band_gen(
+    paths: List[pathlib.Path],
+    col: int,
+    x_max: int,
+    y_max: int,
+    executor: ThreadPoolExecutor,
+) -> Iterator[Image.Image]:
+    """Yields each row of tiles as a band image, decoding next row in background meanwhile.
+
+    Args:
+        paths: Image paths in tile order
+        col: Number of images per row
+        x_max: Tile width
+        y_max: Tile height
+        executor: Decoder thread pool
+
+    Yields:
+        (col * x_max, y_max) sized RGBA band
+    """
+
+    rows = (paths[idx:idx + col] for idx in range(0, len(paths), col))
+    pending: deque[List[Future]] = deque()
+
+    # keep current & next row in flight
+    for row_paths in itertools.islice(rows, 2):
+        pending.append([executor.submit(load_rgba, path_) for path_ in row_paths])
+
+    while pending:
+        futures = pending.popleft()
+
+        for row_paths in itertools.islice(rows, 1):
+            pending.append([executor.submit(load_rgba, path_) for path_ in row_paths])
+
+        band = Image.new("RGBA", (col * x_max, y_max))
+
+        for x, future in enumerate(futures):
+            band.paste(future.result(), (x_max * x, 0))
+
+        yield band
+
+
+def _write_png_chunk(file: BinaryIO, chunk_type: bytes, data: bytes):
+    file.write(struct.pack(">I", len(data)))
+    file.write(chunk_type)
+    file.write(data)
+    file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
 
-    # find the largest image dimension for each axis
-    x_max = max(image.size[0] for image in images)
-    y_max = max(image.size[1] for image in images)
 
-    # get row col size
-    col, row = calculate_row_col_size(x_max, y_max, len(images))
+def save_png_streamed(path: pathlib.Path, size: Tuple[int, int], bands: Iterator[Image.Image]):
+    """Writes RGBA PNG from bands of rows, without ever holding whole image.
+    Scanlines are left unfiltered, as filtering in python per row is way too slow.
 
-    # with that image per line counter, create new image.
-    new_empty = Image.new("RGBA", (col * x_max, row * y_max))
+    Args:
+        path: Output path
+        size: Whole image size
+        bands: RGBA images with full width, top to bottom, summing up to whole height
+    """
+
+    width, height = size
+    stride = width * 4
+
+    compressor = zlib.compressobj(STREAM_COMPRESS_LEVEL)
+    written_rows = 0
+
+    with path.open("wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n")
+
+        # 8bit depth, RGBA, deflate, adaptive filtering, no interlace
+        _write_png_chunk(file, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+
+        pending = bytearray()
+
+        for band in bands:
+            raw = band.tobytes()
+
+            # filter type 0 per scanline
+            pending += compressor.compress(
+                b"".join(b"\x00" + raw[idx:idx + stride] for idx in range(0, len(raw), stride))
+            )
+            written_rows += band.height
+
+            while len(pending) >= STREAM_CHUNK_SIZE:
+                _write_png_chunk(file, b"IDAT", bytes(pending[:STREAM_CHUNK_SIZE]))
+                del pending[:STREAM_CHUNK_SIZE]
+
+        pending += compressor.flush()
+        _write_png_chunk(file, b"IDAT", bytes(pending))
+        _write_png_chunk(file, b"IEND", b"")
 
-    # prepare iterator for tile ordering
-    x_iter = itertools.cycle((n for n in range(col)))
-    y_iter = (n // col for n in range(col * row))
+    if written_rows != height:
+        raise ValueError(f"Expected {height} rows but bands had {written_rows}")
 
-    # paste image
-    for image, x, y in zip(images, x_iter, y_iter):
-        new_empty.paste(image, (x_max * x, y_max * y))
 
-    # save
-    new_empty.save(ROOT / f"{int(time.time())}_merged_{len(images)}.png")
+def main(images: List[pathlib.Path], stream: bool, workers: int):
+    # read sizes from headers only - consider input is all fine.
+    with ThreadPoolExecutor(workers) as executor:
+        sizes = list(executor.map(read_size, images))
+
+        # find the largest image dimension for each axis
+        x_max = max(size[0] for size in sizes)
+        y_max = max(size[1] for size in sizes)
+
+        # get row col size
+        col, row = calculate_row_col_size(x_max, y_max, len(images))
+        size = (col * x_max, row * y_max)
+
+        out_path = ROOT / f"{int(time.time())}_merged_{len(images)}.png"
+        bands = row_band_gen(images, col, x_max, y_max, executor)
+
+        if stream or size[0] * size[1] > STREAM_MIN_PIXELS:
+            print(f"Streaming {size[0]}x{size[1]} image in rows")
+            save_png_streamed(out_path, size, bands)
+            return
+
+        # with that image per line counter, create new image.
+        new_empty = Image.new("RGBA", size)
+
+        # paste each row
+        for y, band in enumerate(bands):
+            new_empty.paste(band, (0, y_max * y))
+
+        # save
+        new_empty.save(out_path)
 
 
 if __name__ == "__main__":
@@ -105,7 +236,20 @@ if __name__ == "__main__":
         nargs="+",
         help="Images to merge with.",
     )
+    parser.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Write PNG in row strips regardless of size, keeping memory usage about a row of images.",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="Number of decoder threads.",
+    )
 
     args = parser.parse_args()
 
-    main()
+    main(args.images, args.stream, args.workers)
@@ -1,4 +1,4 @@
-"""
+r"""
 Simply resizes images to identical height. Intended for static, non-indexed color images (png & jpg mostly).
 
 This will create new directory with configured suffix, for all passed directories recursively.
@@ -9,8 +9,15 @@ so that you don't have to re-process every file.
 Script will by default try to maintain `st_mtime` so you can order by modification time.
 (more like I need it, since I mix parsec & apollo for streaming)
 
+Processed files are recorded in a manifest inside destination root. Source directories with unchanged `st_mtime`
+are then skipped without listing, and files in changed ones are compared against manifest instead of
+stat-ing destination. Since editing file in place doesn't update directory's `st_mtime`,
+pass `-f` once in a while to check every file against destination like there's no manifest.
+
 This is designed to be used in networked drive with high IO latency (which is what I have)
-so this uses multiple threads.
+so file reads & writes are done by multiple threads, while decoding & resizing is done by process pool
+to use every core. JPEGs are decoded in draft mode, which lets decoder downscale close to target height
+for a fraction of full decode cost.
 
 Would've preferred using `trio.Path` for async file operation, but it still delegates to thread internally.
 So result would be similar regardless.
@@ -50,9 +57,13 @@ Press enter to exit:
 
 import pathlib
 import argparse
+import json
+import io
 import os
-from collections.abc import Sequence, Generator
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from collections.abc import Sequence, Iterable, Iterator, Callable
+from concurrent.futures import ThreadPoolExecutor, Future
+from multiprocessing.pool import Pool, AsyncResult
 
 from PIL import Image
 
@@ -63,9 +74,26 @@ SUFFIX = "_v{}"
 
 EXT_WHITELIST = {".png", ".jpg", ".jpeg"}
 
-# since it's mostly IO task...
+# for reading & writing files, since it's high latency IO
 THREAD_COUNT = 8
 
+# for decoding & resizing. None to use all cores
+PROCESS_COUNT = None
+
+# Number of files read ahead & resizes in flight per thread/process.
+# Bounds memory held by prefetched files.
+PREFETCH_PER_WORKER = 2
+
+# Number of resized files written by single thread task
+WRITE_BATCH = 8
+
+# Resize first reduces image by integer factor until within this much of target size,
+# then resample the rest. Larger is slower but closer to plain resample.
+REDUCING_GAP = 3.0
+
+# Manifest file name in destination root, recording processed source files
+MANIFEST_NAME = ".img_height_lim_manifest.json"
+
 # Default delete mode. This changes argument's default behavior.
 # Useful when using this script via drag & drop.
 DELETE_MODE_DEFAULT = True
@@ -75,13 +103,64 @@ DELETE_MODE_DEFAULT = True
 # NON_ALPHA_EXT = {".jpeg", ".jpg"}
 
 
+# --- Utilities ---
+
+
+def bounded_map(
+    executor: ThreadPoolExecutor, func: Callable, iterable: Iterable, depth: int
+) -> Iterator:
+    """Like `executor.map` but keeps at most `depth` tasks in flight,
+    so results of read-ahead doesn't pile up in memory.
+    """
+
+    pending: deque[Future] = deque()
+
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
 # --- Logics ---
 
 
-def lim_img(src_path: pathlib.Path, dest_path: pathlib.Path, v_pixels: int):
-    """Limits src_path's image height to designated pixels & save to dest_path."""
+def read_task(
+    params: tuple[pathlib.Path, pathlib.Path, int]
+) -> tuple[bytes, pathlib.Path, int, int, int] | None:
+    """Thread task reading source file, returns None if file can be skipped.
+
+    Returns:
+        (source bytes, dest path, target height, source atime ns, source mtime ns) or None
+    """
+
+    src_path, dest_path, tgt_height = params
+
+    src_stat = src_path.stat()
+
+    # skip if matching mtime
+    if dest_path.exists() and dest_path.stat().st_mtime == src_stat.st_mtime:
+        return None
+
+    return src_path.read_bytes(), dest_path, tgt_height, src_stat.st_atime_ns, src_stat.st_mtime_ns
+
+
+def lim_img(data: bytes, ext: str, v_pixels: int) -> bytes:
+    """Limits image's height to designated pixels.
+
+    Args:
+        data: Encoded source image
+        ext: Extension to encode result as
+        v_pixels: Target height in pixels
+
+    Returns:
+        Encoded resized image
+    """
 
-    src = Image.open(src_path)
+    src = Image.open(io.BytesIO(data))
 
     # if src_path.suffix.lower() not in NON_ALPHA_EXT and src.mode == "RGBA":
     #     is_trans = not src.getextrema()[-1] == (255, 255)
@@ -89,37 +168,177 @@ def lim_img(src_path: pathlib.Path, dest_path: pathlib.Path, v_pixels: int):
     #         src = src.convert("RGB")
 
     ratio = v_pixels / src.height
+    size = (round(src.width * ratio), v_pixels)
 
-    resized = src.resize((round(src.width * ratio), v_pixels))
+    # let JPEG decoder scale down by 1/2, 1/4 or 1/8 while staying above target size, no-op for others
+    src.draft(None, size)
 
-    # save & update mtime
-    resized.save(dest_path)
-    os.utime(dest_path, (src_path.stat().st_atime, src_path.stat().st_mtime))
+    resized = src.resize(size, reducing_gap=REDUCING_GAP)
 
+    buffer = io.BytesIO()
+    resized.save(buffer, Image.registered_extensions()[ext.lower()])
+    return buffer.getvalue()
 
-def task(params: tuple[pathlib.Path, pathlib.Path, int]) -> bool:
-    """ThreadPool task func, returns True if file was written."""
 
-    src_path: pathlib.Path
-    dest_path: pathlib.Path
-    tgt_height: int
+def resize_task(
+    job: tuple[bytes, pathlib.Path, int, int, int]
+) -> tuple[bytes, pathlib.Path, int, int]:
+    """Process pool task resizing image read by `read_task`.
 
-    src_path, dest_path, tgt_height = params
+    Returns:
+        (resized image bytes, dest path, source atime ns, source mtime ns)
+    """
 
-    # skip if matching mtime
-    if dest_path.exists() and dest_path.stat().st_mtime == src_path.stat().st_mtime:
-        return False
-    else:
-        lim_img(src_path, dest_path, tgt_height)
-        return True
+    data, dest_path, tgt_height, atime_ns, mtime_ns = job
+
+    return lim_img(data, dest_path.suffix, tgt_height), dest_path, atime_ns, mtime_ns
+
+
+def write_batch(results: list[tuple[bytes, pathlib.Path, int, int]]):
+    """Thread task writing resized images & updating their mtime."""
+
+    for data, dest_path, atime_ns, mtime_ns in results:
+        dest_path.write_bytes(data)
+        os.utime(dest_path, ns=(atime_ns, mtime_ns))
+
+
+class _ResizePipeline:
+    """Feeds read files to process pool then hands resized ones to threads in batches,
+    keeping limited number of tasks in flight on both sides.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor, pool: Pool, depth: int):
+        self.executor = executor
+        self.pool = pool
+        self.depth = depth
+
+        self.resizing: deque[AsyncResult] = deque()
+        self.writing: deque[Future] = deque()
+        self.batch: list[tuple[bytes, pathlib.Path, int, int]] = []
+
+    def submit(self, job: tuple[bytes, pathlib.Path, int, int, int]):
+        self.resizing.append(self.pool.apply_async(resize_task, (job,)))
+
+    def collect(self) -> int:
+        """Moves finished resizes to writer, blocking only when too many are in flight.
+
+        Returns:
+            Number of resizes collected
+        """
+
+        collected = 0
+
+        while self.resizing and (len(self.resizing) > self.depth or self.resizing[0].ready()):
+            self.batch.append(self.resizing.popleft().get())
+            collected += 1
+
+            if len(self.batch) >= WRITE_BATCH:
+                self._flush()
+
+        return collected
+
+    def _flush(self):
+        if self.batch:
+            self.writing.append(self.executor.submit(write_batch, self.batch))
+            self.batch = []
+
+        # don't let resized images pile up when writes are slower
+        while self.writing and (len(self.writing) > self.depth or self.writing[0].done()):
+            self.writing.popleft().result()
+
+    def finish(self) -> int:
+        """Waits for everything in flight to be written.
+
+        Returns:
+            Number of resizes collected
+        """
+
+        collected = 0
+
+        while self.resizing:
+            self.batch.append(self.resizing.popleft().get())
+            collected += 1
 
+        self._flush()
 
-def delete_pass(src_root: pathlib.Path, dest_root: pathlib.Path) -> int:
+        while self.writing:
+            self.writing.popleft().result()
+
+        return collected
+
+
+class _DirEntry:
+    """Processed contents of single source directory"""
+
+    __slots__ = ("mtime_ns", "files", "dirs")
+
+    def __init__(self, mtime_ns: int, files: dict[str, tuple[int, int]], dirs: set[str]):
+        self.mtime_ns = mtime_ns
+
+        # name: (size, mtime_ns)
+        self.files = files
+        self.dirs = dirs
+
+
+class Manifest:
+    """Record of source files processed into destination, kept in destination root.
+    Discarded when output parameters differ.
+    """
+
+    def __init__(self, dest_root: pathlib.Path, tgt_height: int):
+        self.path = dest_root / MANIFEST_NAME
+        self.temp_path = self.path.with_suffix(".tmp")
+        self.params = {"height": tgt_height, "reducing_gap": REDUCING_GAP}
+
+        # {relative dir path: entry}, root itself is ""
+        self.dirs: dict[str, _DirEntry] = {}
+
+        if not self.path.exists():
+            return
+
+        try:
+            data = json.loads(self.path.read_text("utf8"))
+
+            if data["params"] != self.params:
+                return
+
+            self.dirs = {
+                rel: _DirEntry(mtime_ns, {name: tuple(stat) for name, stat in files.items()}, set(dirs))
+                for rel, (mtime_ns, files, dirs) in data["dirs"].items()
+            }
+
+        except (ValueError, KeyError, TypeError) as err:
+            print(f"Ignoring broken manifest {self.path} - {type(err).__name__} {err}")
+
+    def unchanged(self, rel: str, mtime_ns: int) -> _DirEntry | None:
+        """Returns entry of directory if its mtime matches one recorded"""
+
+        entry = self.dirs.get(rel)
+        return entry if entry is not None and entry.mtime_ns == mtime_ns else None
+
+    def save(self):
+        data = {
+            "params": self.params,
+            "dirs": {
+                rel: (entry.mtime_ns, entry.files, sorted(entry.dirs)) for rel, entry in self.dirs.items()
+            },
+        }
+
+        # write & swap, so crash mid-write doesn't leave broken manifest
+        self.temp_path.write_text(json.dumps(data, separators=(",", ":")), "utf8")
+        self.temp_path.replace(self.path)
+
+
+def delete_pass(
+    src_root: pathlib.Path, dest_root: pathlib.Path, manifest: Manifest, full_check: bool
+) -> int:
     """Deletion pass of process
 
     Args:
         src_root: Source root dir
         dest_root: Destination root dir
+        manifest: Manifest of destination
+        full_check: Whether to list every source directory regardless of manifest
 
     Returns:
         File deletion count
@@ -134,24 +353,42 @@ def delete_pass(src_root: pathlib.Path, dest_root: pathlib.Path) -> int:
         dir_names,
         file_names,
     ) in dest_root.walk(top_down=False):
-        src_dir = src_root / dest_dir.relative_to(dest_root)
+        rel = "" if dest_dir == dest_root else dest_dir.relative_to(dest_root).as_posix()
+        src_dir = src_root / rel
+
+        if not rel:
+            file_names = [fn for fn in file_names if fn not in (manifest.path.name, manifest.temp_path.name)]
+
+        # single stat & at most single listing per directory, instead of stat per file
+        try:
+            src_mtime_ns = src_dir.stat().st_mtime_ns
+
+        except FileNotFoundError:
+            entry = None
+            src_names = set()
+            manifest.dirs.pop(rel, None)
+
+        else:
+            entry = None if full_check else manifest.unchanged(rel, src_mtime_ns)
+            src_names = (entry.files.keys() | entry.dirs) if entry else set(os.listdir(src_dir))
 
         deletes = 0
 
         prefix = f"{src_dir.relative_to(src_root.parent)}"
 
         for fn in file_names:
-            src_path = src_dir / fn
+            if fn not in src_names and entry and pathlib.Path(fn).suffix.lower() not in EXT_WHITELIST:
+                # manifest only records images, so other names need actual listing
+                src_names = set(os.listdir(src_dir))
+                entry = None
 
-            if not src_path.exists():
+            if fn not in src_names:
                 (dest_dir / fn).unlink()
                 deletes += 1
                 print(f"{prefix} - deletes {deletes}", end="\r")
 
         for dn in dir_names:
-            src_path = src_dir / dn
-
-            if not src_path.exists():
+            if dn not in src_names:
                 (dest_dir / dn).rmdir()
                 deletes += 1
                 print(f"{prefix} - deletes {deletes}", end="\r")
@@ -166,7 +403,14 @@ def delete_pass(src_root: pathlib.Path, dest_root: pathlib.Path) -> int:
 
 
 def write_pass(
-    src_root: pathlib.Path, dest_root: pathlib.Path, tgt_height: int
+    src_root: pathlib.Path,
+    dest_root: pathlib.Path,
+    tgt_height: int,
+    executor: ThreadPoolExecutor,
+    pool: Pool,
+    depth: int,
+    manifest: Manifest,
+    full_check: bool,
 ) -> tuple[int, int]:
     """Writing pass of process
 
@@ -174,6 +418,11 @@ def write_pass(
         src_root: Source root dir
         dest_root: Destination root dir
         tgt_height: Target height in pixel
+        executor: Thread pool for file IO
+        pool: Process pool for resizing
+        depth: Max number of read-ahead files & resizes in flight
+        manifest: Manifest of destination, updated with processed directories
+        full_check: Whether to check every file against destination regardless of manifest
 
     Returns:
         (writes_count, skipped_count)
@@ -184,34 +433,69 @@ def write_pass(
     total_writes = 0
     total_skipped = 0
 
-    for src_dir in src_root.rglob(""):
-        dest_dir = dest_root / src_dir.relative_to(src_root)
-        dest_dir.mkdir(exist_ok=True)
+    # relative dir paths, root itself is ""
+    stack = [""]
+
+    while stack:
+        rel = stack.pop()
+
+        src_dir = src_root / rel
+        dest_dir = dest_root / rel
 
         prefix = f"{src_dir.relative_to(src_root.parent)}"
 
         writes = 0
         skipped = 0
 
-        def workload_gen() -> (
-            Generator[tuple[pathlib.Path, pathlib.Path, int], None, None]
-        ):
-            for src_path in src_dir.iterdir():
-                if src_path.suffix.lower() not in EXT_WHITELIST:
-                    continue
+        src_mtime_ns = src_dir.stat().st_mtime_ns
+        entry = None if full_check else manifest.unchanged(rel, src_mtime_ns)
 
-                yield src_path, dest_dir / src_path.name, tgt_height
+        if entry is not None:
+            # nothing was added, removed or renamed here - skip without listing
+            skipped = len(entry.files)
+            sub_dirs = entry.dirs
 
-        with ThreadPoolExecutor(THREAD_COUNT) as executor:
-            for is_written in executor.map(task, workload_gen()):
-                if is_written:
-                    writes += 1
-                else:
+        else:
+            dest_dir.mkdir(exist_ok=True)
+
+            known = {} if full_check or rel not in manifest.dirs else manifest.dirs[rel].files
+            files: dict[str, tuple[int, int]] = {}
+            sub_dirs = set()
+
+            with os.scandir(src_dir) as iterator:
+                for dir_entry in iterator:
+                    if dir_entry.is_dir():
+                        sub_dirs.add(dir_entry.name)
+
+                    elif pathlib.Path(dir_entry.name).suffix.lower() in EXT_WHITELIST:
+                        stat = dir_entry.stat()
+                        files[dir_entry.name] = (stat.st_size, stat.st_mtime_ns)
+
+            # files unknown to manifest or changed since are checked against destination
+            to_check = [name for name, stat in files.items() if known.get(name) != stat]
+            skipped = len(files) - len(to_check)
+
+            pipeline = _ResizePipeline(executor, pool, depth)
+            workload = ((src_dir / name, dest_dir / name, tgt_height) for name in to_check)
+
+            for job in bounded_map(executor, read_task, workload, depth):
+                if job is None:
                     skipped += 1
+                else:
+                    pipeline.submit(job)
+
+                writes += pipeline.collect()
 
                 # since wide character messes things up, better rewrite entire line
                 print(f"{prefix} - writes {writes} / skipped {skipped}", end="\r")
 
+            writes += pipeline.finish()
+
+            # record only after every file is written
+            manifest.dirs[rel] = _DirEntry(src_mtime_ns, files, sub_dirs)
+
+        print(f"{prefix} - writes {writes} / skipped {skipped}", end="\r")
+
         # only insert newline when there were any meaningful files
         if any((writes, skipped)):
             print()
@@ -219,30 +503,53 @@ def write_pass(
         total_writes += writes
         total_skipped += skipped
 
+        stack.extend(f"{rel}/{name}" if rel else name for name in sorted(sub_dirs, reverse=True))
+
     return total_writes, total_skipped
 
 
-def main(tgt_height: int, paths: Sequence[pathlib.Path], delete: bool):
+def main(
+    tgt_height: int,
+    paths: Sequence[pathlib.Path],
+    delete: bool,
+    threads: int = THREAD_COUNT,
+    processes: int | None = PROCESS_COUNT,
+    full_check: bool = False,
+):
 
     total_writes = 0
     total_skipped = 0
     total_deletes = 0
 
-    for src_root in paths:
+    processes = processes or os.cpu_count() or 1
+    depth = PREFETCH_PER_WORKER * max(threads, processes)
 
-        if src_root.is_file():
-            print("Ignoring file", src_root)
-            return
+    with ThreadPoolExecutor(threads) as executor, Pool(processes) as pool:
 
-        dest_root = src_root.with_name(src_root.name + SUFFIX.format(tgt_height))
-        dest_root.mkdir(exist_ok=True)
+        for src_root in paths:
 
-        deletes = delete_pass(src_root, dest_root)
-        writes, skipped = write_pass(src_root, dest_root, tgt_height)
+            if src_root.is_file():
+                print("Ignoring file", src_root)
+                return
 
-        total_writes += writes
-        total_skipped += skipped
-        total_deletes += deletes
+            dest_root = src_root.with_name(src_root.name + SUFFIX.format(tgt_height))
+            dest_root.mkdir(exist_ok=True)
+
+            manifest = Manifest(dest_root, tgt_height)
+
+            try:
+                deletes = delete_pass(src_root, dest_root, manifest, full_check)
+                writes, skipped = write_pass(
+                    src_root, dest_root, tgt_height, executor, pool, depth, manifest, full_check
+                )
+
+            finally:
+                # keep progress of directories done so far even when interrupted
+                manifest.save()
+
+            total_writes += writes
+            total_skipped += skipped
+            total_deletes += deletes
 
     print(
         f"\nTotal - deletes {total_deletes} / writes {total_writes} / skipped {total_skipped}"
@@ -261,10 +568,19 @@ if __name__ == "__main__":
     )
 
     _parser.add_argument(
-        "-t" "--threads",
+        "-t",
+        "--threads",
         type=int,
         default=THREAD_COUNT,
-        help="Number of threads to use",
+        help="Number of threads to use for file IO",
+    )
+
+    _parser.add_argument(
+        "-w",
+        "--processes",
+        type=int,
+        default=PROCESS_COUNT,
+        help="Number of processes to use for resizing. Defaults to number of cores",
     )
 
     _parser.add_argument(
@@ -274,6 +590,13 @@ if __name__ == "__main__":
         help="Directories to process",
     )
 
+    _parser.add_argument(
+        "-f",
+        "--full-check",
+        action="store_true",
+        help="Check every file against destination, instead of trusting manifest for unchanged directories",
+    )
+
     _parser.add_argument(
         "-d",
         "--delete",
@@ -286,7 +609,7 @@ if __name__ == "__main__":
         _args.pixels = int(input("Target height in pixels: "))
 
     try:
-        main(_args.pixels, _args.paths, _args.delete)
+        main(_args.pixels, _args.paths, _args.delete, _args.threads, _args.processes, _args.full_check)
 
     except Exception:
         import traceback
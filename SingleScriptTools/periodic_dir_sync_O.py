@@ -3,37 +3,672 @@ Syncs two independent directories periodically, with file extension whitelist.
 
 Used to sync dependant resources real time while writing my own static webpage builder for github.io page.
 
-Intended to be used in combination with watchdog for more efficient sync.
+Source tree snapshot is kept in a json next to this script, and each cycle only re-lists directories
+whose mtime changed - so idle cycle costs a `stat()` per directory, not per file.
+Every `-f` cycles a full check also stats every file & verifies destination,
+catching in-place edits that don't touch directory mtime.
+
+Pass `-w` to use watchdog events instead of walking at all (`pip install watchdog`, uses `watchdog_file_events_m.py`).
+
+Changed files larger than `-d` MiB are delta-copied - only blocks that differ get rewritten in place,
+via `os.copy_file_range` where available so CoW filesystems can share extents instead.
 
 ![](readme_res/periodic_dir_sync.jpg)
 
 :Auther: jupiterbjy@gmail.com
 """
 
-import pathlib
+import os
+import json
 import time
+import shutil
+import hashlib
+import pathlib
+import threading
 from argparse import ArgumentParser
-from collections.abc import Sequence
+from collections.abc import Sequence, Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+
+# --- Config ---
+
+STATE_DIR = pathlib.Path(__file__).parent
+
+# Directories modified this recently aren't trusted to stay unchanged at same mtime,
+# as mtime granularity can be coarse. They get listed again next cycle.
+RACY_MTIME_SEC = 2.0
+
+COPY_WORKERS = 4
+
+# Files at least this large are delta-copied when dest already has a version of it
+DELTA_MIN_SIZE = 16 * 1024 * 1024
+
+# Unit of comparison & rewrite for delta copy
+DELTA_BLOCK_SIZE = 1024 * 1024
 
 
 # --- Utilities ---
 
 CHANGES_FORMAT = "f+ {} / f- {} / d+ {} / d- {}"
 
+DELTA_FORMAT = "delta wrote {:.1f} / {:.1f} MiB, saved {:.1f} MiB"
+
 
 def print_changes(change_tuple: tuple[int, int, int, int]):
     print(CHANGES_FORMAT.format(*change_tuple))
 
 
+def default_state_path(src_roots: Sequence[pathlib.Path], dest_root: pathlib.Path) -> pathlib.Path:
+    """State file path unique to given src & dest combination"""
+
+    key = "\n".join(p.absolute().as_posix() for p in (*src_roots, dest_root))
+    return STATE_DIR / f"periodic_dir_sync_{hashlib.sha1(key.encode('utf8')).hexdigest()[:12]}.json"
+
+
 # --- Logics ---
 
 
+def _write_range(src_fd: int, dest_fd: int, block: memoryview, offset: int) -> bool:
+    """Writes block to dest at offset. Tries letting kernel copy the range from src first,
+    which CoW filesystems such as btrfs & XFS turn into shared extents.
+
+    Returns:
+        Whether os.copy_file_range is still worth trying for this file
+    """
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            done = 0
+            while done < len(block):
+                copied = os.copy_file_range(src_fd, dest_fd, len(block) - done, offset + done, offset + done)
+                if not copied:
+                    break
+                done += copied
+
+            if done == len(block):
+                return True
+
+        except OSError:
+            # i.e. cross filesystem on older kernels, or unsupported fs
+            pass
+
+    os.lseek(dest_fd, offset, os.SEEK_SET)
+    done = 0
+    while done < len(block):
+        done += os.write(dest_fd, block[done:])
+
+    return False
+
+
+def delta_copy(src_path: pathlib.Path, dest_path: pathlib.Path, block_size: int = DELTA_BLOCK_SIZE) -> int:
+    """Updates dest to match src by rewriting only blocks that differ, in place.
+
+    Unlike rsync's rolling checksum there's no matching shifted data - both files are local,
+    and rewriting in place can only reuse blocks at the same offset anyway. So it just compares them.
+
+    Args:
+        src_path: Source file
+        dest_path: Existing destination file
+        block_size: Unit of comparison & rewrite
+
+    Returns:
+        Number of bytes written
+    """
+
+    written = 0
+    offset = 0
+    use_copy_range = True
+
+    src_buf = bytearray(block_size)
+    dest_buf = bytearray(block_size)
+    src_view = memoryview(src_buf)
+
+    with open(src_path, "rb", buffering=0) as src_fp, open(dest_path, "r+b", buffering=0) as dest_fp:
+        while src_read := src_fp.readinto(src_buf):
+            dest_read = dest_fp.readinto(dest_buf)
+
+            # full blocks compare as-is, avoiding slice copies - memoryview comparison is way slower
+            if (src_buf != dest_buf) if src_read == dest_read == block_size else (
+                src_buf[:src_read] != dest_buf[:dest_read]
+            ):
+                if use_copy_range:
+                    use_copy_range = _write_range(src_fp.fileno(), dest_fp.fileno(), src_view[:src_read], offset)
+                else:
+                    dest_fp.seek(offset)
+                    dest_fp.write(src_view[:src_read])
+
+                written += src_read
+
+            offset += src_read
+            dest_fp.seek(offset)
+
+        dest_fp.truncate(offset)
+
+    shutil.copystat(src_path, dest_path)
+    return written
+
+
+# Snapshot stat of files that failed to copy, never matching real one - so they're seen as changed again
+_FAILED_STAT = (-1, -1, -1)
+
+
+class _DirState:
+    """Known contents of single source directory"""
+
+    __slots__ = ("mtime_ns", "files", "dirs")
+
+    def __init__(self, mtime_ns: int = 0, files: dict[str, tuple[int, int, int]] = None, dirs: set[str] = None):
+        self.mtime_ns = mtime_ns
+
+        # name: (size, mtime_ns, inode)
+        self.files: dict[str, tuple[int, int, int]] = files or {}
+        self.dirs: set[str] = dirs or set()
+
+
+class _Diff:
+    """Changes found in source trees in single cycle. Paths are relative to each source root."""
+
+    def __init__(self):
+        # (src root index, path)
+        self.files_changed: list[tuple[int, str]] = []
+        self.files_removed: list[tuple[int, str, tuple[int, int, int]]] = []
+        self.dirs_added: list[str] = []
+        self.dirs_removed: list[str] = []
+
+    def __bool__(self):
+        return bool(self.files_changed or self.files_removed or self.dirs_added or self.dirs_removed)
+
+
+class SyncEngine:
+    """Syncs all files from source roots to dest, by diffing source trees against persisted snapshot.
+    Destination is assumed to be only modified by this, except on full checks which verify it too.
+    Does not care about overlapping file name in multiple src roots - last root wins.
+    """
+
+    def __init__(
+        self,
+        src_roots: Sequence[pathlib.Path],
+        dest_root: pathlib.Path,
+        src_excl: set[str] = None,
+        state_path: pathlib.Path | None = None,
+        workers: int = COPY_WORKERS,
+        delta_min_size: int = DELTA_MIN_SIZE,
+    ):
+        """
+        Args:
+            src_roots: Sequence of Source root dirs
+            dest_root: Destination's root dir
+            src_excl: Excluded file extensions from source's root dir
+            state_path: Where to persist snapshot. Starts from scratch every time if None.
+            workers: Number of threads copying files
+            delta_min_size: Files at least this large are delta-copied over existing dest. 0 disables.
+        """
+
+        self.src_roots = [p.absolute() for p in src_roots]
+        self.dest_root = dest_root.absolute()
+        self.src_excl = src_excl or set()
+        self.state_path = state_path
+        self.delta_min_size = delta_min_size
+
+        # bytes written by & size of delta-copied files in last sync
+        self.delta_written = 0
+        self.delta_total = 0
+
+        # per src root - {relative dir path: state}, root itself is ""
+        self.snapshots: list[dict[str, _DirState]] = [{} for _ in self.src_roots]
+
+        # {source root index: relative dirs} having files that failed to copy, listed again next sync
+        self.retry_dirs: dict[int, set[str]] = {}
+
+        self._executor = ThreadPoolExecutor(workers)
+        self._state_dirty = False
+
+        self._load()
+
+    def close(self):
+        self._executor.shutdown()
+        self._save()
+
+    # --- Persistence ---
+
+    def _load(self):
+        if self.state_path is None or not self.state_path.exists():
+            return
+
+        try:
+            data = json.loads(self.state_path.read_text("utf8"))
+
+            if data["src_roots"] != [p.as_posix() for p in self.src_roots]:
+                return
+
+            self.snapshots = [
+                {
+                    rel: _DirState(mtime_ns, {name: tuple(stat) for name, stat in files.items()}, set(dirs))
+                    for rel, (mtime_ns, files, dirs) in snapshot.items()
+                }
+                for snapshot in data["snapshots"]
+            ]
+
+        except (ValueError, KeyError, TypeError) as err:
+            print(f"Ignoring broken state file {self.state_path} - {type(err).__name__} {err}")
+
+    def _save(self):
+        if self.state_path is None or not self._state_dirty:
+            return
+
+        data = {
+            "src_roots": [p.as_posix() for p in self.src_roots],
+            "snapshots": [
+                {rel: (state.mtime_ns, state.files, sorted(state.dirs)) for rel, state in snapshot.items()}
+                for snapshot in self.snapshots
+            ],
+        }
+
+        # write & swap, so crash mid-write doesn't leave broken state
+        temp = self.state_path.with_suffix(".tmp")
+        temp.write_text(json.dumps(data, separators=(",", ":")), "utf8")
+        temp.replace(self.state_path)
+
+        self._state_dirty = False
+
+    # --- Scanning ---
+
+    def _read_dir(self, abs_dir: str, mtime_ns: int) -> _DirState:
+        """Lists directory into new state"""
+
+        state = _DirState(mtime_ns)
+
+        with os.scandir(abs_dir) as iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        state.dirs.add(entry.name)
+
+                    elif os.path.splitext(entry.name)[1] not in self.src_excl and entry.is_file():
+                        stat = entry.stat()
+                        state.files[entry.name] = stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+                except OSError:
+                    continue
+
+        return state
+
+    def _forget_tree(self, idx: int, rel: str, diff: _Diff):
+        """Drops directory & all its descendants from snapshot, recording them as removed"""
+
+        snapshot = self.snapshots[idx]
+        stack = [rel]
+
+        while stack:
+            current = stack.pop()
+            state = snapshot.pop(current, None)
+            diff.dirs_removed.append(current)
+
+            if state is None:
+                continue
+
+            for name, stat in state.files.items():
+                diff.files_removed.append((idx, os.path.join(current, name), stat))
+
+            stack.extend(os.path.join(current, name) for name in state.dirs)
+
+        self._state_dirty = True
+
+    def _scan(self, idx: int, rels: Iterable[str], recurse: bool, force: bool, diff: _Diff):
+        """Compares directories against snapshot, updating it & recording changes in diff.
+        Directories with unchanged mtime aren't listed again unless forced.
+
+        Args:
+            idx: Source root index
+            rels: Directories to start from, relative to source root
+            recurse: Whether to also visit known subdirectories. New ones are always visited.
+            force: Whether to list directories regardless of mtime
+            diff: Where to record changes
+        """
+
+        root = self.src_roots[idx]
+        snapshot = self.snapshots[idx]
+        racy_after = time.time_ns() - int(RACY_MTIME_SEC * 1e9)
+
+        stack = list(rels)
+
+        while stack:
+            rel = stack.pop()
+            old = snapshot.get(rel)
+
+            try:
+                abs_dir = os.path.join(root, rel)
+                mtime_ns = os.stat(abs_dir).st_mtime_ns
+                unchanged = old is not None and old.mtime_ns == mtime_ns and not force
+
+                if not unchanged:
+                    new = self._read_dir(abs_dir, mtime_ns)
+
+            except OSError:
+                # gone, or never was there
+                if old is not None:
+                    self._forget_tree(idx, rel, diff)
+                continue
+
+            if unchanged:
+                if recurse:
+                    stack.extend(os.path.join(rel, name) for name in old.dirs)
+                continue
+
+            old = old or _DirState()
+
+            for name, stat in new.files.items():
+                if old.files.get(name) != stat:
+                    diff.files_changed.append((idx, os.path.join(rel, name)))
+
+            for name in old.files.keys() - new.files.keys():
+                diff.files_removed.append((idx, os.path.join(rel, name), old.files[name]))
+
+            for name in old.dirs - new.dirs:
+                self._forget_tree(idx, os.path.join(rel, name), diff)
+
+            for name in new.dirs - old.dirs:
+                diff.dirs_added.append(os.path.join(rel, name))
+                stack.append(os.path.join(rel, name))
+
+            if recurse:
+                stack.extend(os.path.join(rel, name) for name in new.dirs & old.dirs)
+
+            # can't tell apart changes within same mtime tick - list again next time
+            if mtime_ns >= racy_after:
+                new.mtime_ns = 0
+
+            snapshot[rel] = new
+            self._state_dirty = True
+
+    def _owner(self, rel_file: str) -> int | None:
+        """Index of last source root having the file"""
+
+        rel_dir, name = os.path.split(rel_file)
+
+        for idx in range(len(self.snapshots) - 1, -1, -1):
+            state = self.snapshots[idx].get(rel_dir)
+            if state is not None and name in state.files:
+                return idx
+
+        return None
+
+    def _has_dir(self, rel_dir: str) -> bool:
+        return any(rel_dir in snapshot for snapshot in self.snapshots)
+
+    # --- Applying ---
+
+    def _copy(self, job: tuple[int, str]) -> tuple[int, int] | None:
+        """Copies single file from source root to dest, called from thread pool.
+
+        Returns:
+            (bytes written, file size) if delta-copied, otherwise None
+        """
+
+        idx, rel = job
+        src_path = self.src_roots[idx] / rel
+        dest_path = self.dest_root / rel
+
+        if self.delta_min_size and dest_path.is_file():
+            size = src_path.stat().st_size
+
+            if size >= self.delta_min_size:
+                return delta_copy(src_path, dest_path), size
+
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        src_path.copy(dest_path, preserve_metadata=True)
+        return None
+
+    def _run_copies(self, jobs: list[tuple[int, str]]) -> tuple[int, list[tuple[int, str]]]:
+        """Copies files in parallel.
+
+        Returns:
+            (number of files copied, failed jobs)
+        """
+
+        copied = 0
+        failed = []
+
+        for job, (error, delta) in zip(jobs, self._executor.map(self._try_copy, jobs)):
+            if error:
+                print(f"Failed to copy {job[1]} - {error}")
+                failed.append(job)
+                continue
+
+            if delta:
+                self.delta_written += delta[0]
+                self.delta_total += delta[1]
+
+            copied += 1
+
+        return copied, failed
+
+    def _retry_later(self, failed: list[tuple[int, str]]):
+        """Makes failed copies show up as changed on next sync, as their directory might not change again."""
+
+        for idx, rel in failed:
+            rel_dir, name = os.path.split(rel)
+            state = self.snapshots[idx].get(rel_dir)
+
+            if state is None or name not in state.files:
+                continue
+
+            state.mtime_ns = 0
+            state.files[name] = _FAILED_STAT
+
+            self.retry_dirs.setdefault(idx, set()).add(rel_dir)
+            self._state_dirty = True
+
+    def _try_copy(self, job: tuple[int, str]) -> tuple[str, tuple[int, int] | None]:
+        try:
+            return "", self._copy(job)
+
+        except OSError as err:
+            return f"{type(err).__name__} {err}", None
+
+    def _apply(self, diff: _Diff) -> tuple[int, int, int, int]:
+        """Applies source changes to destination.
+
+        Returns:
+            (created file count, deleted file count, created dir count, deleted dir count)
+        """
+
+        f_creates = f_deletes = d_creates = d_deletes = 0
+        copies: dict[str, int] = {}
+
+        # files moved within source keep inode - move them in dest too instead of copying again
+        removed_by_stat = {
+            (idx, stat): rel for idx, rel, stat in diff.files_removed if (self.dest_root / rel).exists()
+        }
+        moved_from: set[str] = set()
+
+        for idx, rel in diff.files_changed:
+            if self._owner(rel) != idx:
+                continue
+
+            rel_dir, name = os.path.split(rel)
+            old_rel = removed_by_stat.pop((idx, self.snapshots[idx][rel_dir].files[name]), None)
+
+            if old_rel is not None and self._owner(old_rel) is None:
+                dest_path = self.dest_root / rel
+                dest_path.parent.mkdir(parents=True, exist_ok=True)
+                (self.dest_root / old_rel).replace(dest_path)
+
+                moved_from.add(old_rel)
+                f_creates += 1
+                continue
+
+            copies[rel] = idx
+
+        for idx, rel, _ in diff.files_removed:
+            if rel in moved_from:
+                continue
+
+            owner = self._owner(rel)
+
+            if owner is not None:
+                # still provided by other root, that one wins now
+                copies[rel] = owner
+                continue
+
+            try:
+                (self.dest_root / rel).unlink()
+                f_deletes += 1
+            except FileNotFoundError:
+                pass
+
+        # deepest first, so parents are removed last
+        for rel in sorted(set(diff.dirs_removed), key=lambda p: p.count(os.sep), reverse=True):
+            if rel and not self._has_dir(rel) and (self.dest_root / rel).is_dir():
+                shutil.rmtree(self.dest_root / rel, ignore_errors=True)
+                d_deletes += 1
+
+        for rel in diff.dirs_added:
+            dest_path = self.dest_root / rel
+            if not dest_path.exists():
+                dest_path.mkdir(parents=True, exist_ok=True)
+                d_creates += 1
+
+        copied, failed = self._run_copies(list((idx, rel) for rel, idx in copies.items()))
+        self._retry_later(failed)
+        f_creates += copied
+
+        return f_creates, f_deletes, d_creates, d_deletes
+
+    def _reconcile(self) -> tuple[int, int, int, int]:
+        """Verifies whole destination against snapshot, like a sync from scratch would.
+
+        Returns:
+            (created file count, deleted file count, created dir count, deleted dir count)
+        """
+
+        f_creates = f_deletes = d_creates = d_deletes = 0
+
+        expected_dirs: set[str] = set()
+        expected_files: dict[str, tuple[int, tuple[int, int, int]]] = {}
+
+        for idx, snapshot in enumerate(self.snapshots):
+            expected_dirs.update(snapshot)
+
+            for rel_dir, state in snapshot.items():
+                for name, stat in state.files.items():
+                    expected_files[os.path.join(rel_dir, name)] = idx, stat
+
+        self.dest_root.mkdir(parents=True, exist_ok=True)
+
+        # delete extra paths
+        stack = [""]
+        existing_files: dict[str, os.stat_result] = {}
+
+        while stack:
+            rel_dir = stack.pop()
+
+            with os.scandir(self.dest_root / rel_dir) as iterator:
+                entries = list(iterator)
+
+            for entry in entries:
+                rel = os.path.join(rel_dir, entry.name)
+
+                if entry.is_dir(follow_symlinks=False):
+                    if rel in expected_dirs:
+                        stack.append(rel)
+                    else:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        d_deletes += 1
+                    continue
+
+                if rel in expected_files:
+                    existing_files[rel] = entry.stat()
+                else:
+                    os.unlink(entry.path)
+                    f_deletes += 1
+
+        for rel in sorted(expected_dirs, key=len):
+            if rel and not (self.dest_root / rel).is_dir():
+                (self.dest_root / rel).mkdir(parents=True, exist_ok=True)
+                d_creates += 1
+
+        # copy new paths if missing or different with mtime
+        copies = []
+
+        for rel, (idx, (size, mtime_ns, _)) in expected_files.items():
+            dest_stat = existing_files.get(rel)
+
+            if dest_stat is None or dest_stat.st_size != size or dest_stat.st_mtime_ns != mtime_ns:
+                copies.append((idx, rel))
+
+        copied, failed = self._run_copies(copies)
+        self._retry_later(failed)
+        f_creates += copied
+
+        return f_creates, f_deletes, d_creates, d_deletes
+
+    def sync(self, dirty: dict[int, set[str]] | None = None, full: bool = False) -> tuple[int, int, int, int]:
+        """Runs single sync cycle.
+
+        Args:
+            dirty: {source root index: relative dirs} known to have changed, i.e. from watchdog events.
+                Only those are listed if given, otherwise walks directories checking their mtime.
+            full: List every directory regardless of mtime and verify whole destination.
+
+        Returns:
+            (created file count, deleted file count, created dir count, deleted dir count)
+        """
+
+        diff = _Diff()
+        self.delta_written = self.delta_total = 0
+
+        # directories with failed copies have mtime reset, so only dirty-driven syncs need to be told
+        retry, self.retry_dirs = self.retry_dirs, {}
+
+        if dirty is not None:
+            dirty = {idx: dirty.get(idx, set()) | retry.get(idx, set()) for idx in dirty.keys() | retry.keys()}
+
+        for idx, root in enumerate(self.src_roots):
+            # rather not wipe destination when i.e. source drive is unplugged
+            if not root.is_dir():
+                print(f"Source {root} is missing, skipping")
+                continue
+
+            if full or dirty is None:
+                self._scan(idx, [""], recurse=True, force=full, diff=diff)
+
+            elif dirty.get(idx):
+                self._scan(idx, dirty[idx], recurse=False, force=True, diff=diff)
+
+        changes = self._reconcile() if full else self._apply(diff)
+
+        self._save()
+        return changes
+
+    def dirty_dirs_of(self, abs_path: str, is_dir: bool) -> Iterable[tuple[int, str]]:
+        """Maps changed path to (source root index, relative dir) pairs that need listing again."""
+
+        for idx, root in enumerate(self.src_roots):
+            try:
+                rel = os.path.relpath(abs_path, root)
+            except ValueError:
+                # different drive on windows
+                continue
+
+            if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+                continue
+
+            rel = "" if rel == os.curdir else rel
+
+            if is_dir:
+                yield idx, rel
+
+            if rel:
+                yield idx, os.path.dirname(rel)
+
+
 def multi_src_sync_dir(
     src_roots: Sequence[pathlib.Path],
     dest_root: pathlib.Path,
     src_excl: set[str] = None,
 ) -> tuple[int, int, int, int]:
-    """Syncs all files from src to dest excluding file extensions in excluded_exts.
+    """Syncs all files from src to dest excluding file extensions in excluded_exts, from scratch.
     Does not care about overlapping file name in multiple src roots.
 
     Args:
@@ -45,98 +680,139 @@ def multi_src_sync_dir(
         (created file count, deleted file count, created dir count, deleted dir count)
     """
 
-    # since we can't really use watchdog.utils.dirsnapshot due to diff dir we go manual
-    src_excl = src_excl or set()
+    engine = SyncEngine(src_roots, dest_root, src_excl)
 
-    all_dest_paths = set(p.relative_to(dest_root) for p in dest_root.rglob("*"))
-    all_src_paths = set()
+    try:
+        return engine.sync(full=True)
+    finally:
+        engine.close()
 
-    # merge src paths into one
-    for src_root in src_roots:
-        all_src_paths.update(
-            p.relative_to(src_root)
-            for p in src_root.rglob("*")
-            if p.suffix not in src_excl
-        )
 
-    dangling_dest_paths = {p for p in (all_dest_paths - all_src_paths)}
+# --- Drivers ---
 
-    # delete extra paths
-    f_deletes = 0
-    d_deletes = 0
 
-    for root, dir_names, file_names in dest_root.walk(top_down=False):
+def _print_if_changed(changes: tuple[int, int, int, int], engine: SyncEngine):
+    if sum(changes) > 0:
+        print(f"{time.time():.1f}: ", end="")
+        print_changes(changes)
 
-        for fn in file_names:
-            path = root / fn
-            if path.relative_to(dest_root) not in dangling_dest_paths:
-                continue
+    if engine.delta_total:
+        mib = 1024 * 1024
+        print(
+            DELTA_FORMAT.format(
+                engine.delta_written / mib,
+                engine.delta_total / mib,
+                (engine.delta_total - engine.delta_written) / mib,
+            )
+        )
 
-            f_deletes += 1
-            (root / fn).unlink()
 
-        for dn in dir_names:
-            path = root / dn
-            if path.relative_to(dest_root) not in dangling_dest_paths:
-                continue
+def periodic_sync(
+    src_root: pathlib.Path,
+    dest_root: pathlib.Path,
+    interval: float,
+    full_check: int = 60,
+    state_path: pathlib.Path | None = None,
+    delta_min_size: int = DELTA_MIN_SIZE,
+):
+    """Syncs every interval, only listing directories with changed mtime.
 
-            d_deletes += 1
-            (root / dn).rmdir()
+    Args:
+        src_root: Source directory
+        dest_root: Destination directory
+        interval: Seconds between syncs
+        full_check: Cycles between full checks. 0 disables.
+        state_path: Snapshot file path, defaults to one next to this script.
+        delta_min_size: Files at least this large are delta-copied over existing dest. 0 disables.
+    """
 
-    # copy new paths if missing or different with mtime
-    f_creates = 0
-    d_creates = 0
+    engine = SyncEngine(
+        [src_root],
+        dest_root,
+        state_path=state_path or default_state_path([src_root], dest_root),
+        delta_min_size=delta_min_size,
+    )
 
-    for src_root in src_roots:
-        for root, dir_names, file_names in src_root.walk():
+    try:
+        # nothing to diff against on first run, do it properly
+        _print_if_changed(engine.sync(full=not any(engine.snapshots)), engine)
+        cycle = 1
 
-            for fn in file_names:
+        while True:
+            time.sleep(interval)
 
-                src_path = root / fn
+            _print_if_changed(engine.sync(full=bool(full_check) and cycle % full_check == 0), engine)
+            cycle += 1
 
-                if src_path.suffix in src_excl:
-                    continue
+    finally:
+        engine.close()
 
-                dest_path = dest_root / src_path.relative_to(src_root)
 
-                if not dest_path.exists():
-                    src_path.copy(dest_path, preserve_metadata=True)
-                    f_creates += 1
-                    continue
+def watched_sync(
+    src_root: pathlib.Path,
+    dest_root: pathlib.Path,
+    interval: float,
+    full_check: int = 60,
+    state_path: pathlib.Path | None = None,
+    delta_min_size: int = DELTA_MIN_SIZE,
+):
+    """Syncs directories watchdog reported changes in, batched every interval. No walking otherwise.
 
-                src_stat = src_path.stat()
-                dest_stat = dest_path.stat()
+    Args:
+        src_root: Source directory
+        dest_root: Destination directory
+        interval: Seconds to batch events for
+        full_check: Cycles between full checks. 0 disables.
+        state_path: Snapshot file path, defaults to one next to this script.
+        delta_min_size: Files at least this large are delta-copied over existing dest. 0 disables.
+    """
 
-                if (
-                    src_stat.st_mtime != dest_stat.st_mtime
-                    or src_stat.st_size != dest_stat.st_size
-                ):
-                    src_path.copy(dest_path, preserve_metadata=True)
-                    f_creates += 1
+    # lazy import, so polling works without watchdog installed
+    from watchdog_file_events_m import start_watchdog, FileSystemEvent
 
-            for dn in dir_names:
-                src_path = root / dn
-                dest_path = dest_root / src_path.relative_to(src_root)
+    engine = SyncEngine(
+        [src_root],
+        dest_root,
+        state_path=state_path or default_state_path([src_root], dest_root),
+        delta_min_size=delta_min_size,
+    )
 
-                if not dest_path.exists():
-                    dest_path.mkdir(exist_ok=True)
-                    d_creates += 1
+    lock = threading.Lock()
+    dirty: dict[int, set[str]] = {}
 
-    return f_creates, f_deletes, d_creates, d_deletes
+    def _on_event(event: FileSystemEvent):
+        paths = [event.src_path, getattr(event, "dest_path", "")]
 
+        with lock:
+            for path in filter(None, paths):
+                for idx, rel in engine.dirty_dirs_of(os.fsdecode(path), event.is_directory):
+                    dirty.setdefault(idx, set()).add(rel)
 
-# --- Drivers ---
+    try:
+        with start_watchdog([src_root.absolute().as_posix()], True) as handler:
+            handler.register_global(_on_event)
+
+            # catch up on changes made while not running
+            _print_if_changed(engine.sync(full=not any(engine.snapshots)), engine)
+            cycle = 1
+
+            while True:
+                time.sleep(interval)
 
+                with lock:
+                    batch = dirty.copy()
+                    dirty.clear()
 
-def periodic_sync(src_root: pathlib.Path, dest_root: pathlib.Path, interval: float):
-    while True:
-        changes = multi_src_sync_dir([src_root], dest_root)
+                if full_check and cycle % full_check == 0:
+                    _print_if_changed(engine.sync(full=True), engine)
 
-        if sum(changes) > 0:
-            print(f"{time.time():.1f}: ", end="")
-            print_changes(changes)
+                elif batch or engine.retry_dirs:
+                    _print_if_changed(engine.sync(batch), engine)
 
-        time.sleep(interval)
+                cycle += 1
+
+    finally:
+        engine.close()
 
 
 if __name__ == "__main__":
@@ -158,10 +834,44 @@ if __name__ == "__main__":
         default=1,
         help="Time interval in seconds between syncs",
     )
+    _parser.add_argument(
+        "-f",
+        "--full-check",
+        type=int,
+        default=60,
+        help="Number of syncs between full checks, which stat every file & verify destination. 0 disables.",
+    )
+    _parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="Use watchdog events instead of checking directory mtimes every sync",
+    )
+    _parser.add_argument(
+        "-d",
+        "--delta-min-mb",
+        type=float,
+        default=DELTA_MIN_SIZE / 1024 / 1024,
+        help="Changed files at least this large in MiB only get differing blocks rewritten. 0 disables.",
+    )
+    _parser.add_argument(
+        "-s",
+        "--state",
+        type=pathlib.Path,
+        default=None,
+        help="Path to snapshot file, defaults to json next to this script",
+    )
 
     _args = _parser.parse_args()
 
     try:
-        periodic_sync(_args.src_root, _args.dest_root, _args.time_interval)
+        (watched_sync if _args.watch else periodic_sync)(
+            _args.src_root,
+            _args.dest_root,
+            _args.time_interval,
+            _args.full_check,
+            _args.state,
+            int(_args.delta_min_mb * 1024 * 1024),
+        )
     except KeyboardInterrupt:
         pass
@@ -4,16 +4,43 @@
 Searches for lines containing given keyword.
 Has options to Filter multiple extensions for searching.
 
+Files are walked with `os.scandir` and searched in parallel across processes,
+matching raw bytes via `mmap` - only files containing the keyword get decoded.
+
+Optionally keeps persistent trigram index in `search_index.sqlite` next to this script,
+updated incrementally by mtime - so repeated searches in huge trees only open candidate files.
+
 :Author: jupiterbjy@gmail.com
 """
 
+import os
+import mmap
+import time
+import sqlite3
 import pathlib
-from typing import List, Generator, Tuple
+import contextlib
+from multiprocessing.pool import Pool
+from typing import List, Generator, Tuple, Iterator, Set
 
 
 ROOT = pathlib.Path("./")
 ENCODINGS = "utf8", "cp949"
 
+INDEX_DB_PATH = pathlib.Path(__file__).parent / "search_index.sqlite"
+
+# Files larger than this aren't indexed, and are always searched instead
+INDEX_MAX_FILE_SIZE = 16 * 1024 * 1024
+
+# Files with null byte in this many leading bytes are considered binary, and never match
+BINARY_SNIFF_SIZE = 8192
+
+# Number of files handed to worker process at once
+POOL_CHUNK_SIZE = 32
+
+# Keywords with more trigrams than this only use rarest ones, keeping query within SQLite's compound SELECT limit.
+# Candidates are searched anyway, so this only costs narrowing.
+MAX_QUERY_GRAMS = 16
+
 
 RED = "\033[91m"
 GREEN = "\033[92m"
@@ -33,8 +60,8 @@ def colored_print(text: str, color: str = YELLOW):
     print(color + text + END)
 
 
-def _read_file(path: pathlib.Path, decode_priority=ENCODINGS) -> str:
-    """Reads file and return content as string.
+def _decode(data: bytes, decode_priority=ENCODINGS) -> str:
+    """Decodes bytes with the first encoding that works.
 
     Raises:
         UnicodeDecodingError: on decoding error
@@ -44,7 +71,7 @@ def _read_file(path: pathlib.Path, decode_priority=ENCODINGS) -> str:
 
     for encoding in decode_priority:
         try:
-            return path.read_text(encoding)
+            return data.decode(encoding)
 
         except UnicodeDecodeError as err:
             last_err = err
@@ -54,65 +81,346 @@ def _read_file(path: pathlib.Path, decode_priority=ENCODINGS) -> str:
     raise last_err
 
 
-def find_in_file(keyword: str, path: pathlib.Path) -> List[int]:
-    """Finds line number where keyword appears in file.
-    Returns -1 if keyword is not found.
+def encode_keyword(keyword: str) -> List[bytes]:
+    """Encodes keyword in every encoding in ENCODINGS that can represent it, without duplicates."""
+
+    patterns = []
+
+    for encoding in ENCODINGS:
+        try:
+            encoded = keyword.encode(encoding)
+        except UnicodeEncodeError:
+            continue
+
+        if encoded not in patterns:
+            patterns.append(encoded)
+
+    return patterns
+
+
+def find_in_file(args: Tuple[str, str, List[bytes]]) -> Tuple[str, List[Tuple[int, str]], str]:
+    """Finds lines where keyword appears in file. Runs in worker processes.
+    File is scanned as raw bytes for any encoded form of keyword first, and only decoded on hit.
+    Binary files are skipped, same as index does.
 
     Args:
-        keyword (str): keyword to search for
-        path (pathlib.Path): path to file to search in
+        args: (path, keyword, encoded keywords) tuple, packed for Pool.imap
 
     Returns:
-        int: line number where keyword appears, or -1 if not found
+        (path, list of (line index, line), error message) tuple. Error message is empty on success.
+    """
 
-    Raises:
-        UnicodeDecodeError: on decoding error
+    path, keyword, patterns = args
+
+    try:
+        with open(path, "rb") as fp:
+            # can't mmap empty file, nothing to find there anyway
+            if os.fstat(fp.fileno()).st_size == 0:
+                return path, [], ""
+
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm.find(b"\0", 0, BINARY_SNIFF_SIZE) != -1:
+                    return path, [], ""
+
+                if all(mm.find(pattern) == -1 for pattern in patterns):
+                    return path, [], ""
+
+                text = _decode(mm[:])
+
+    except UnicodeDecodeError:
+        return path, [], f"Failed to read file {path} with encoding {ENCODINGS}"
+
+    except (OSError, ValueError) as err:
+        return path, [], f"Failed to read file {path}: {err}"
+
+    return path, [(idx, line) for idx, line in enumerate(text.splitlines()) if keyword in line], ""
+
+
+def walk_files(path: pathlib.Path, ext_whitelist: set) -> Iterator[os.DirEntry]:
+    """Walks directory with os.scandir, which knows entry types without extra stat calls.
+    Symlinked directories aren't followed.
+
+    Args:
+        path: path to walk
+        ext_whitelist: Extensions to yield. If empty ignores extension.
+
+    Yields:
+        os.DirEntry of each file
     """
 
-    return [
-        idx for idx, line in enumerate(_read_file(path).splitlines()) if keyword in line
-    ]
+    stack = [os.fspath(path)]
+
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as iterator:
+                entries = list(iterator)
+
+        except OSError:
+            continue
+
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+
+                if not entry.is_file():
+                    continue
+
+            except OSError:
+                continue
+
+            if ext_whitelist and os.path.splitext(entry.name)[1] not in ext_whitelist:
+                continue
+
+            yield entry
+
+
+def _trigrams(data: bytes) -> Set[int]:
+    """Returns every 3-byte sequence in data, each packed into an int."""
+
+    return {(a << 16) | (b << 8) | c for a, b, c in set(zip(data, data[1:], data[2:]))}
+
+
+def _index_file(path: str) -> Tuple[str, List[int] | None]:
+    """Reads file & collects its trigrams. Runs in worker processes.
+
+    Returns:
+        (path, trigrams) tuple. Trigrams is None if file couldn't be read, and empty for binary files.
+    """
+
+    try:
+        data = pathlib.Path(path).read_bytes()
+    except OSError:
+        return path, None
+
+    if b"\0" in data[:BINARY_SNIFF_SIZE]:
+        return path, []
+
+    return path, list(_trigrams(data))
+
+
+# noinspection SqlNoDataSourceInspection,SqlResolve
+class _Query:
+    """Namespace for queries, so it's easier to edit"""
+
+    create_files = """
+    CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime_ns INTEGER, size INTEGER, indexed INTEGER
+    )
+    """
+
+    create_grams = """
+    CREATE TABLE IF NOT EXISTS grams (gram INTEGER, file_id INTEGER, PRIMARY KEY(gram, file_id)) WITHOUT ROWID
+    """
+
+    create_grams_file_index = "CREATE INDEX IF NOT EXISTS grams_file_id ON grams(file_id)"
+
+    files_under = "SELECT id, path, mtime_ns, size FROM files WHERE substr(path, 1, ?) = ?"
+
+    insert_file = "INSERT INTO files(path, mtime_ns, size, indexed) VALUES (?, ?, ?, ?)"
+
+    insert_gram = "INSERT INTO grams VALUES (?, ?)"
+
+    delete_file = "DELETE FROM files WHERE id = ?"
+
+    delete_grams = "DELETE FROM grams WHERE file_id = ?"
+
+    all_under = "SELECT path FROM files WHERE substr(path, 1, ?) = ?"
+
+    # {} is filled with INTERSECT of gram_files, one per trigram
+    candidates_under = "SELECT path FROM files WHERE substr(path, 1, ?) = ? AND (indexed = 0 OR id IN ({}))"
+
+    gram_files = "SELECT file_id FROM grams WHERE gram = ?"
+
+    gram_count = "SELECT count(*) FROM grams WHERE gram = ?"
+
+
+class TrigramIndex:
+    """Persistent trigram index narrowing down files that can contain a keyword. Use this as context manager.
+
+    Any file containing keyword must contain all of keyword's trigrams, so only files having all of them
+    are handed to search. Files too large to index are always handed over.
+    """
+
+    def __init__(self, db_path: pathlib.Path):
+        self._path = db_path
+        self._conn: sqlite3.Connection | None = None
+
+    def __enter__(self):
+        self._conn = sqlite3.connect(self._path)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+
+        for query in (_Query.create_files, _Query.create_grams, _Query.create_grams_file_index):
+            self._conn.execute(query)
+
+        self._conn.commit()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._conn.commit()
+        self._conn.close()
+
+    @staticmethod
+    def _prefix(path: pathlib.Path) -> str:
+        """Absolute path with trailing separator, so /a doesn't match /ab."""
+
+        return os.path.join(os.path.abspath(path), "")
+
+    def _remove(self, file_id: int):
+        self._conn.execute(_Query.delete_grams, (file_id,))
+        self._conn.execute(_Query.delete_file, (file_id,))
+
+    def update(self, path: pathlib.Path, pool: Pool = None) -> Tuple[int, int]:
+        """Brings index of files under path up to date, only re-indexing files with changed mtime or size.
+
+        Args:
+            path: path to index
+            pool: Process pool to read files with. Reads in this process if omitted.
+
+        Returns:
+            (number of (re)indexed files, number of removed files) tuple
+        """
+
+        prefix = self._prefix(path)
+
+        known = {
+            file_path: (file_id, mtime_ns, size)
+            for file_id, file_path, mtime_ns, size in self._conn.execute(_Query.files_under, (len(prefix), prefix))
+        }
+
+        changed = {}
+        removed = 0
+
+        for entry in walk_files(pathlib.Path(prefix), set()):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            record = known.pop(entry.path, None)
+
+            if record is not None:
+                if record[1:] == (stat.st_mtime_ns, stat.st_size):
+                    continue
+
+                self._remove(record[0])
+
+            changed[entry.path] = stat.st_mtime_ns, stat.st_size
+
+        # whatever's left is gone from disk
+        for file_id, *_ in known.values():
+            self._remove(file_id)
+            removed += 1
+
+        to_read = []
+
+        for file_path, (mtime_ns, size) in changed.items():
+            if size > INDEX_MAX_FILE_SIZE:
+                self._conn.execute(_Query.insert_file, (file_path, mtime_ns, size, 0))
+            else:
+                to_read.append(file_path)
+
+        results = pool.imap_unordered(_index_file, to_read, 4) if pool else map(_index_file, to_read)
+
+        for file_path, grams in results:
+            # unreadable files are left for search to report
+            cursor = self._conn.execute(
+                _Query.insert_file, (file_path, *changed[file_path], 0 if grams is None else 1)
+            )
+
+            if grams:
+                file_id = cursor.lastrowid
+                self._conn.executemany(_Query.insert_gram, ((gram, file_id) for gram in grams))
+
+        self._conn.commit()
+        return len(changed), removed
+
+    def _rarest(self, grams: List[int]) -> List[int]:
+        """Returns up to MAX_QUERY_GRAMS grams appearing in the fewest files"""
+
+        if len(grams) <= MAX_QUERY_GRAMS:
+            return grams
+
+        counts = {gram: self._conn.execute(_Query.gram_count, (gram,)).fetchone()[0] for gram in grams}
+        return sorted(grams, key=counts.__getitem__)[:MAX_QUERY_GRAMS]
+
+    def candidates(self, path: pathlib.Path, patterns: List[bytes]) -> List[str]:
+        """Returns files under path that may contain any of given byte patterns.
+
+        Args:
+            path: path to search in
+            patterns: Encoded keywords
+
+        Returns:
+            List of absolute file paths
+        """
+
+        prefix = self._prefix(path)
+        found = {}
+
+        for pattern in patterns:
+            grams = self._rarest(sorted(_trigrams(pattern)))
+
+            # too short to narrow down
+            if not grams:
+                query, params = _Query.all_under, ()
+            else:
+                query = _Query.candidates_under.format(" INTERSECT ".join([_Query.gram_files] * len(grams)))
+                params = grams
+
+            found.update(dict.fromkeys(row[0] for row in self._conn.execute(query, (len(prefix), prefix, *params))))
+
+        return list(found)
 
 
 def search_file(
-    keyword: str, path: pathlib.Path, ext_whitelist: set, ignore_error: bool = False
-) -> Generator[Tuple[pathlib.Path, List[int]], None, None]:
+    keyword: str,
+    path: pathlib.Path,
+    ext_whitelist: set,
+    ignore_error: bool = False,
+    pool: Pool = None,
+    index: TrigramIndex = None,
+) -> Generator[Tuple[pathlib.Path, List[Tuple[int, str]]], None, None]:
     """Generator that searches for keyword in files with specified extensions.
+    Results are yielded in completion order when pool is given.
 
     Args:
         keyword (str): keyword to search for.
         path (pathlib.Path): path to search in.
         ext_whitelist (set): Extensions to search for. If empty ignores extension.
         ignore_error: ignore decoding errors
+        pool: Process pool to search with. Searches in this process if omitted.
+        index: Up-to-date trigram index to narrow down files with. Walks path if omitted.
 
     Yields:
-        Tuple[pathlib.Path, List[int]: path to file & list of line# where keyword appears.
+        Tuple[pathlib.Path, List[Tuple[int, str]]]: path to file & list of (line index, line) where keyword appears.
     """
 
-    for path in path.iterdir():
+    patterns = encode_keyword(keyword)
 
-        # if path is a directory, recursively search in it
-        if path.is_dir():
-            yield from search_file(keyword, path, ext_whitelist, ignore_error)
-            continue
+    if index is None:
+        file_paths = (entry.path for entry in walk_files(path, ext_whitelist))
 
-        # if path is not a file we're looking for, skip
-        if ext_whitelist and path.suffix not in ext_whitelist:
-            continue
+    else:
+        file_paths = (
+            file_path for file_path in index.candidates(path, patterns)
+            if not ext_whitelist or os.path.splitext(file_path)[1] in ext_whitelist
+        )
 
-        try:
-            results = find_in_file(keyword, path)
+    jobs = ((file_path, keyword, patterns) for file_path in file_paths)
+    results = pool.imap_unordered(find_in_file, jobs, POOL_CHUNK_SIZE) if pool else map(find_in_file, jobs)
 
-        except UnicodeDecodeError:
+    for file_path, lines, error in results:
+        if error:
             # we can't do shete on encoding errors
             if not ignore_error:
-                colored_print(
-                    f"Failed to read file {path} with encoding {ENCODINGS}", RED
-                )
+                colored_print(error, RED)
             continue
 
-        if results:
-            yield path, results
+        if lines:
+            yield pathlib.Path(file_path), lines
 
 
 def get_search_target() -> set:
@@ -212,6 +520,31 @@ def get_error_ignore_behavior() -> bool:
         return False
 
 
+def get_index_behavior() -> bool:
+    """Let user decide whether to use persistent trigram index or not.
+
+    Returns:
+        bool: if true, search via index, otherwise walks directory every search
+    """
+    colored_print("\nUse trigram index? Fast on repeated searches in huge directories (y/N)")
+
+    raw = colored_input("> ")
+    return bool(raw) and raw in "Yy"
+
+
+def update_index(index: TrigramIndex, search_path: pathlib.Path, pool: Pool):
+    """Updates index while showing how long it took."""
+
+    colored_print("Updating index...", YELLOW)
+
+    started = time.perf_counter()
+    updated, removed = index.update(search_path, pool)
+
+    colored_print(
+        f"Index updated in {time.perf_counter() - started:.2f}s - {updated} indexed, {removed} removed", GREEN
+    )
+
+
 def main() -> bool:
     """Main search loop.
 
@@ -222,36 +555,51 @@ def main() -> bool:
     colored_print(f"Active encodings: {ENCODINGS}", YELLOW)
 
     ignore_error = get_error_ignore_behavior()
+    use_index = get_index_behavior()
     search_path = get_search_path()
     search_extensions = get_search_target_preset()
 
-    while True:
-        query = colored_input("\n\nKeyword (q to exit, r to restart): ")
-        if not query:
-            continue
+    with (
+        Pool() as pool,
+        TrigramIndex(INDEX_DB_PATH) if use_index else contextlib.nullcontext() as index,
+    ):
+        if index:
+            update_index(index, search_path, pool)
 
-        if query in "Qq":
-            return False
+        prompt = "q to exit, r to restart, u to update index" if index else "q to exit, r to restart"
 
-        if query in "Rr":
-            return True
+        while True:
+            query = colored_input(f"\n\nKeyword ({prompt}): ")
+            if not query:
+                continue
+
+            if query in "Qq":
+                return False
+
+            if query in "Rr":
+                return True
+
+            if index and query in "Uu":
+                update_index(index, search_path, pool)
+                continue
 
-        for path, line_nos in search_file(
-            query, search_path, search_extensions, ignore_error
-        ):
-            colored_print(f"\nIn {path.absolute().as_posix()}:", GREEN)
+            started = time.perf_counter()
+            file_count = 0
 
-            # search for lines in file. Reading file here again cause IDC.
-            # QOL > performance
-            lines = path.read_text("utf8").splitlines()
-            digits = len(str(len(lines)))
+            for path, lines in search_file(
+                query, search_path, search_extensions, ignore_error, pool, index
+            ):
+                colored_print(f"\nIn {path.absolute().as_posix()}:", GREEN)
+                file_count += 1
 
-            for line_no in line_nos:
-                print(f"{GREEN} {line_no + 1:0{digits}}|{END}  {lines[line_no]}")
+                digits = len(str(lines[-1][0] + 1))
 
-        colored_print("\n-- END OF RESULTS --", RED)
+                for line_no, line in lines:
+                    print(f"{GREEN} {line_no + 1:0{digits}}|{END}  {line}")
 
-    return True
+            colored_print(
+                f"\n-- END OF RESULTS -- {file_count} files in {time.perf_counter() - started:.3f}s", RED
+            )
 
 
 if __name__ == "__main__":
@@ -16,6 +16,14 @@ apt install ffmpeg
 # ... or download manually and add to PATH!
 ```
 
+Video chunks are streamed straight into ffmpeg's stdin, so only small audio stream is concatenated
+into temp file - copied by OS where supported, without going through python.
+Pass `-c` to concatenate both streams into temp files instead, in case ffmpeg fails to read from pipe.
+
+Clips are merged concurrently (`-j`). AppID names are cached in `steam_app_names.json` next to this script
+for a month, so store API is only asked about new games. For testing without network, pass `-a` with json
+file of store API responses keyed by AppID, e.g. `{"730": {"success": true, "data": {"name": "Counter-Strike 2"}}}`.
+
 Refer `-h` for usage.
 
 | ![](readme_res/steam_m4s_merge.jpg) |
@@ -25,17 +33,22 @@ Refer `-h` for usage.
 :Author: jupiterbjy@gmail.com
 """
 
-import functools
+import os
+import errno
 import pathlib
 import argparse
 import re
+import shlex
+import shutil
 import subprocess
 import tempfile
 import json
+import time
 import urllib.request
 import urllib.error
 import traceback
-from typing import Sequence, List, Tuple, Iterator
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Sequence, List, Tuple, Iterator, BinaryIO, Dict
 
 
 # --- Configs ---
@@ -44,20 +57,31 @@ from typing import Sequence, List, Tuple, Iterator
 # Not using ISteamApps/GetAppList/v0002/ because it's not reliable.
 STEAM_APP_DETAIL_URL = "http://store.steampowered.com/api/appdetails?appids="
 
+# On-disk AppID-Name cache & how long each entry stays valid in seconds
+APP_NAME_CACHE_PATH = pathlib.Path(__file__).parent / "steam_app_names.json"
+APP_NAME_CACHE_TTL = 30 * 24 * 60 * 60
+
+# Number of clips merged concurrently. Mostly disk & ffmpeg bound, so few is enough.
+JOBS = 4
+
 # FFMPEG command to fix video full range flag (regardless of it being av1 h265 or h264)
 # ONLY UNCOMMENT IF ALL YOUR CLIPS ARE H264
 # FFMPEG_FIX_RANGE_FLAG = "-bsf:v h264_metadata=video_full_range_flag=1"
 FFMPEG_FIX_RANGE_FLAG = ""
 
-# FFMPEG command to run when merging final video and audio streams
+# FFMPEG command to run when merging final video and audio streams.
+# Split into arguments before substitution, so paths need no quoting.
 FFMPEG_CMD = " ".join(
     [
-        'ffmpeg -i "{}" -i "{}" -c copy -map 0:v:0 -map 1:a:0 -y',
+        "ffmpeg -i {video} -i {audio} -c copy -map 0:v:0 -map 1:a:0 -y",
         FFMPEG_FIX_RANGE_FLAG,
-        '"{}"',
+        "{output}",
     ]
 )
 
+# Read size when streaming parts into ffmpeg or temp file
+COPY_CHUNK_SIZE = 1024 * 1024
+
 # Used to check whether directory is valid or not
 DIR_VALIDITY_CHECK = re.compile(r"(bg|clip)_\d+_\d{8}_\d{6}")
 
@@ -90,7 +114,7 @@ SPLASH_MSG = f"""
 Steam Recording Extraction script
 by jupiterbjy's Prehistoric coding skills
 
-Revision 12 (2025-12-23)
+Revision 13 (2026-10-18)
 =========================================
 """.lstrip()
 
@@ -142,37 +166,101 @@ def _recursive_recording_fetch_batched_gen(
         yield from _recursive_recording_fetch_gen(path)
 
 
-@functools.cache
-def app_id_2_name(app_id: int) -> str:
-    """Converts app_id to app_name. Failsafe back to app_id if fails.
+def load_app_name_cache(path: pathlib.Path) -> Dict[str, dict]:
+    """Loads AppID-Name cache, empty if missing or broken.
+
+    Returns:
+        {app_id: {"name": name, "fetched": epoch}} dict
+    """
+
+    try:
+        return json.loads(path.read_text("utf8"))
+
+    except (OSError, ValueError):
+        return {}
+
+
+def save_app_name_cache(path: pathlib.Path, cache: Dict[str, dict]):
+    """Writes AppID-Name cache via temp file, so interrupted write won't break it."""
+
+    temp_path = path.with_suffix(".tmp")
+    temp_path.write_text(json.dumps(cache, indent=2, ensure_ascii=False), "utf8")
+    temp_path.replace(path)
 
-    I REALLY hope there's no app that violates any of OS's file naming rules...
+
+def app_id_2_name(
+    app_id: int, cache: Dict[str, dict], fixture: Dict[str, dict] | None = None
+) -> str:
+    """Converts app_id to app_name, using cache entry if still fresh. Failsafe back to app_id if fails.
 
     Args:
         app_id: Steam AppID
+        cache: AppID-Name cache from `load_app_name_cache`, updated in place
+        fixture: Store API responses keyed by AppID to use instead of querying steam
 
     Returns:
         app name string
     """
 
+    entry = cache.get(str(app_id))
+
+    if entry is not None and time.time() - entry["fetched"] < APP_NAME_CACHE_TTL:
+        return entry["name"]
+
+    name = query_app_name(app_id, fixture)
+
+    # network errors aren't cached, so next run retries
+    if name is None:
+        return str(app_id)
+
+    cache[str(app_id)] = {"name": name, "fetched": time.time()}
+    return name
+
+
+def query_app_name(app_id: int, fixture: Dict[str, dict] | None = None) -> str | None:
+    """Asks steam API for app name. Failsafe back to app_id if app has no usable name.
+
+    I REALLY hope there's no app that violates any of OS's file naming rules...
+
+    Args:
+        app_id: Steam AppID
+        fixture: Store API responses keyed by AppID to use instead of querying steam
+
+    Returns:
+        app name string, None if request itself failed
+    """
+
     str_id = str(app_id)
 
     ANSI.print(f"AppID {app_id} name not cached!", color="YELLOW")
-    ANSI.print(f"Inquiring AppID {app_id} to steam API", color="YELLOW")
 
-    url = STEAM_APP_DETAIL_URL + str_id
-    req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
-    resp = urllib.request.urlopen(req)
+    if fixture is not None:
+        data = fixture
 
-    if resp.getcode() != 200:
-        # probably rate limit if this fails
-        ANSI.print(
-            f"Response code was {resp.getcode()}\nContent: {resp.read()}", color="RED"
-        )
-        ANSI.print("Falling back to AppID", color="RED")
-        return str_id
+    else:
+        ANSI.print(f"Inquiring AppID {app_id} to steam API", color="YELLOW")
+
+        url = STEAM_APP_DETAIL_URL + str_id
+        req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
+
+        try:
+            resp = urllib.request.urlopen(req)
+
+        except urllib.error.URLError as err:
+            # probably rate limit or offline
+            ANSI.print(f"Request failed: {err}", color="RED")
+            ANSI.print("Falling back to AppID", color="RED")
+            return None
+
+        if resp.getcode() != 200:
+            # probably rate limit if this fails
+            ANSI.print(
+                f"Response code was {resp.getcode()}\nContent: {resp.read()}", color="RED"
+            )
+            ANSI.print("Falling back to AppID", color="RED")
+            return None
 
-    data = json.loads(resp.read().decode())
+        data = json.loads(resp.read().decode())
 
     # validate if we had access for app.
     try:
@@ -220,12 +308,35 @@ def app_id_2_name(app_id: int) -> str:
 
 
 # print(
-#     app_id_2_name(1277930),
-#     app_id_2_name(3171460),
-#     app_id_2_name(3325190),
+#     query_app_name(1277930),
+#     query_app_name(3171460),
+#     query_app_name(3325190),
 # )
 
 
+def _copy_file(src: BinaryIO, dest: BinaryIO) -> None:
+    """Appends rest of src to dest. Uses `os.copy_file_range` where available,
+    so data is copied in kernel without passing through python.
+
+    Args:
+        src: file to read from, at position to copy from
+        dest: unbuffered file to append to
+    """
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            while os.copy_file_range(src.fileno(), dest.fileno(), COPY_CHUNK_SIZE):
+                pass
+            return
+
+        except OSError:
+            # unsupported filesystem or such - both positions are advanced by what's copied so far,
+            # so just continue with plain copy
+            pass
+
+    shutil.copyfileobj(src, dest, COPY_CHUNK_SIZE)
+
+
 def concat_file(parts: Sequence[pathlib.Path], output_path: pathlib.Path) -> None:
     """Concatenates given files into output_path.
 
@@ -234,9 +345,35 @@ def concat_file(parts: Sequence[pathlib.Path], output_path: pathlib.Path) -> Non
         output_path: output file path
     """
 
-    with output_path.open("wb") as fp:
+    with output_path.open("wb", buffering=0) as fp:
         for part in parts:
-            fp.write(part.read_bytes())
+            with part.open("rb") as src:
+                _copy_file(src, fp)
+
+
+def feed_parts(parts: Sequence[pathlib.Path], pipe: BinaryIO) -> None:
+    """Writes given files into pipe in order, then closes it. Meant to run in thread.
+    Pipe is closed on error too, so ffmpeg sees end of input instead of waiting forever.
+
+    Args:
+        parts: files to write
+        pipe: ffmpeg's stdin
+    """
+
+    try:
+        with pipe:
+            for part in parts:
+                with part.open("rb") as src:
+                    shutil.copyfileobj(src, pipe, COPY_CHUNK_SIZE)
+
+    except BrokenPipeError:
+        # ffmpeg quit early - its stderr will tell why
+        pass
+
+    except OSError as err:
+        # windows reports ffmpeg quitting early as EINVAL instead
+        if err.errno != errno.EINVAL:
+            raise
 
 
 def validate_ffmpeg() -> bool:
@@ -304,6 +441,7 @@ def merge_streams(
     audio_parts: List[pathlib.Path],
     temp_dir: pathlib.Path,
     output_file: pathlib.Path,
+    concat_video: bool = False,
 ) -> bool:
     """Merges video and audio parts into output_path.
 
@@ -312,39 +450,72 @@ def merge_streams(
         audio_parts: audio parts
         temp_dir: path to store merged video and audio temporarily
         output_file: final output path
+        concat_video: concatenate video into temp file too, instead of streaming it to ffmpeg
 
     Returns:
         True if successful, False otherwise
+
+    Raises:
+        FileNotFoundError: If any part is missing
     """
 
+    # check upfront, so ffmpeg never starts waiting on input that won't come
+    for part in (*video_parts, *audio_parts):
+        if not part.is_file():
+            raise FileNotFoundError(f"Missing part '{part}'")
+
     # temp path for merged streams
     merged_video_path = temp_dir / "merged_video.mp4"
     merged_audio_path = temp_dir / "merged_audio.mp4"
 
     # merge parts
-    print("Concatenating streams")
-    concat_file(video_parts, merged_video_path)
+    print(f"Concatenating streams of '{output_file.name}'")
     concat_file(audio_parts, merged_audio_path)
 
+    if concat_video:
+        concat_file(video_parts, merged_video_path)
+
     # merge video and audio via ffmpeg
-    print("Merging streams")
-    proc = subprocess.run(
-        FFMPEG_CMD.format(
-            merged_video_path.as_posix(),
-            merged_audio_path.as_posix(),
-            output_file,
-        ),
-        capture_output=True,
+    print(f"Merging streams of '{output_file.name}'")
+    args = [
+        arg.format(
+            video=merged_video_path.as_posix() if concat_video else "pipe:0",
+            audio=merged_audio_path.as_posix(),
+            output=output_file.as_posix(),
+        )
+        for arg in shlex.split(FFMPEG_CMD)
+    ]
+
+    proc = subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL if concat_video else subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
     )
 
+    with ThreadPoolExecutor(1) as feeder:
+        feeding: Future | None = None
+        if not concat_video:
+            feeding = feeder.submit(feed_parts, video_parts, proc.stdin)
+
+        stderr = proc.stderr.read()
+        return_code = proc.wait()
+
+    feed_error = feeding.exception() if feeding is not None else None
+
     # if ffmpeg failed then let it be
-    if proc.returncode == 0:
+    if return_code == 0 and feed_error is None:
         ANSI.print(f"Saved as '{output_file.name}'", color="GREEN")
         return True
 
+    # ffmpeg may happily save truncated input, so failed feed fails clip regardless
+    if return_code == 0:
+        output_file.unlink(missing_ok=True)
+        raise feed_error
+
     # if failed print log
     ANSI.print(
-        f"Failed to merge!\n\n{proc.stderr.decode(errors='replace')}\n(End of output)",
+        f"Failed to merge!\n\n{stderr.decode(errors='replace')}\n(End of output)",
         color="RED",
     )
 
@@ -354,11 +525,59 @@ def merge_streams(
 # --- Drivers ---
 
 
+def process_clip(
+    clip_path: pathlib.Path, output_path: pathlib.Path, concat_video: bool
+) -> bool:
+    """Merges single clip into output_path. Runs in worker thread.
+
+    Args:
+        clip_path: clip/background recording directory
+        output_path: final output path
+        concat_video: concatenate video into temp file instead of streaming it to ffmpeg
+
+    Returns:
+        True if successful, False otherwise
+    """
+
+    print(f"Processing {clip_path.name}")
+
+    recording_type = clip_path.name.split("_")[0]
+
+    # follow into m4s directory if clip - just fetching first subdir should be enough
+    # TODO: use timelines to trim vid
+    try:
+        m4s_root: pathlib.Path = (
+            next((clip_path / "video").iterdir())
+            if recording_type == "clip"
+            else clip_path
+        )
+
+        # fetch & sort each parts
+        video_parts, audio_parts = fetch_parts(m4s_root)
+        print(f"Found V:{len(video_parts)} + A:{len(audio_parts)} parts in {clip_path.name}")
+
+        # own temp dir per clip, removed as soon as it's done
+        with tempfile.TemporaryDirectory() as tmpdir:
+            return merge_streams(
+                video_parts, audio_parts, pathlib.Path(tmpdir), output_path, concat_video
+            )
+
+    except Exception as err:
+        ANSI.print(
+            f"Failed to process {clip_path.name} due to {type(err).__name__}':", color="RED"
+        )
+        traceback.print_exc()
+        return False
+
+
 def main(
     clip_paths: Sequence[pathlib.Path],
     output_dir: pathlib.Path,
     force_overwrite: bool,
     use_app_id_as_name: bool,
+    concat_video: bool = False,
+    jobs: int = JOBS,
+    fixture: Dict[str, dict] | None = None,
 ):
     """Main logic
 
@@ -367,60 +586,55 @@ def main(
         output_dir: output directory
         force_overwrite: whether to reprocess & overwrite existing video files
         use_app_id_as_name: use app id as name instead of app name
+        concat_video: concatenate video into temp file instead of streaming it to ffmpeg
+        jobs: number of clips merged concurrently
+        fixture: Store API responses keyed by AppID to use instead of querying steam.
+            On-disk cache is left untouched if given.
     """
 
-    # successful merged clip count
-    success_count = 0
-
     # skipped clip count
     skipped_count = 0
 
-    # setup temp dir
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = pathlib.Path(tmpdir)
+    # fixture runs get throwaway cache
+    cache = {} if fixture is not None else load_app_name_cache(APP_NAME_CACHE_PATH)
 
-        for clip_path in clip_paths:
+    # resolve names first in main thread, so each app is looked up once
+    tasks: List[Tuple[pathlib.Path, pathlib.Path]] = []
 
-            print("\nProcessing", clip_path.name)
+    try:
+        for clip_path in clip_paths:
 
             # fetch app id
-            recording_type, app_id, date, time = clip_path.name.split("_")
+            recording_type, app_id, date, clip_time = clip_path.name.split("_")
 
             # fetch app name from id
-            app_name = app_id if use_app_id_as_name else app_id_2_name(int(app_id))
-            output_path = output_dir / f"{app_name} {recording_type}_{date}_{time}.mp4"
+            app_name = (
+                app_id if use_app_id_as_name else app_id_2_name(int(app_id), cache, fixture)
+            )
+            output_path = output_dir / f"{app_name} {recording_type}_{date}_{clip_time}.mp4"
 
             # skip if already exists
             if output_path.exists():
                 if force_overwrite:
-                    ANSI.print("Video already exists - overwriting", color="YELLOW")
+                    ANSI.print(f"{output_path.name} already exists - overwriting", color="YELLOW")
                 else:
-                    ANSI.print("Video already exists - skipping", color="GREEN")
+                    ANSI.print(f"{output_path.name} already exists - skipping", color="GREEN")
                     skipped_count += 1
                     continue
 
-            # follow into m4s directory if clip - just fetching first subdir should be enough
-            # TODO: use timelines to trim vid
-            try:
-                m4s_root: pathlib.Path = (
-                    next((clip_path / "video").iterdir())
-                    if recording_type == "clip"
-                    else clip_path
-                )
-
-                # fetch & sort each parts
-                video_parts, audio_parts = fetch_parts(m4s_root)
-                print(f"Found V:{len(video_parts)} + A:{len(audio_parts)} parts")
-
-                # merge streamsK
-                success_count += merge_streams(
-                    video_parts, audio_parts, tmpdir, output_path
-                )
-            except Exception as err:
-                ANSI.print(
-                    f"Failed to process due to {type(err).__name__}':", color="RED"
-                )
-                traceback.print_exc()
+            tasks.append((clip_path, output_path))
+
+    finally:
+        if fixture is None:
+            save_app_name_cache(APP_NAME_CACHE_PATH, cache)
+
+    print(f"\nMerging {len(tasks)} clips, {jobs} at once\n")
+
+    with ThreadPoolExecutor(jobs) as executor:
+        results = executor.map(lambda task: process_clip(*task, concat_video), tasks)
+
+        # successful merged clip count
+        success_count = sum(results)
 
     print(
         f"\nAll done - {success_count}/{len(clip_paths)} successful, {skipped_count} skipped"
@@ -463,6 +677,29 @@ if __name__ == "__main__":
         help="Use appid instead of attempting to use app name.",
     )
 
+    _parser.add_argument(
+        "-c",
+        "--concat-temp",
+        action="store_true",
+        help="Concatenate video into temp file instead of streaming it to ffmpeg. Uses twice the disk I/O.",
+    )
+
+    _parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=JOBS,
+        help=f"Number of clips merged concurrently. Defaults to {JOBS}.",
+    )
+
+    _parser.add_argument(
+        "-a",
+        "--app-details",
+        type=pathlib.Path,
+        default=None,
+        help="JSON file of store API responses keyed by AppID, used instead of querying steam. For testing.",
+    )
+
     _args = _parser.parse_args()
 
     ANSI.print(SPLASH_MSG, color="YELLOW")
@@ -470,11 +707,18 @@ if __name__ == "__main__":
     try:
         assert validate_ffmpeg(), "ffmpeg is not installed or not working - check your installation!"
 
+        _fixture = None
+        if _args.app_details is not None:
+            _fixture = json.loads(_args.app_details.read_text("utf8"))
+
         main(
             list(_recursive_recording_fetch_batched_gen(_args.clip_paths)),
             _args.output_dir,
             _args.force_overwrite,
             _args.use_appid,
+            _args.concat_temp,
+            _args.jobs,
+            _fixture,
         )
 
     except Exception:
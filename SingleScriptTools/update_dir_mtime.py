@@ -5,6 +5,12 @@ Three types of strategy is supported. (oldest, median, newest).
 
 By default, median mode will be used, which choose median mtime of all subdir/files.
 
+Tree is walked once bottom-up, folding each subtree into a small summary - so memory stays bounded
+regardless of file count. Median comes from a histogram that halves its resolution when it grows
+beyond `MAX_BINS`, so it's exact to the second for most trees and approximate for huge, widely spread ones.
+
+Pass `-r` to update every nested directory too, instead of only the first level.
+
 Useful when you want to sort by modified date of it's content,
 e.g. when you make builds for each commits but still make some modifications to it's config fire.
 
@@ -27,61 +33,235 @@ import pathlib
 import os
 import datetime as dt
 from argparse import ArgumentParser
-from collections.abc import Iterator
 
 
 ROOT = pathlib.Path(__file__).parent
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
 
+# Upper bound of median histogram size per directory being walked
+MAX_BINS = 4096
+
+# Initial median histogram resolution
+_INITIAL_BIN_WIDTH_NS = 1_000_000_000
+
 
 def _unix_to_date(unix_time: float) -> str:
     """Because this get got darn long"""
     return dt.datetime.fromtimestamp(unix_time, dt.timezone.utc).strftime(DATE_FORMAT)
 
 
-def dir_list_gen(root: pathlib.Path) -> Iterator[tuple[pathlib.Path, float]]:
-    """yields dirs to modify mtime of.
-    
-    Yields:
-        (directory path, directory's current modified time)
+class MtimeSummary:
+    """Mergeable summary of mtimes in a subtree, of bounded size.
+
+    Newest & oldest are tracked directly. For median, mtimes are counted in equal width bins
+    keeping the oldest mtime of each, and bin width doubles whenever bin count exceeds MAX_BINS.
     """
-    
-    for p in root.iterdir():
-        if not p.is_dir():
-            continue
 
-        yield p, p.stat().st_mtime
+    __slots__ = ("count", "newest", "oldest", "width", "bins")
 
+    def __init__(self, track_median: bool):
+        self.count = 0
+        self.newest = 0
+        self.oldest = 0
 
-def main(target_root: pathlib.Path, mode: str, **_kwargs):
-    mode_factor: float = {
-        "new": 1,
-        "median": 0.5,
-        "old": 0,
-    }[mode]
-    
-    for p, p_mtime in dir_list_gen(target_root):
-        
-        mtimes: list[float] = [
-            sub_p.stat().st_mtime for sub_p in p.glob("**/*")
-        ]
-        
-        print(f"{p.relative_to(target_root).as_posix()} - [{len(mtimes)} f/d]")
-        
-        if not mtimes:
-            print(f"└─ Nothing to update, skipping\n")
+        self.width = _INITIAL_BIN_WIDTH_NS
+
+        # bin index: [count, oldest mtime in bin], None when median isn't needed
+        self.bins: dict[int, list[int]] | None = {} if track_median else None
+
+    def add(self, mtime_ns: int):
+        if not self.count:
+            self.newest = self.oldest = mtime_ns
+        else:
+            self.newest = max(self.newest, mtime_ns)
+            self.oldest = min(self.oldest, mtime_ns)
+
+        self.count += 1
+
+        if self.bins is None:
+            return
+
+        entry = self.bins.get(mtime_ns // self.width)
+
+        if entry is None:
+            self.bins[mtime_ns // self.width] = [1, mtime_ns]
+            self._shrink()
+        else:
+            entry[0] += 1
+            entry[1] = min(entry[1], mtime_ns)
+
+    def _coarsen(self, width: int):
+        """Rebins to given width, which should be this summary's width times power of 2"""
+
+        factor = width // self.width
+        rebinned: dict[int, list[int]] = {}
+
+        for key, (count, oldest) in self.bins.items():
+            entry = rebinned.get(key // factor)
+
+            if entry is None:
+                rebinned[key // factor] = [count, oldest]
+            else:
+                entry[0] += count
+                entry[1] = min(entry[1], oldest)
+
+        self.bins = rebinned
+        self.width = width
+
+    def _shrink(self):
+        while len(self.bins) > MAX_BINS:
+            self._coarsen(self.width * 2)
+
+    def merge(self, other: "MtimeSummary"):
+        """Folds other summary into this one"""
+
+        if not other.count:
+            return
+
+        if not self.count:
+            self.newest, self.oldest = other.newest, other.oldest
+        else:
+            self.newest = max(self.newest, other.newest)
+            self.oldest = min(self.oldest, other.oldest)
+
+        self.count += other.count
+
+        if self.bins is None:
+            return
+
+        if other.width > self.width:
+            self._coarsen(other.width)
+
+        factor = self.width // other.width
+
+        for key, (count, oldest) in other.bins.items():
+            entry = self.bins.get(key // factor)
+
+            if entry is None:
+                self.bins[key // factor] = [count, oldest]
+            else:
+                entry[0] += count
+                entry[1] = min(entry[1], oldest)
+
+        self._shrink()
+
+    def median(self) -> int:
+        """mtime at the middle rank, taken as the oldest mtime of bin containing that rank."""
+
+        rank = min(round(self.count * 0.5), self.count - 1)
+        seen = 0
+
+        for key in sorted(self.bins):
+            seen += self.bins[key][0]
+            if seen > rank:
+                return self.bins[key][1]
+
+        return self.newest
+
+    def pick(self, mode: str) -> int:
+        """mtime for given mode - one of `new`, `median`, `old`"""
+
+        if mode == "median":
+            return self.median()
+
+        return self.newest if mode == "new" else self.oldest
+
+
+class _Frame:
+    """Directory being walked, waiting for its subdirectories"""
+
+    __slots__ = ("path", "depth", "stat", "summary", "pending")
+
+    def __init__(self, path: str, depth: int, stat: os.stat_result, summary: MtimeSummary):
+        self.path = path
+        self.depth = depth
+        self.stat = stat
+        self.summary = summary
+        self.pending: list[tuple[str, os.stat_result]] = []
+
+
+def _open_frame(path: str, depth: int, stat: os.stat_result, track_median: bool) -> _Frame:
+    """Lists directory, folding files in right away & queueing subdirectories."""
+
+    frame = _Frame(path, depth, stat, MtimeSummary(track_median))
+
+    try:
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                try:
+                    entry_stat = entry.stat(follow_symlinks=False)
+
+                    if entry.is_dir(follow_symlinks=False):
+                        frame.pending.append((entry.path, entry_stat))
+                    else:
+                        frame.summary.add(entry_stat.st_mtime_ns)
+
+                except OSError:
+                    continue
+
+    except OSError as err:
+        print(f"Can't list {path} - {type(err).__name__} {err}\n")
+
+    # popped from the end, keep listing order
+    frame.pending.reverse()
+    return frame
+
+
+def update_dir(frame: _Frame, target_root: pathlib.Path, mode: str) -> int:
+    """Updates directory's mtime per mode, printing the result.
+
+    Returns:
+        Directory's mtime after update
+    """
+
+    p_mtime = frame.stat.st_mtime_ns
+    summary = frame.summary
+
+    print(f"{pathlib.Path(frame.path).relative_to(target_root).as_posix()} - [{summary.count} f/d]")
+
+    if not summary.count:
+        print(f"└─ Nothing to update, skipping\n")
+        return p_mtime
+
+    new_mtime = summary.pick(mode)
+    symbol = "=="
+
+    if p_mtime != new_mtime:
+        os.utime(frame.path, ns=(frame.stat.st_atime_ns, new_mtime))
+        symbol = "->"
+
+    print(f"└─ {_unix_to_date(p_mtime / 1e9)} {symbol} {_unix_to_date(new_mtime / 1e9)}\n")
+    return new_mtime
+
+
+def main(target_root: pathlib.Path, mode: str, recursive: bool, **_kwargs):
+    track_median = mode == "median"
+
+    # iterative post-order walk - each directory is finalized after all of its subdirectories,
+    # so their updated mtime can be folded into parent right away
+    stack = [_open_frame(os.fspath(target_root), 0, os.stat(target_root), track_median)]
+
+    while stack:
+        frame = stack[-1]
+
+        if frame.pending:
+            path, stat = frame.pending.pop()
+            stack.append(_open_frame(path, frame.depth + 1, stat, track_median))
             continue
-        
-        mtimes.sort()
-        new_mtime = mtimes[round(len(mtimes) * mode_factor)]
-        symbol = "=="
-        
-        if p_mtime != new_mtime:
-            os.utime(p, (p.stat().st_atime, new_mtime))
-            symbol = "->"
-        
-        print(f"└─ {_unix_to_date(p_mtime)} {symbol} {_unix_to_date(new_mtime)}\n")
-        
+
+        stack.pop()
+
+        if not stack:
+            break
+
+        if frame.depth == 1 or recursive:
+            mtime = update_dir(frame, target_root, mode)
+        else:
+            mtime = frame.stat.st_mtime_ns
+
+        parent = stack[-1].summary
+        parent.add(mtime)
+        parent.merge(frame.summary)
 
 
 if __name__ == "__main__":
@@ -104,6 +284,12 @@ if __name__ == "__main__":
             "Should be either one of `n`(newest) `m`(median) `o`(oldest)"
         ),
     )
+    _parser.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="Update every nested directory too, deepest first, instead of only the first level",
+    )
     _args = _parser.parse_args()
     
     main(**_args.__dict__)